@@ -19,9 +19,12 @@ Functionality:
     set to -1 to disable limits, ONLY USED FOR TESTING AND DEBUGGING.
 
 3. Decryption:
-    - Can set 'mem_only' parameter to disable rewriting of the key file during decryption
-    and be saved only to memory, setting this to True allows running decryption function multiple
-    times safely in case of interruption of the script or the program mid-execution.
+    - Can set 'start' and 'end' parameters to decrypt only a range of frames, the Frame Selection sequence gives
+    the positions of those frames in the encrypted video, only these are read and decrypted.
+    - Key files are binary key files (utils/key_format.py) inside a streaming container
+    (utils/text_file_encryption.py), the key material is sealed in chunks while the frames are encrypted and
+    only the chunks that are needed are decrypted, the key file is never rewritten as plaintext.
+    Text key files of older versions are still accepted, the 'mem_only' parameter is kept for compatibility.
 
 4. Exception handling:
     - Exceptions and assertions throughout the script to avoid silent failure and easier debugging.
@@ -32,13 +35,72 @@ Functionality:
     Contains Encryption and Decryption of the key file as well.
 
 6. Careful File Handling:
-    - Added more careful error handling procedures in file manipulation parts of the algorithm in case of
+    - Frames are kept in a single temporary scratch file (utils/frame_scratch.py) instead of per-frame image files,
+    the frame selection shuffle only reorders indices into it and the file is removed even in case of
     interruption mid-execution.
 
+7. Diffusion modes:
+    - New key files record the 'modular-v1' diffusion in their header, every output is the previous output plus pixel
+    plus a keystream byte modulo 256 in integer arithmetic which is exactly reversible.
+    - Text key files without a header were made with the original float diffusion, they are decrypted with the
+    original float anti-diffusion.
+
+8. Keystream modes:
+    - 'sequential' iterates one ILM map for the whole sequence, this is the original generator.
+    - 'segmented' expands the 3D seed into SEGMENT_LANES sub-seeds and advances all lanes as NumPy vectors.
+    The mode is written to the key file header next to the diffusion, key files without it use 'sequential'.
+
+9. Parallel and pipelined video processing:
+    - Frames are read, encrypted/decrypted and written by overlapping stages (utils/frame_pipeline.py),
+    and the 'workers' parameter spreads the frames across processes (utils/frame_executor.py).
+    - Seeds are drawn from a numpy.random.Generator passed as 'rng' (or a seed for one), every frame gets a
+    generator spawned from it in frame order, so a seeded run gives the same key file with any number of workers.
+    The engine has no state of its own and never touches the global NumPy random state, so one instance can be
+    shared by the threads of a thread pool.
+
+10. Frame sources and sinks:
+    - 'filepath' and 'vid_destination' are paths or the sources/sinks of utils/frame_io.py, so videos can also be
+    read from and written to raw BGR24 pipes, ffmpeg, .npy frame stacks or image directories.
+    OpenCV with HuffmanYUV for encryption and mp4v for decryption stays the default.
+
+11. Channels:
+    - 'channels' selects the layout of the encrypted frames, 'grayscale' (or 'auto' for video whose frames are
+    grayscale stored as BGR) encrypts a single plane, so the permutation, diffusion and output are a third
+    of the size. The channel count is written to the key file and decryption returns BGR frames again.
+    - Frames with a single channel (H x W x 1) are encrypted as they are by the frame and stream functions.
+
+12. Region of interest mode:
+    - 'roi' (utils/roi.py) gives rectangles per frame, only these are encrypted (each with its own seeds)
+    and the rest of the frame is passed through, so the cipher work scales with the area of the rectangles.
+    The rotated cipher of a rectangle is rotated back to fit it, so frames keep their size in this mode.
+    The rectangles are written to the key file and decryption restores them in reverse order, so overlapping
+    rectangles are supported. A rectangle with a side that is a perfect square (not allowed by the permutation)
+    is grown by a pixel and the grown rectangle is written to the key file.
+
+13. Tiled mode:
+    - 'tile_size' splits every frame into tiles of at most tile_size x tile_size pixels (utils/tiling.py),
+    each tile is permuted, rotated back and diffused on its own with seeds derived from the seeds of the frame,
+    so the ILM sequences, argsort indices and float copies are sized by the tile and the tiles of a frame are
+    spread across the workers. Tiles never have a perfect square side, frames keep their size in this mode.
+    The key file stores the frame seeds as usual and the tile size in its header, key files without it
+    are decrypted whole.
+
+14. Streaming:
+    - 'encryptStream' and 'decryptStream' take any iterator of H x W x 3 uint8 frames (e.g. a capture loop)
+    and yield the results one at a time with the key record of every frame, no video or key file is involved.
+    Only a few frames are in flight at a time, so memory does not grow with the length of the stream.
+    The Frame Selection shuffle needs every frame of the video and is not applied to streams.
+
+15. Seeds and plans:
+    - 'encryptFrame' takes explicit 'perm_seed'/'diff_seed', and 'createPlan' generates the permutation and the
+    diffusion of a frame size and a pair of seeds once as a CosinePlan. Frames encrypted or decrypted with the
+    plan skip both ILM sequences, e.g. the original and the one-pixel-modified frame of the differential analysis
+    are encrypted under the same key.
+
 Dependencies:
 -------------
 - Numpy for faster vector calculations
-- cv2 for video and image/frame manipulation
+- cv2 for video and image/frame manipulation (through utils/frame_io.py)
 
 Code Author: John Paul M. Beltran, Roel C. Castro
 
@@ -52,18 +114,51 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
 from backend.utils.key_validator import EncryptionMode
-from backend.utils.key_validator import validateKey
+from backend.utils.key_validator import DiffusionMode
+from backend.utils.key_validator import KeystreamMode
+from backend.utils.key_validator import ChannelMode
+from backend.utils.frame_executor import FrameExecutor
+from backend.utils.frame_pipeline import FramePipeline
+from backend.utils.frame_scratch import FrameScratch
+from backend.utils.lane_seeds import deriveLaneSeeds
+from backend.utils.key_format import KeyWriter
+from backend.utils.key_format import KeyReader
+from backend.utils.frame_io import openSource
+from backend.utils.frame_io import openSink
+from backend.utils.frame_io import selectChannels
+from backend.utils.frame_io import singlePlane
+from backend.utils.frame_io import restoreChannels
+from backend.utils.tiling import tileRects
+from backend.utils.tiling import mapTiles
 from pathlib import Path
-import backend.utils.text_file_encryption as tfe
+from functools import partial
 import numpy as np
-import warnings
 import hashlib
 import struct
-import shutil
 import time
 import math
-import cv2
-import os
+
+
+SEGMENT_LANES = 4096
+SEGMENT_WARMUP = 100
+
+
+# Permutation index array and diffusion substitution of one frame size and one pair of seeds,
+# made by Encrypt_cosine.createPlan and reused by every frame encrypted or decrypted with that key
+class CosinePlan:
+    def __init__(self, height, width, perm_seed, diff_seed, keystream, permutation, substitution):
+        self.height = height
+        self.width = width
+        self.perm_seed = perm_seed
+        self.diff_seed = diff_seed
+        self.keystream = keystream
+        self.permutation = permutation
+        self.substitution = substitution
+
+    # Raises an error for frames of another size than the plan
+    def check(self, height, width):
+        if (height, width) != (self.height, self.width):
+            raise ValueError(f"The plan is made for {self.height}x{self.width} frames, got {height}x{width}")
 
 
 class Encrypt_cosine:
@@ -73,52 +168,6 @@ class Encrypt_cosine:
         self.THETA = 38.23  # theta > 37.9
         self.KAPPA = 36.79  # kappa > 35.7
 
-    # Decomposes the frames into folder, raise error in folder existence conflict
-    def _decomposeFrame__(self, filepath, temp_path, preserveColor=False):
-        if not os.path.isdir(temp_path):
-            os.makedirs(temp_path)
-
-            # Path to video file
-            _vidObj = cv2.VideoCapture(filepath)
-
-            # Used as counter variable
-            _count = 0
-
-            # checks whether frames were extracted
-            _success = 1
-
-            if not preserveColor:
-                while _success:
-                    # _vidObj object calls read
-                    # function extract frames
-                    _success, _image = _vidObj.read()
-
-                    if _success:
-                        # Saves the frames with frame-count
-                        cv2.imwrite(f"{temp_path}/frame_%d.jpg" % _count, _image)
-
-                        _count += 1
-
-                    else:
-                        break
-
-            else:
-                while _success:
-                    # _vidObj object calls read
-                    # function extract frames
-                    _success, _image = _vidObj.read()
-
-                    if _success:
-                        # Saves the frames with frame-count
-                        cv2.imwrite(f"{temp_path}/frame_%d.png" % _count, _image, [cv2.IMWRITE_PNG_COMPRESSION, 0])
-
-                        _count += 1
-
-                    else:
-                        break
-        else:
-            raise Exception(f"Conflicting file directory for path: {temp_path} already exists")
-
     # Creates a list of hashes from a list of binaries, returns [str, ..., str]
     def __binaryToHash__(self, binary_array):
         _hashes = []
@@ -128,9 +177,9 @@ class Encrypt_cosine:
             _hashes.append(_sha256.hexdigest())
         return _hashes
 
-    # Generates a starting seed for the chaos map, returns float
-    def __generateSeed__(self, key_length):
-        _secret_key = np.random.random_sample(key_length, )
+    # Generates a starting seed for the chaos map from the numpy.random.Generator 'rng', returns float
+    def __generateSeed__(self, key_length, rng):
+        _secret_key = rng.random(key_length)
         _secret_key_binaries = np.array([struct.pack('>d', num) for num in _secret_key], dtype=object)
         _key_matrix = self.__binaryToHash__(_secret_key_binaries)
         _key_matrix_float = np.array([int(key, 16) for key in _key_matrix])
@@ -149,8 +198,17 @@ class Encrypt_cosine:
 
         return _seed
 
-    # Generates the chaos map sequence, returns [float, .., float]
-    def __generateILMSequence__(self, length, S):
+    # Generates the chaos map sequence with the selected keystream mode, returns [float, .., float]
+    def __generateILMSequence__(self, length, S, mode=KeystreamMode.SEQUENTIAL):
+        if mode == KeystreamMode.SEQUENTIAL:
+            return self.__generateSequentialILMSequence__(length, S)
+        elif mode == KeystreamMode.SEGMENTED:
+            return self.__generateSegmentedILMSequence__(length, S)
+        else:
+            raise ValueError(f"Unknown keystream mode: {mode}")
+
+    # Generates the chaos map sequence by iterating one map, the original generator, returns [float, .., float]
+    def __generateSequentialILMSequence__(self, length, S):
         A1 = self.N * self.OMEGA
         A2 = self.N * self.THETA
         B1 = self.N
@@ -176,182 +234,152 @@ class Encrypt_cosine:
 
         return _ilm_cos
 
-    # Wrapper function for generating both seed and the sequence, returns float, [float, .., float]
-    def __generateSequence__(self, hash_length, block_size):
-        # Generate 3D seed
-        _seed = self.__generateSeed__(hash_length)
+    # Generates the chaos map sequence on SEGMENT_LANES independent lanes advanced together, lane i produces
+    # elements i, i + SEGMENT_LANES, i + 2 * SEGMENT_LANES, ... of the sequence, returns [float, .., float]
+    def __generateSegmentedILMSequence__(self, length, S):
+        A1 = self.N * self.OMEGA
+        A2 = self.N * self.THETA
+        B1 = self.N
+        B2 = self.KAPPA
 
-        # Generate ILM-cosine sequence
-        _cos_ilm_sequence = self.__generateILMSequence__(block_size, _seed)
+        _S = deriveLaneSeeds(struct.pack(">d", S), SEGMENT_LANES)
+        _steps = math.ceil(length / SEGMENT_LANES)
+        _ilm_sequence = np.empty((_steps, SEGMENT_LANES))
 
-        return _seed, _cos_ilm_sequence
+        # discard the transient of every lane, then keep one value per lane and step
+        for i in range(SEGMENT_WARMUP + _steps):
+            ILM0 = (A1 * _S * (1 - _S) + _S) % 1
+            ILM1 = ((A2 * _S) + (_S * 1 / (1 + ILM0 ** 2))) % 1
+            ILM2 = (B1 * (ILM0 + ILM1 + B2) * np.sin(_S)) % 1
 
-    # Permutation/Shuffling of the frame, returns the shuffled numpy array of the image
-    def __permutate__(self, block_size, block_matrix, channel, In_P, In_Q, In_R, In_S, mode='permute'):
-        assert mode == 'permute' or mode == 'antipermute', "Mode must be 'permute' or 'antipermute'"
+            _S = ILM0 + ILM1 + ILM2
+            if i >= SEGMENT_WARMUP:
+                _ilm_sequence[i - SEGMENT_WARMUP] = _S
 
-        # Copy the gray component
-        _scrambled_img = channel.copy()
+        # Calculate cosine of pi times each element in the sequence
+        return np.cos(np.pi * _ilm_sequence.ravel()[:length])
 
-        # Initialize L and M matrices
-        L = np.zeros((block_matrix, block_matrix))
-        M = np.zeros((block_matrix, block_matrix))
+    # Resolves the pixel swaps of the permutation into one index array over the flattened frame,
+    # returns numpy array of int where the pixel at position i of the permuted frame is pixel permutation[i]
+    def __generatePermutation__(self, height, width, block_size, block_matrix, In_P, In_Q, In_R, In_S):
+        # pixels (block_matrix, y) and (x, block_matrix) are part of the swaps, they have to exist in the frame
+        if block_matrix >= height or block_matrix >= width:
+            raise ValueError(f"Frame size {height}x{width} is not supported, {block_matrix} must be smaller "
+                             f"than both sides of the frame")
 
-        In_Q.tolist()
-        In_S.tolist()
+        _x = np.arange(1, block_matrix + 1).reshape(-1, 1)
+        _y = np.arange(block_matrix)
 
-        for y in range(1, block_matrix + 1):
-            for x in range(1, block_matrix + 1):
-                C = (x + In_Q[y - 1] - 1) % (block_matrix + 1)
-                D = (x + In_S[y - 1] - 1) % (block_matrix + 1)
+        # L and M matrices, L[x - 1, y - 1] = In_P[C - 1] with C = (x + In_Q[y - 1] - 1) % (block_matrix + 1),
+        # C - 1 = -1 selects the last element the same way as the scalar formula
+        L = In_P[(_x + In_Q - 1) % (block_matrix + 1) - 1]
+        M = In_R[(_x + In_S - 1) % (block_matrix + 1) - 1]
 
-                L[x - 1, y - 1] = In_P[C - 1]
-                M[x - 1, y - 1] = In_R[D - 1]
+        # swap targets of every (x, y) in the order the swaps are done, x first then y
+        I = L
+        J = M[I - 1, _y]
 
-        if mode == 'permute':
-            for x in range(1, block_matrix + 1):
-                for y in range(1, block_matrix + 1):
-                    I = int(L[x - 1, y - 1])
-                    J = int(M[I - 1, y - 1])
+        R = ((I - 1) // block_size) * block_size + (J - 1) // block_size + 1
+        C = ((I - 1) % block_size) * block_size + (J - 1) % block_size + 1
+        R[R < 0] += height  # a negative row counts from the bottom of the frame
 
-                    C1 = (I - 1) // block_size
-                    D1 = (I - 1) % block_size
+        _sources = (_x * width + _y + 1).ravel().tolist()
+        _targets = (R * width + C).ravel().tolist()
 
-                    C2 = (J - 1) // block_size + 1
-                    D2 = (J - 1) % block_size + 1
+        # the swaps overlap, so they are applied one after another to the positions instead of the pixels
+        _permutation = list(range(height * width))
+        for _source, _target in zip(_sources, _targets):
+            _permutation[_source], _permutation[_target] = _permutation[_target], _permutation[_source]
 
-                    R = C1 * block_size + C2
-                    C = D1 * block_size + D2
+        return np.array(_permutation, dtype=np.intp)
 
-                    # Swap pixels (x, y) and (r, c)
-                    _temp = _scrambled_img[R, C].copy()  # Store (r, c) pixel temporarily
-                    _scrambled_img[R, C] = _scrambled_img[x, y]  # Move (x, y) to (r, c)
-                    _scrambled_img[x, y] = _temp  # Put the old (r, c) pixel into (x, y)
-        else:
-            for x in range(block_matrix, 0, -1):
-                for y in range(block_matrix, 0, -1):
-                    I = int(L[x - 1, y - 1])
-                    J = int(M[I - 1, y - 1])
+    # Permutation/Shuffling of all channels of the frame at once, 'antipermute' undoes the swaps in reverse
+    # order which is the inverse permutation, returns the shuffled numpy array of the image
+    def __permutate__(self, frame, permutation, mode='permute'):
+        assert mode == 'permute' or mode == 'antipermute', "Mode must be 'permute' or 'antipermute'"
 
-                    C1 = (I - 1) // block_size
-                    D1 = (I - 1) % block_size
+        if mode == 'antipermute':
+            _inverse = np.empty_like(permutation)
+            _inverse[permutation] = np.arange(permutation.size, dtype=permutation.dtype)
+            permutation = _inverse
 
-                    C2 = (J - 1) // block_size + 1
-                    D2 = (J - 1) % block_size + 1
+        _height, _width = frame.shape[:2]
+        _pixels = frame.reshape(_height * _width, -1)
 
-                    R = C1 * block_size + C2
-                    C = D1 * block_size + D2
+        return _pixels[permutation].reshape(frame.shape)
 
-                    # Swap pixels (x, y) and (r, c)
-                    _temp = _scrambled_img[R, C].copy()  # Store (r, c) pixel temporarily
-                    _scrambled_img[R, C] = _scrambled_img[x, y]  # Move (x, y) to (r, c)
-                    _scrambled_img[x, y] = _temp  # Put the old (r, c) pixel into (x, y)
+    # Generates the substitution order of the diffusion and its keystream 2^32 * A, both in the order the pixels
+    # are substituted, returns (numpy array of int, numpy array of float)
+    def __generateSubstitution__(self, seq_2d, height, width, verbose=False):
+        _A = np.rot90(seq_2d, k=-1)  # rotate clockwise
+        _In_A = np.argsort(_A.flatten())  # Get index sequence of A
+        _B = np.rot90(_In_A.reshape(width, height), k=-1).flatten()  # rotate clockwise
+        if verbose: print("\tGenerated Substitution Sequence")
 
-        return _scrambled_img
+        return _B, 2 ** 32 * _A.flatten().astype('float64')[_B]
 
-    # Diffusion of the frame, returns the diffused numpy array of the image
-    def __diffuse__(self, seq_2d, channel, mode='diffuse'):
+    # Diffusion of all channels of the frame along one substitution order, 'substitution' is the result of
+    # __generateSubstitution__, returns the diffused numpy array of the image
+    def __diffuse__(self, substitution, frame, mode='diffuse', diffusion=DiffusionMode.MODULAR):
         assert mode in ['diffuse', 'antidiffuse'], "Mode must be 'diffuse' or 'antidiffuse'"
 
-        _m, _n = channel.shape
+        _m, _n = frame.shape[:2]
         _mod = 256  # modulo for 8-bit grayscale image
 
-        _A = np.rot90(seq_2d, k=-1)  # rotate clockwise
-        _In_A = np.argsort(_A.flatten())  # Get index sequence of A
-        _B = np.rot90(_In_A.reshape(_n, _m), k=-1)  # rotate clockwise
-        print("Generated Substitution Sequence")
-
-        _diffused_img = np.zeros_like(channel)
-
-        # flatten the required arrays and cast to float64 to avoid overflow
-        _A_flat = _A.flatten().astype('float64')
-        _ch_flat = channel.flatten().astype('float64')
-        _diff_flat = _diffused_img.flatten().astype('float64')
-
-        if mode == 'diffuse':
-            for _row in range(_m):
-                for _col in range(_n):
-                    _i = _row * _n + _col
-                    if _i == 0:
-                        _diff_flat[_B[_row, _col]] = (_ch_flat[_B[_row, _col]] +
-                                                      _ch_flat[_B[_m - 1, _n - 1]] +
-                                                    2 ** 32 * _A_flat[_B[_row, _col]]) % _mod
-                    elif _col == 0:
-                        _prev_row, _prev_col = divmod(_i - 1, _n)
-                        _diff_flat[_B[_row, _col]] = (_ch_flat[_B[_row, _col]] +
-                                                    _diff_flat[_B[_row - 1, _prev_col]] +
-                                                    2 ** 32 * _A_flat[_B[_row, _col]]) % _mod
-                    else:
-                        _diff_flat[_B[_row, _col]] = (_ch_flat[_B[_row, _col]] +
-                                                    _diff_flat[_B[_row, _col - 1]] +
-                                                    2 ** 32 * _A_flat[_B[_row, _col]]) % _mod
-        else: 
-            for _r in range(_m):
-                for _c in range(_n):
-                    if _c == 0:
-                        _prev_c = _n - 1
-                        _prev_r = _r - 1 if _r > 0 else _m - 1
-                    else:
-                        _prev_c = _c - 1
-                        _prev_r = _r
-
-                    # Perform antidiffusion
-                    _diff_flat[_B[_r, _c]] = (_mod + _ch_flat[_B[_r, _c]] - 
-                                            _ch_flat[_B[_prev_r, _prev_c]] - 
-                                            2**32 * _A_flat[_B[_r, _c]]) % _mod
-                    
-            _c = 0
-            for _r in range(1, _n):
-                _diff_flat[_B[_r, _c]] = (_mod + _ch_flat[_B[_r, _c]] - 
-                                        _ch_flat[_B[_r - 1, _n - 1]] - 
-                                        2**32 * _A_flat[_B[_r, _c]]) % _mod
-
-        _final_diffuse = _diff_flat.reshape(_m, _n).astype('uint8')
-
-        return _final_diffuse
-
-    # Generate a random numpy array containing 0 to num_frames-1, returns [int, ..., int]
-    def __generateFrameSequence__(self, num_frames):
-        return np.random.permutation(num_frames).tolist()
+        _B, _keystream = substitution
+        _keystream = _keystream.reshape(-1, 1)  # shared by every channel
 
-    # Encrypts the key file
-    def __encryptKey__(self, hash_filepath, password):
-        tfe.encryptFile(hash_filepath, password)
+        # pixels in substitution order, the pixel before the first one is the last one
+        _pixels = frame.reshape(_m * _n, -1)[_B]
 
-    # Decrypts the key file, returns either ([str, ..., str],  [int, ..., int]), or (None, None)
-    def __decryptKey__(self, hash_filepath, password, mem_only):
-        _decrypted = tfe.decryptFile(hash_filepath, password, mem_only=mem_only)
+        if diffusion == DiffusionMode.LEGACY:
+            # the original float diffusion can only be reversed, the operations are kept in the same order so old
+            # key files decrypt to the same frames as before
+            assert mode == 'antidiffuse', "Legacy diffusion is only supported for decryption"
 
-        if mem_only:
-            _key_list = _decrypted.splitlines()
+            _cipher = _pixels.astype('float64')
+            _plain = (_mod + _cipher - np.roll(_cipher, 1, axis=0) - _keystream) % _mod
+            _substituted = _plain.astype('uint8')
 
-            self.__validateKeyCompatibility__(_key_list[0])  # validate first if we are working with compatible key file
+        elif mode == 'diffuse':
+            # each output is the previous output plus pixel plus keystream byte, a prefix sum modulo 256
+            _key_bytes = (np.floor(_keystream) % _mod).astype('uint8')
 
-            _frame_seq = eval(_key_list.pop())
+            _sums = _pixels + _key_bytes
+            _sums[0] += _pixels[-1]
+            _substituted = np.cumsum(_sums, axis=0, dtype='uint8')
 
-            return _key_list, _frame_seq
         else:
-            return None, None
-
-    # Validates if the key is appropriate for the algorithm
-    def __validateKeyCompatibility__(self, key_sample):
-        validateKey(key_sample, mode=EncryptionMode.COSINE_3D)
+            # differences of consecutive outputs, the first pixel needs the already recovered last pixel
+            _key_bytes = (np.floor(_keystream) % _mod).astype('uint8')
 
-        return
+            _substituted = _pixels - np.roll(_pixels, 1, axis=0) - _key_bytes
+            _substituted[0] = _pixels[0] - _substituted[-1] - _key_bytes[0]
 
-    # Frame Encryption, returns numpy array of the frame
-    def encryptFrame(self, frame, verbose=False):
-        _blue, _green, _red = cv2.split(frame)  # cv2 always read in BGR mode
-        if verbose: print("\tSplitted Frame into RGB channels")
+        _diffused_img = np.empty((_m * _n, _pixels.shape[1]), dtype='uint8')
+        _diffused_img[_B] = _substituted
 
-        # Permutation
-        _height, _width, _channels = frame.shape
+        return _diffused_img.reshape(frame.shape)
 
-        _block_size = min(math.floor(math.sqrt(_height)), math.floor(math.sqrt(_width)))
+    # Generate a random numpy array containing 0 to num_frames-1, returns [int, ..., int]
+    def __generateFrameSequence__(self, num_frames, rng):
+        return rng.permutation(num_frames).tolist()
+
+    # Generates the permutation and the diffusion of a height x width frame for the seeds once, the plan encrypts
+    # and decrypts any number of frames of that size with the same key, missing seeds are drawn from 'rng'
+    # (a numpy.random.Generator or a seed for one), returns CosinePlan
+    def createPlan(self, height, width, perm_seed=None, diff_seed=None, keystream=KeystreamMode.SEQUENTIAL,
+                   verbose=False, rng=None):
+        if perm_seed is None or diff_seed is None:
+            _rng = np.random.default_rng(rng)
+            perm_seed = self.__generateSeed__(360, _rng) if perm_seed is None else perm_seed
+            diff_seed = self.__generateSeed__(360, _rng) if diff_seed is None else diff_seed
+
+        _block_size = min(math.floor(math.sqrt(height)), math.floor(math.sqrt(width)))
         _block_matrix = _block_size * _block_size
 
         if verbose: print("\tGenerating ILM-Cosine Sequence")
-        _perm_seed, _cos_ilm_sequence = self.__generateSequence__(360, 4 * _block_matrix)
+        _cos_ilm_sequence = self.__generateILMSequence__(4 * _block_matrix, perm_seed, keystream)
         if verbose: print("\tILM-Cosine Sequence Generated")
 
         P, Q, R, S = np.split(_cos_ilm_sequence, 4)
@@ -362,283 +390,471 @@ class Encrypt_cosine:
         In_R = np.argsort(R)
         In_S = np.argsort(S)
 
+        _permutation = self.__generatePermutation__(height, width, _block_size, _block_matrix, In_P, In_Q, In_R, In_S)
+
+        # the diffusion runs on the frame rotated by 90 degrees, width x height
+        _cos_ilm_sequence = self.__generateILMSequence__(height * width, diff_seed, keystream)
+        _substitution = self.__generateSubstitution__(_cos_ilm_sequence.reshape(height, width), width, height, verbose)
+
+        return CosinePlan(height, width, perm_seed, diff_seed, keystream, _permutation, _substitution)
+
+    # Frame Encryption, returns (numpy array of the frame, perm_seed, diff_seed)
+    # 'rng' is a numpy.random.Generator or a seed for one, None draws fresh entropy for every call,
+    # 'perm_seed'/'diff_seed' encrypt with given seeds instead and 'plan' (createPlan) reuses the generated sequences
+    def encryptFrame(self, frame, verbose=False, keystream=KeystreamMode.SEQUENTIAL, rng=None, perm_seed=None,
+                     diff_seed=None, plan=None):
+        # Permutation, the same pixel swaps apply to every color channel
+        _height, _width, _channels = frame.shape
+
+        if plan is None:
+            plan = self.createPlan(_height, _width, perm_seed, diff_seed, keystream, verbose, rng)
+        plan.check(_height, _width)
+
         if verbose: print("\tRunning Permutation(Scrambling) on all color channels")
-        _blue_scrambled = self.__permutate__(_block_size, _block_matrix, _blue, In_P, In_Q, In_R, In_S)
-        _green_scrambled = self.__permutate__(_block_size, _block_matrix, _green, In_P, In_Q, In_R, In_S)
-        _red_scrambled = self.__permutate__(_block_size, _block_matrix, _red, In_P, In_Q, In_R, In_S)
+        _scrambled = self.__permutate__(frame, plan.permutation)
         if verbose: print("\tAll color channels has been permutated")
 
         # Rotate 90
-        _rot90_blue = np.rot90(_blue_scrambled)
-        _rot90_green = np.rot90(_green_scrambled)
-        _rot90_red = np.rot90(_red_scrambled)
+        _rot90 = np.rot90(_scrambled)
         if verbose: print("\tAll color channels has been rotated 90 degrees anticlockwise")
 
         # Diffusion
-        _diff_seed, _cos_ilm_sequence = self.__generateSequence__(360, _height * _width)
-        _cos_ilm_seq2D = _cos_ilm_sequence.reshape(_height, _width)
-
         if verbose: print("\tRunning Diffusion(Random Order Substitution) on all color channels")
-        _blue_diffuse = self.__diffuse__(_cos_ilm_seq2D, _rot90_blue)
-        _green_diffuse = self.__diffuse__(_cos_ilm_seq2D, _rot90_green)
-        _red_diffuse = self.__diffuse__(_cos_ilm_seq2D, _rot90_red)
+        _merged_img = self.__diffuse__(plan.substitution, _rot90)
         if verbose: print("\tAll color channels has been diffused")
 
-        # Merge all channels for final encrypted frame
-        _merged_img = cv2.merge([_blue_diffuse, _green_diffuse, _red_diffuse])  # merge in BGR mode
-        if verbose: print("\tAll color channels have been merged")
-
-        return _merged_img, _perm_seed, _diff_seed
+        return _merged_img, plan.perm_seed, plan.diff_seed
 
     # Frame Decryption, returns numpy array of the frame
-    def decryptFrame(self, frame, perm_seed, diff_seed, verbose=False):
-        _height, _width, _channels = frame.shape
-        _blue, _green, _red = cv2.split(frame)
-        if verbose: print("Splitted Frame into RGB channels")
+    # 'plan' (createPlan) reuses the generated sequences of the seeds, the seeds and keystream are taken from it
+    def decryptFrame(self, frame, perm_seed, diff_seed, verbose=False, diffusion=DiffusionMode.MODULAR,
+                     keystream=KeystreamMode.SEQUENTIAL, plan=None):
+        # the encrypted frame is rotated, the plan is made for the size of the original frame
+        _width, _height, _channels = frame.shape
+
+        if plan is None:
+            plan = self.createPlan(_height, _width, perm_seed, diff_seed, keystream, verbose)
+        plan.check(_height, _width)
 
         # Anti-Diffusion
         if verbose: print("Running Anti-Substitution(Random Order Substitution) on all color channels")
-        _cos_ilm_sequence = self.__generateILMSequence__(_height * _width, diff_seed)
-        _cos_ilm_seq2D = _cos_ilm_sequence.reshape(_width, _height)
-
-        _blue_antidiffused = self.__diffuse__(_cos_ilm_seq2D, _blue, mode='antidiffuse')
-        _green_antidiffused = self.__diffuse__(_cos_ilm_seq2D, _green, mode='antidiffuse')
-        _red_antidiffused = self.__diffuse__(_cos_ilm_seq2D, _red, mode='antidiffuse')
+        _antidiffused = self.__diffuse__(plan.substitution, frame, mode='antidiffuse', diffusion=diffusion)
         if verbose: print("All color channels has been anti-substituted")
 
         # Rotate 270
-        _rot270_blue = np.rot90(_blue_antidiffused, 3)
-        _rot270_green = np.rot90(_green_antidiffused, 3)
-        _rot270_red = np.rot90(_red_antidiffused, 3)
+        _rot270 = np.rot90(_antidiffused, 3)
         if verbose: print("All color channels has been rotated 270 degrees anticlockwise")
 
-        # since frames are same sizes, sample a channel for new rotated h,w
-        _new_height, _new_width = _rot270_blue.shape
-
-        # Permutate
-        _block_size = min(math.floor(math.sqrt(_new_height)), math.floor(math.sqrt(_new_width)))
-        _block_matrix = _block_size * _block_size
-
-        if verbose: print("Generating ILM-Cosine Sequence")
-        _cos_ilm_sequence = self.__generateILMSequence__(4 * _block_matrix, perm_seed)
-        if verbose: print("ILM-Cosine Sequence Generated")
-
-        P, Q, R, S = np.split(_cos_ilm_sequence, 4)
-
-        # Sort enumerated matrix and return index 0
-        In_P = np.argsort(P)
-        In_Q = np.argsort(Q)
-        In_R = np.argsort(R)
-        In_S = np.argsort(S)
-
         if verbose: print("Running De-Permutation on all color channels")
-        _blue_scrambled = self.__permutate__(_block_size, _block_matrix, _rot270_blue,
-                                             In_P, In_Q, In_R, In_S,
-                                             mode='antipermute')
-        _green_scrambled = self.__permutate__(_block_size, _block_matrix, _rot270_green,
-                                              In_P, In_Q, In_R, In_S,
-                                              mode='antipermute')
-        _red_scrambled = self.__permutate__(_block_size, _block_matrix, _rot270_red,
-                                            In_P, In_Q, In_R, In_S,
-                                            mode='antipermute')
+        _merged_img = self.__permutate__(_rot270, plan.permutation, mode='antipermute')
         if verbose: print("All color channels has been de-permutated")
 
-        # Merge all channels for final decrypted frame
-        _merged_img = cv2.merge([_blue_scrambled, _green_scrambled, _red_scrambled])  # merge in BGR mode
-        if verbose: print("All color channels have been merged")
-
         return _merged_img
 
-    # Encrypts the video, outputs a .avi file encoded in HuffmanYUV, returns [int, int, int, ..., int]
-    def encryptVideo(self, filepath, vid_destination, key_destination, password, verbose=False, frame_limit=-1):
-        _fpath = Path(filepath)
-        _vid_dest = Path(vid_destination)
+    # The block matrix of the permutation must be smaller than both sides, so a rectangle with a side that is
+    # a perfect square is grown by a pixel (towards the frame border if needed), returns (x, y, width, height)
+    def __fitRegion__(self, x, y, w, h, height, width):
+        while math.isqrt(min(w, h)) ** 2 == min(w, h):
+            if w <= h and w < width:
+                x, w = (x, w + 1) if x + w < width else (x - 1, w + 1)
+            elif h < height:
+                y, h = (y, h + 1) if y + h < height else (y - 1, h + 1)
+            else:
+                break
+
+        return x, y, w, h
+
+    # Encrypts the rectangles (x, y, width, height) of the frame in order and passes the rest of the frame through,
+    # the rotated cipher of every rectangle is rotated back so it fits its rectangle, slots with a size of 0
+    # are skipped, returns (numpy array of the frame, numpy array (slots, 4) of the encrypted rectangles,
+    # numpy array (slots, 2) of (perm_seed, diff_seed))
+    def encryptRegions(self, frame, rects, verbose=False, keystream=KeystreamMode.SEQUENTIAL, rng=None):
+        _rng = np.random.default_rng(rng)
+        _encrypted = frame.copy()
+        _rects = np.array(rects, dtype=np.int64).reshape(-1, 4)
+        _seeds = np.zeros((len(_rects), 2), dtype=np.float64)
+
+        for i, (_x, _y, _w, _h) in enumerate(_rects.tolist()):
+            if _w == 0 or _h == 0:
+                continue
+
+            _x, _y, _w, _h = _rects[i] = self.__fitRegion__(_x, _y, _w, _h, frame.shape[0], frame.shape[1])
+
+            if verbose: print(f"\tEncrypting Region {i} ({_x}, {_y}, {_w}x{_h})")
+            _region, _perm_seed, _diff_seed = self.encryptFrame(_encrypted[_y:_y + _h, _x:_x + _w], verbose, keystream,
+                                                                _rng)
+            _encrypted[_y:_y + _h, _x:_x + _w] = np.rot90(_region, 3)
+            _seeds[i] = (_perm_seed, _diff_seed)
+
+        return _encrypted, _rects, _seeds
+
+    # Decrypts the rectangles of the frame in reverse order so overlapping rectangles are restored,
+    # returns numpy array of the frame
+    def decryptRegions(self, frame, rects, seeds, verbose=False, diffusion=DiffusionMode.MODULAR,
+                       keystream=KeystreamMode.SEQUENTIAL):
+        _decrypted = frame.copy()
+        _regions = list(enumerate(zip(np.asarray(rects, dtype=np.int64).tolist(), np.asarray(seeds).tolist())))
+
+        for i, ((_x, _y, _w, _h), (_perm_seed, _diff_seed)) in reversed(_regions):
+            if _w == 0 or _h == 0:
+                continue
+
+            if verbose: print(f"\tDecrypting Region {i} ({_x}, {_y}, {_w}x{_h})")
+            _decrypted[_y:_y + _h, _x:_x + _w] = self.decryptFrame(
+                np.rot90(_decrypted[_y:_y + _h, _x:_x + _w]), _perm_seed, _diff_seed, verbose, diffusion, keystream
+            )
+
+        return _decrypted
+
+    # Derives the (perm_seed, diff_seed) of every tile from the seeds of the frame, returns numpy array (count, 2)
+    def __tileSeeds__(self, perm_seed, diff_seed, count):
+        return deriveLaneSeeds(struct.pack(">dd", perm_seed, diff_seed), 2 * count).reshape(count, 2)
+
+    # Pairs the tiles of every frame with their seeds for mapTiles, 'items' yields frames (encryption, the seeds
+    # of the frame are drawn here from 'rng') or (frame, perm_seed, diff_seed) (decryption),
+    # yields (frame, rects, tile seeds, (perm_seed, diff_seed))
+    def __tileItems__(self, items, tile_size, rng=None):
+        _rng = np.random.default_rng(rng)
+
+        for _item in items:
+            if isinstance(_item, tuple):
+                _frame, _perm_seed, _diff_seed = _item
+            else:
+                _frame = _item
+                _perm_seed, _diff_seed = self.__generateSeed__(360, _rng), self.__generateSeed__(360, _rng)
+
+            _rects = tileRects(_frame.shape[0], _frame.shape[1], tile_size, square_free=True)
+            _seeds = self.__tileSeeds__(_perm_seed, _diff_seed, len(_rects)).tolist()
+
+            yield _frame, _rects, _seeds, (_perm_seed, _diff_seed)
+
+    # Tiled Frame Encryption, every tile is encrypted with seeds derived from the seeds of the frame and
+    # rotated back to fit the tile, returns (numpy array of the frame, perm_seed, diff_seed)
+    def encryptTiles(self, frame, tile_size, verbose=False, keystream=KeystreamMode.SEQUENTIAL, rng=None):
+        _job = partial(_encryptTileJob, verbose=verbose, keystream=keystream)
+        _encrypted, (_perm_seed, _diff_seed) = next(mapTiles(FrameExecutor(1), _job,
+                                                             self.__tileItems__([frame], tile_size, rng)))
+
+        return _encrypted, _perm_seed, _diff_seed
+
+    # Tiled Frame Decryption, returns numpy array of the frame
+    def decryptTiles(self, frame, perm_seed, diff_seed, tile_size, verbose=False, diffusion=DiffusionMode.MODULAR,
+                     keystream=KeystreamMode.SEQUENTIAL):
+        _job = partial(_decryptTileJob, verbose=verbose, diffusion=diffusion, keystream=keystream)
+        _decrypted, _seeds = next(mapTiles(FrameExecutor(1), _job,
+                                           self.__tileItems__([(frame, perm_seed, diff_seed)], tile_size)))
+
+        return _decrypted
+
+    # Encrypts an iterator of frames, yields (encrypted frame, key record) in frame order, the key record is
+    # (perm_seed, diff_seed) as written by KeyWriter.writeRecord
+    # The Frame Selection shuffle needs the whole video, streamed frames stay in their original order
+    # Every frame gets a generator spawned from 'rng', a seeded 'rng' gives the same seeds with any number of workers
+    def encryptStream(self, frames, keystream=KeystreamMode.SEQUENTIAL, workers=1, rng=None):
+        _executor = FrameExecutor(workers)
+        _job = partial(_encryptFrameJob, keystream=keystream)
+        _items = zip(frames, __spawnGenerators__(np.random.default_rng(rng)))
+
+        for _merged_img, _perm_seed, _diff_seed in _executor.map(_job, _items):
+            yield _merged_img, (_perm_seed, _diff_seed)
+
+    # Decrypts an iterator of frames with the key record (perm_seed, diff_seed) of every frame,
+    # yields the decrypted frames in frame order
+    def decryptStream(self, frames, records, diffusion=DiffusionMode.MODULAR, keystream=KeystreamMode.SEQUENTIAL,
+                      workers=1):
+        _executor = FrameExecutor(workers)
+        _job = partial(_decryptFrameJob, diffusion=diffusion, keystream=keystream)
+        _items = ((_frame, *np.asarray(_record, dtype=np.float64).tolist()) for _frame, _record in zip(frames, records))
+
+        yield from _executor.map(_job, _items)
+
+    # Yields the frames of the capture in order, stops after 'frame_limit' frames unless it is -1
+    def __readFrames__(self, cap, frame_limit=-1):
+        _count = 0
+        while frame_limit < 0 or _count < frame_limit:
+            _success, _frame = cap.read()
+            if not _success:
+                break
+
+            _count += 1
+            yield _frame
+
+    # Yields (position, frame) for the ascending frame positions, seeks only where the positions are not consecutive
+    def __readFramesAt__(self, cap, positions):
+        _next = 0
+        for _position in positions:
+            if _position != _next:
+                cap.seek(_position)
+
+            _success, _frame = cap.read()
+            if not _success:
+                break
+
+            _next = _position + 1
+            yield _position, _frame
+
+    # Encrypts the video, outputs a .avi file encoded in HuffmanYUV (or any sink of utils/frame_io.py), returns [int, int, int, ..., int]
+    def encryptVideo(self, filepath, vid_destination, key_destination, password, verbose=False, frame_limit=-1,
+                     keystream=KeystreamMode.SEQUENTIAL, workers=1, channels=ChannelMode.COLOR, roi=None,
+                     tile_size=0, rng=None):
         _key_dest = Path(key_destination)
-        _key_file = open(_key_dest.absolute(), "w")
 
         # Record per frame runtime here
         _per_frame_runtime = []
 
-        # Prepare the video writer
-        _cap = cv2.VideoCapture(str(_fpath.resolve()), cv2.CAP_FFMPEG)
-
-        _frame_width = int(_cap.get(3))
-        _frame_height = int(_cap.get(4))
-
-        _result = cv2.VideoWriter(
-            str(_vid_dest.absolute()),
-            cv2.VideoWriter_fourcc(*"HFYU"),
-            _cap.get(cv2.CAP_PROP_FPS),
-            (_frame_height, _frame_width),  # we use height, width as the final encryption is rotated 90 degrees
-        )
-
-        # Extract frames
-        _temp_path = os.path.join(os.path.dirname(filepath),
-                                  'frameGen_temp')  # make temp folder in the same path as the video
+        # frames are read from and written to the backends of utils/frame_io.py, OpenCV unless told otherwise
+        _cap = openSource(filepath)
+        _result = None
+
+        # the source and the sink are released even when the encryption fails
+        try:
+            _frame_width = _cap.width
+            _frame_height = _cap.height
+
+            # grayscale video is encrypted as a single plane, HuffmanYUV is not lossless for gray so FFV1 is used
+            _channels, _frames = selectChannels(self.__readFrames__(_cap, frame_limit), channels)
+            if verbose: print(f"Encrypting {_channels} channel(s) per frame")
+
+            # seeds are sealed in chunks of the key file as frames finish, the key file is sealed with the frame count
+            # once the frames are done, a failed run leaves it incomplete
+            with KeyWriter(_key_dest.absolute(), password, EncryptionMode.COSINE_3D, _frame_width, _frame_height,
+                           keystream=keystream, diffusion=DiffusionMode.MODULAR, channels=_channels,
+                           roi_slots=roi.slots if roi is not None else 0, tile_size=tile_size) as _key_file:
+
+                # the sink takes the size of the first frame, height and width are swapped by the 90 degree rotation
+                _result = openSink(vid_destination, fps=_cap.fps, fourcc="HFYU" if _channels == 3 else "FFV1",
+                                   algorithm=EncryptionMode.COSINE_3D)
+
+                # encrypted frames are appended to one scratch file next to the video, frame n is stored at index n
+                _scratch = FrameScratch(_cap.directory)
+                if verbose: print(f"Storing encrypted frames in a scratch file in {_cap.directory or 'the temp folder'}")
+
+                # frames are fanned out to the workers and come back in order, every frame gets its own generator spawned
+                # from 'rng', so the seeds do not depend on the worker that encrypts the frame
+                _rng = np.random.default_rng(rng)
+                _executor = FrameExecutor(workers)
+                _items = zip(_frames, __spawnGenerators__(_rng))
+                _job = partial(_encryptFrameJob, verbose=verbose and _executor.workers == 1, keystream=keystream)
+
+                # in region of interest mode only the rectangles of every frame are encrypted, seeds per rectangle
+                if roi is not None:
+                    _items = ((_frame, roi.rects(_index, _frame_width, _frame_height), _frame_rng)
+                              for _index, (_frame, _frame_rng) in enumerate(_items))
+                    _job = partial(_encryptRegionsJob, verbose=verbose and _executor.workers == 1, keystream=keystream)
+                    if verbose: print(f"Encrypting up to {roi.slots} region(s) of interest per frame")
+                _compute = partial(_executor.map, _job)
+
+                # in tiled mode the tiles of the frames are fanned out to the workers instead of whole frames,
+                # the seeds of every frame are drawn here and the seeds of its tiles derived from them
+                if tile_size:
+                    _job = partial(_encryptTileJob, verbose=verbose and _executor.workers == 1, keystream=keystream)
+                    _items = _frames
+                    _compute = lambda _items: ((_merged_img, *_seeds) for _merged_img, _seeds in
+                                               mapTiles(_executor, _job, self.__tileItems__(_items, tile_size, _rng)))
+                    if verbose: print(f"Encrypting tiles of up to {tile_size}x{tile_size} pixels")
+                if verbose: print(f"Encrypting with {_executor.workers} worker(s)")
+
+                _last_time = time.time()
+
+                def _writeFrame(count, _encrypted):
+                    nonlocal _last_time
+                    _merged_img, *_record = _encrypted  # (perm_seed, diff_seed), or (rects, seeds) for region keys
+                    if verbose: print(f"[Frame {count}] Encrypted")
+
+                    _scratch.append(_merged_img)
+
+                    # Save the permutation and diffusion seeds
+                    _key_file.writeRecord(tuple(_record))
+
+                    # time between two finished frames, with several workers the runtimes still add up to the wall time
+                    _stop = time.time()
+                    _duration = _stop - _last_time
+                    _per_frame_runtime.append(_duration)
+                    _last_time = _stop
+
+                # reading, encryption and writing of the frames run as overlapping stages
+                try:
+                    _pipeline = FramePipeline()
+                    _pipeline.run(_items, _compute, _writeFrame)
+                    if verbose: print(_pipeline.summary())
+
+                    # Generate Frame Selection sequence
+                    _frame_sequence = self.__generateFrameSequence__(len(_scratch), _rng)
+                    if verbose: print("Frame Sequence has been generated")
+
+                    # Write to video writer with Frame Selection sequence
+                    if verbose: print("Writing encrypted frames to Video according to Frame Sequence")
+                    for frame_no in _frame_sequence:
+                        _result.write(_scratch[frame_no])
+                finally:
+                    _scratch.close()
+
+                # Once Done, write the sequence into the key file
+                _key_file.writeFrameSequence(_frame_sequence)
+        finally:
+            _cap.release()
+            if _result is not None:
+                _result.release()
 
-        if verbose: print(f"Extracting and Dumping Frames to {_temp_path} as .jpg")
-        self._decomposeFrame__(filepath, _temp_path)
-        if verbose: print(f"All frames has been Extracted")
-
-        # Get a sorted list of all the frame filenames in the folder
-        _frame_filenames = sorted([f for f in os.listdir(_temp_path) if f.endswith('.jpg')])
-        _sorted_frames = sorted(_frame_filenames, key=lambda x: int(x.split('_')[1].split('.')[0]))
-
-        _temp_encryption_path = os.path.join(_temp_path, 'encryption_temp')
-        os.makedirs(_temp_encryption_path)
-        for count, curr_frame in enumerate(_sorted_frames[:frame_limit if frame_limit > -1 else None]):
-            _start = time.time()
-
-            _frame_name = os.path.join(_temp_path, curr_frame)
-
-            _frame = cv2.imread(_frame_name)
-
-            if verbose: print(f"[Frame {count}] Encrypting {curr_frame}")
-            _merged_img, _perm_seed, _diff_seed = self.encryptFrame(_frame, verbose)
-            if verbose: print(f"[Frame {count}] Frame Encrypted")
-
-            # Save encrypted image to another temp path
-            if verbose: print(f"[Frame {count}] Saving Encrypted Frame to {_temp_encryption_path}")
-            _no_extension = os.path.splitext(curr_frame)[0]
-            cv2.imwrite(f"{_temp_encryption_path}/{_no_extension}.png", _merged_img, [cv2.IMWRITE_PNG_COMPRESSION, 0])
-            if verbose: print(f"[Frame {count}] Encrypted Frame has been saved")
-
-            # Save the permutation and diffusion seeds
-            _key_file.write(str(_perm_seed) + "\n")
-            _key_file.write(str(_diff_seed) + "\n")
-
-            _stop = time.time()
-            _duration = _stop - _start
-            _per_frame_runtime.append(_duration)
-
-        # Generate Frame Selection sequence
-        _all_encrypted_frames = [f for f in os.listdir(_temp_encryption_path) if f.endswith('.png')]
-        _frame_sequence = self.__generateFrameSequence__(len(_all_encrypted_frames))
-        if verbose: print("Frame Sequence has been generated")
-
-        # Write to video writer with Frame Selection sequence
-        if verbose: print("Writing encrypted frames to Video according to Frame Sequence")
-        for frame_no in _frame_sequence:
-            _result.write(cv2.imread(f"{_temp_encryption_path}/frame_{frame_no}.png"))
-
-        # Once Done, write the sequence into the key file
-        _key_file.write(str(_frame_sequence))
-
-        _cap.release()
         if verbose: print("Video Writing Done and Video has been encrypted")
-        _key_file.close()
-        self.__encryptKey__(_key_dest.resolve(), password)
-
-        if os.path.isdir(_temp_path):
-            shutil.rmtree(_temp_path)  # delete the temp_path and its contents
-        else:
-            _text_warn = f"{_temp_path} could not be found: Path could be either moved or deleted, please make sure it " \
-                         f"is completely gone from your files"
-            warnings.warn(_text_warn, Warning)
 
         return _per_frame_runtime
 
-    # Encrypts the video, outputs a .mp4 file encoded in mp4v, returns [int, int, int, ..., int]
-    def decryptVideo(self, filepath, vid_destination, key_filepath, password, verbose=False, mem_only=True):
-        _fpath = Path(filepath)
-        _vid_dest = Path(vid_destination)
+    # Decrypts the video, outputs a .mp4 file encoded in mp4v (or any sink of utils/frame_io.py), returns [int, int, int, ..., int]
+    def decryptVideo(self, filepath, vid_destination, key_filepath, password, verbose=False, mem_only=True,
+                     workers=1, start=0, end=None):
         _key = Path(key_filepath)
 
         # Record per frame runtime here
         _per_frame_runtime = []
 
-        _keys, _frame_sequence = self.__decryptKey__(_key.resolve(), password, mem_only=mem_only)
-
-        if mem_only:
-            _lines = _keys
-            _frame_select_seq = _frame_sequence
-        else:
-            _key_file = open(_key.resolve(), "r")
-            _lines = _key_file.readlines()
-
-            # Get the Frame Selection sequence in the last line of the key file
-            _frame_sequence = _lines[-1]
+        # the key file is validated from its header, the seeds and the Frame Selection sequence are read at once
+        _key_file = KeyReader(_key.resolve(), password, EncryptionMode.COSINE_3D)
+        _diffusion = _key_file.diffusion
+        _keystream = _key_file.keystream
+        _channels = _key_file.channels
+        if verbose: print(f"Key file uses the {_diffusion.value} diffusion and the {_keystream.value} keystream")
+
+        # only the frames 'start' to 'end' (exclusive) of the original video are decrypted
+        _frame_select_seq = _key_file.frameSequence()
+        _start, _end = _key_file.clip(start, end)
+        _seeds = _key_file.records(_start, _end)
+        if verbose: print(f"Decrypting frames {_start} to {_end} of {len(_frame_select_seq)}")
+
+        # position n of the encrypted video holds frame _frame_select_seq[n], the inverse gives the positions of
+        # the requested frames, they are read in the order they are stored
+        _positions = np.sort(np.argsort(_frame_select_seq)[_start:_end])
+
+        # Prepare the video writer, the sink takes the size of the first frame as the decryption rotates it back
+        _cap = openSource(filepath)
+        _result = None
+        _scratch = None
+
+        # the source, the sink and the scratch file are released even when the decryption fails
+        try:
+            _key_file.checkFrameSize(_cap.width, _cap.height)
+            _result = openSink(vid_destination, fps=_cap.fps, fourcc="mp4v")
+
+            # every frame is put at its original index of one scratch file so they can be decrypted in order
+            _scratch = FrameScratch(_cap.directory)
+            if verbose: print(f"Rearranging frames in a scratch file in {_cap.directory or 'the temp folder'}")
+            _read = 0
+            for _position, _frame in self.__readFramesAt__(_cap, _positions.tolist()):
+                _scratch.put(_frame_select_seq[_position] - _start, _frame if _channels == 3 else singlePlane(_frame))
+                _read += 1
+
+            if _read < len(_positions):
+                raise ValueError(f"The video is missing frames the key file describes, frame {_positions[_read]} "
+                                 f"could not be read")
+            if verbose: print(f"All frames has been rearranged")
+
+            # pair every frame with its seeds, record n of the key file belongs to frame n
+            # region of interest keys hold the rectangles and the seeds of each of them
+            def _frameItems():
+                for inx in range(len(_scratch)):
+                    if verbose: print(f"[Frame {inx}]: Decrypting")
+                    if _key_file.roi_slots:
+                        yield _scratch[inx], _seeds[inx]["rects"], _seeds[inx]["keys"]
+                        continue
+
+                    _perm_seed, _diff_seed = _seeds[inx].tolist()
+                    yield _scratch[inx], _perm_seed, _diff_seed
+
+            _executor = FrameExecutor(workers)
+            if verbose: print(f"Decrypting with {_executor.workers} worker(s)")
+
+            _last_time = time.time()
+
+            def _writeFrame(inx, _merged_img):
+                nonlocal _last_time
+                if verbose: print(f"[Frame {inx}]: Frame Decrypted")
+
+                if verbose: print(f"[Frame {inx}]: Writing Decrypted frame to video")
+                _result.write(_merged_img if _channels == 3 else restoreChannels(_merged_img))
+                if verbose: print(f"[Frame {inx}]: Writing Done")
+
+                # time between two finished frames, with several workers the runtimes still add up to the wall time
+                stop = time.time()
+                duration = stop - _last_time
+                _per_frame_runtime.append(duration)
+                _last_time = stop
+
+            # reading, decryption and writing of the frames run as overlapping stages
+            _pipeline = FramePipeline()
+            _job = partial(_decryptRegionsJob if _key_file.roi_slots else _decryptFrameJob,
+                           verbose=verbose and _executor.workers == 1, diffusion=_diffusion, keystream=_keystream)
+            _compute = partial(_executor.map, _job)
+
+            # tiled keys decrypt the tiles of the frames with the seeds derived from the frame seeds
+            if _key_file.tile_size:
+                _job = partial(_decryptTileJob, verbose=verbose and _executor.workers == 1, diffusion=_diffusion,
+                               keystream=_keystream)
+                _compute = lambda _items: (_merged_img for _merged_img, _seeds in
+                                           mapTiles(_executor, _job, self.__tileItems__(_items, _key_file.tile_size)))
+                if verbose: print(f"Decrypting tiles of up to {_key_file.tile_size}x{_key_file.tile_size} pixels")
+
+            _pipeline.run(_frameItems(), _compute, _writeFrame)
+            if verbose: print(_pipeline.summary())
+        finally:
+            if _scratch is not None:
+                _scratch.close()
+            _cap.release()
+            if _result is not None:
+                _result.release()
 
-            # Convert the string back to list
-            _frame_select_seq = eval(_frame_sequence)
+        if verbose: print("Video has been decrypted")
 
-            self.__validateKeyCompatibility__(_lines[0])  # validate first if we are working with compatible key file
+        return _per_frame_runtime
 
-        # Prepare the video writer
-        _cap = cv2.VideoCapture(str(_fpath.resolve()), cv2.CAP_FFMPEG)
 
-        _frame_width = int(_cap.get(3))
-        _frame_height = int(_cap.get(4))
+# Independent generators for the frames handed to the workers, spawned from 'rng' in frame order,
+# yields numpy.random.Generator
+def __spawnGenerators__(rng):
+    while True:
+        yield rng.spawn(1)[0]
 
-        _result = cv2.VideoWriter(
-            str(_vid_dest.absolute()),
-            cv2.VideoWriter_fourcc(*"mp4v"),
-            _cap.get(cv2.CAP_PROP_FPS),
-            (_frame_height, _frame_width),  # we use h, w again as the final decryption is rotated back to normal
-        )
 
-        # Extract frames
-        _temp_path = os.path.join(os.path.dirname(filepath),
-                                  'frameGen_temp')  # make temp folder in the same path as the video
+# Frame-parallel executor job for encryption, item is (frame, generator), returns (numpy array, float, float)
+def _encryptFrameJob(item, verbose=False, keystream=KeystreamMode.SEQUENTIAL):
+    _frame, _rng = item
 
-        if verbose: print(f"Extracting and Dumping Frames to {_temp_path} as .png")
-        self._decomposeFrame__(filepath, _temp_path, True)
-        if verbose: print(f"All frames has been Extracted")
+    return Encrypt_cosine().encryptFrame(_frame, verbose, keystream, _rng)
 
-        _frame_filenames = sorted([f for f in os.listdir(_temp_path) if f.endswith('.png')])
-        _sorted_frames = sorted(_frame_filenames, key=lambda x: int(x.split('_')[1].split('.')[0]))
 
-        # Create a temp folder where deshuffled frames are moved then renaming them
-        _temp_fs_path = os.path.join(_temp_path, 'fs_temp')
-        os.makedirs(_temp_fs_path)
+# Tile-parallel executor job for the tiled mode, item is (tile, (perm_seed, diff_seed)), the rotated cipher is
+# rotated back to fit the tile, returns numpy array of the tile
+def _encryptTileJob(item, verbose=False, keystream=KeystreamMode.SEQUENTIAL):
+    _tile, (_perm_seed, _diff_seed) = item
+    _encrypted, _perm_seed, _diff_seed = Encrypt_cosine().encryptFrame(_tile, verbose, keystream,
+                                                                       perm_seed=_perm_seed, diff_seed=_diff_seed)
 
-        # rearrange the frames according the Frame Selection sequence
-        if verbose: print(f"Rearranging and Renaming the frames to {_temp_fs_path}")
-        for inx, curr_frame in enumerate(_sorted_frames):
-            _source = os.path.join(_temp_path, curr_frame)
-            _dest = os.path.join(_temp_fs_path, f"frame_{_frame_select_seq[inx]}.png")
-            shutil.move(_source, _dest)
-        if verbose: print(f"All frames has been rearranged and renamed")
+    return np.rot90(_encrypted, 3)
 
-        # sort the arranged frames again in the array to be decrypted
-        _new_frame_filenames = sorted([f for f in os.listdir(_temp_fs_path) if f.endswith('.png')])
-        _new_sorted_frames = sorted(_new_frame_filenames, key=lambda x: int(x.split('_')[1].split('.')[0]))
 
-        for inx, curr_frame in enumerate(_new_sorted_frames):
-            _start = time.time()
+# Tile-parallel executor job for the tiled mode, item is (tile, (perm_seed, diff_seed)), returns numpy array of the tile
+def _decryptTileJob(item, verbose=False, diffusion=DiffusionMode.MODULAR, keystream=KeystreamMode.SEQUENTIAL):
+    _tile, (_perm_seed, _diff_seed) = item
 
-            _frame_name = os.path.join(_temp_fs_path, curr_frame)
+    return Encrypt_cosine().decryptFrame(np.rot90(_tile), _perm_seed, _diff_seed, verbose, diffusion, keystream)
 
-            _frame = cv2.imread(_frame_name)
 
-            _start_inx = inx * 2
-            _perm_seed = float(_lines[_start_inx].rstrip())
-            _diff_seed = float(_lines[_start_inx + 1].rstrip())
+# Frame-parallel executor job for region of interest encryption, item is (frame, rects, generator),
+# returns (numpy array, rects, seeds)
+def _encryptRegionsJob(item, verbose=False, keystream=KeystreamMode.SEQUENTIAL):
+    _frame, _rects, _rng = item
 
-            if verbose: print(f"[Frame {inx}]: Decrypting {curr_frame}")
-            _merged_img = self.decryptFrame(_frame, _perm_seed, _diff_seed)
-            if verbose: print(f"[Frame {inx}]: Frame Decrypted")
+    return Encrypt_cosine().encryptRegions(_frame, _rects, verbose, keystream, _rng)
 
-            if verbose: print(f"[Frame {inx}]: Writing Decrypted frame to video")
-            _result.write(_merged_img)
-            if verbose: print(f"[Frame {inx}]: Writing Done")
 
-            stop = time.time()
-            duration = stop - _start
-            _per_frame_runtime.append(duration)
+# Frame-parallel executor job for region of interest decryption, item is (frame, rects, seeds), returns numpy array
+def _decryptRegionsJob(item, verbose=False, diffusion=DiffusionMode.MODULAR, keystream=KeystreamMode.SEQUENTIAL):
+    _frame, _rects, _seeds = item
 
-        _cap.release()
-        if verbose: print("Video has been decrypted")
+    return Encrypt_cosine().decryptRegions(_frame, _rects, _seeds, verbose, diffusion, keystream)
 
-        if not mem_only:
-            self.__encryptKey__(_key.resolve(), password)  # re-encrypt file for safety
-            _key_file.close()  # finally, close the file
 
-        if os.path.isdir(_temp_path):
-            shutil.rmtree(_temp_path)  # delete the temp_path and its contents
-        else:
-            _text_warn = f"{_temp_path} could not be found: Path could be either moved or deleted, please make sure " \
-                         f"it is completely gone from your files"
-            warnings.warn(_text_warn, Warning)
+# Frame-parallel executor job for decryption, item is (frame, perm_seed, diff_seed), returns numpy array
+def _decryptFrameJob(item, verbose=False, diffusion=DiffusionMode.MODULAR, keystream=KeystreamMode.SEQUENTIAL):
+    _frame, _perm_seed, _diff_seed = item
 
-        return _per_frame_runtime
+    return Encrypt_cosine().decryptFrame(_frame, _perm_seed, _diff_seed, verbose, diffusion, keystream)
@@ -17,9 +17,12 @@ Functionality:
     set to -1 to disable limits, ONLY USED FOR TESTING AND DEBUGGING.
 
 3. Decryption:
-    - Can set 'mem_only' parameter to disable rewriting of the key file during decryption
-    and be saved only to memory, setting this to True allows running decryption function multiple
-    times safely in case of interruption of the script or the program mid-execution.
+    - Can set 'start' and 'end' parameters to decrypt only a range of frames, the video is seeked to the first
+    frame of the range and only the key records of the range are decrypted.
+    - Key files are binary key files (utils/key_format.py) inside a streaming container
+    (utils/text_file_encryption.py), the key material is sealed in chunks while the frames are encrypted and
+    only the chunks that are needed are decrypted, the key file is never rewritten as plaintext.
+    Text key files of older versions are still accepted, the 'mem_only' parameter is kept for compatibility.
 
 4. Exception handling:
     - Exceptions and assertions throughout the script to avoid silent failure and easier debugging.
@@ -29,10 +32,50 @@ Functionality:
     Logging of execution time per frame to display/output in the analysis.
     Contains Encryption and Decryption of the key file as well.
 
+6. Keystream modes:
+    - 'sequential' iterates one logistic map for the whole frame, this is the original keystream.
+    - 'segmented' expands the frame seed into SEGMENT_LANES sub-seeds and advances all lanes as NumPy vectors.
+    The mode is written to the key file header, so decryption always picks the generator the key was made with.
+
+7. Parallel and pipelined video processing:
+    - Frames are read, encrypted/decrypted and written by overlapping stages (utils/frame_pipeline.py),
+    and the 'workers' parameter spreads the frames across processes (utils/frame_executor.py).
+    - The engine keeps the size of a frame local to every call and the reused arrays of the jobs are kept per
+    thread, so one instance can be shared by the threads of a thread pool.
+
+8. Frame sources and sinks:
+    - 'filepath' and 'vid_destination' are paths or the sources/sinks of utils/frame_io.py, so videos can also be
+    read from and written to raw BGR24 pipes, ffmpeg, .npy frame stacks or image directories.
+    OpenCV with HuffmanYUV for encryption and mp4v for decryption stays the default.
+
+9. Channels:
+    - 'channels' selects the layout of the encrypted frames, 'grayscale' (or 'auto' for video whose frames are
+    grayscale stored as BGR) encrypts a single plane, so the keystream, the XOR and the output are a third
+    of the size. The channel count is written to the key file and decryption returns BGR frames again.
+    - Frames with a single channel (H x W x 1) are encrypted as they are by the frame and stream functions.
+
+10. Region of interest mode:
+    - 'roi' (utils/roi.py) gives rectangles per frame, only these are encrypted (each with its own hash)
+    and the rest of the frame is passed through, so the cipher work scales with the area of the rectangles.
+    The rectangles are written to the key file and decryption restores them in reverse order, so overlapping
+    rectangles are supported.
+
+11. Tiled mode:
+    - 'tile_size' splits every frame into tiles of at most tile_size x tile_size pixels (utils/tiling.py),
+    each tile is shuffled and diffused on its own with a hash derived from the hash of the frame, so the
+    permutations and the keystream are sized by the tile and the tiles of a frame are spread across the workers.
+    The key file stores the frame hashes as usual and the tile size in its header, key files without it
+    are decrypted whole.
+
+12. Streaming:
+    - 'encryptStream' and 'decryptStream' take any iterator of H x W x 3 uint8 frames (e.g. a capture loop)
+    and yield the results one at a time with the key record of every frame, no video or key file is involved.
+    Only a few frames are in flight at a time, so memory does not grow with the length of the stream.
+
 Dependencies:
 -------------
 - Numpy for faster vector calculations
-- cv2 for video and image/frame manipulation
+- cv2 for video and image/frame manipulation (through utils/frame_io.py)
 
 Code Author: John Paul M. Beltran, Roel C. Castro
 Date Created: 09/09/2024
@@ -45,24 +88,73 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
 from backend.utils.key_validator import EncryptionMode
-from backend.utils.key_validator import validateKey
+from backend.utils.key_validator import KeystreamMode
+from backend.utils.key_validator import ChannelMode
+from backend.utils.lane_seeds import deriveLaneSeeds
+from backend.utils.key_format import KeyWriter
+from backend.utils.key_format import KeyReader
+from backend.utils.frame_executor import FrameExecutor
+from backend.utils.frame_pipeline import FramePipeline
+from backend.utils.frame_pipeline import pipelineDepth
+from backend.utils.frame_io import openSource
+from backend.utils.frame_io import openSink
+from backend.utils.frame_io import selectChannels
+from backend.utils.frame_io import singlePlane
+from backend.utils.frame_io import restoreChannels
+from backend.utils.tiling import tileRects
+from backend.utils.tiling import mapTiles
 from pathlib import Path
+from functools import partial
 from math import ceil
-import backend.utils.text_file_encryption as tfe
 import numpy as np
 import hashlib
+import threading
+import struct
 import time
-import cv2
 
-class Encrypt:
-    def __init__(self):
-        self.NUM_ROWS = 0
-        self.NUM_COLS = 0
-        self.NUM_CHANNELS = 3
+# Lane layout of the segmented keystream, part of the 'segmented-v1' key format
+SEGMENT_LANES = 4096
+SEGMENT_WARMUP = 100
+
+
+# Reusable per-resolution arrays for the frame functions, the arrays are overwritten by every frame
+# 'depth' output arrays are used in rotation so results can wait in a pipeline queue while the next frames run
+class FrameBuffers:
+    def __init__(self, shape, depth=1):
+        _rows, _cols, _channels = shape
+        _res = _rows * _cols
+
+        self.shape = tuple(shape)
+        self.scratch = np.empty(shape, dtype=np.uint8)
+        self.outputs = [np.empty(shape, dtype=np.uint8) for _ in range(depth)]
+        self._next_output = 0
+
+        # logistic map values, padded to whole segmented keystream steps
+        self.keystream_values = np.empty(ceil(_res * _channels / SEGMENT_LANES) * SEGMENT_LANES)
+        self.keystream = np.empty((_res, _channels), dtype=np.uint8)
+
+    # Returns the next output array of the rotation, returns numpy array
+    def nextOutput(self):
+        _output = self.outputs[self._next_output]
+        self._next_output = (self._next_output + 1) % len(self.outputs)
+
+        return _output
+
+    # Returns the buffers for the shape from the pool, creating them on first use
+    @staticmethod
+    def fromPool(pool, shape, depth=1):
+        if shape not in pool or len(pool[shape].outputs) < depth:
+            pool[shape] = FrameBuffers(shape, depth)
+
+        return pool[shape]
 
+
+# The engine keeps no per-frame state, the size of a frame is local to every call, so one instance can serve
+# several threads at once
+class Encrypt:
     # creates a hash from an array, returns a hash str
     def __arrayToHash__(self, array):
-        _hash = hashlib.sha512(array.tobytes()).hexdigest()
+        _hash = hashlib.sha512(np.ascontiguousarray(array)).hexdigest()  # hashed through the buffer, no bytes copy
 
         return _hash
 
@@ -90,118 +182,115 @@ class Encrypt:
 
         return _transformedHash
 
-    # Fisher-Yates shuffle of image rows, returns numpy array
-    def __shuffleRow__(self, image, size, x0, r):
+    # Resolves the Fisher-Yates swap sequence driven by the logistic map into a single index array,
+    # applying the swaps to the indices instead of the pixels, returns numpy[int, int, int, ..., int]
+    def __generatePermutation__(self, size, x0, r):
+        _perm = list(range(size))
         _x = x0
         _x = r * _x * (1 - _x)
         for i in range(size - 1, 0, -1):
             _j = ceil(i * _x)
 
-            image[[i, _j]] = image[[_j, i]]
+            _perm[i], _perm[_j] = _perm[_j], _perm[i]
             _x = r * _x * (1 - _x)
 
-        # Reshape back to original dimensions
-        _shuffled_pixels = image.reshape(self.NUM_ROWS, self.NUM_COLS, self.NUM_CHANNELS)
-
-        return _shuffled_pixels
+        return np.array(_perm, dtype=np.intp)
 
-    # Fisher-Yates shuffle of image columns, returns numpy array
-    def __shuffleCol__(self, image, size, x0, r):
-        _x = x0
-        _x = r * _x * (1 - _x)
-        for i in range(size - 1, 0, -1):
-            _j = ceil(i * _x)
+    # Inverts a permutation index array for the reverse shuffle, returns numpy[int, int, int, ..., int]
+    def __invertPermutation__(self, permutation):
+        _inverse = np.empty_like(permutation)
+        _inverse[permutation] = np.arange(permutation.size, dtype=permutation.dtype)
 
-            image[:, [i, _j]] = image[:, [_j, i]]
-            _x = r * _x * (1 - _x)
+        return _inverse
 
-        # Reshape back to original dimensions
-        _shuffled_pixels = image.reshape(self.NUM_ROWS, self.NUM_COLS, self.NUM_CHANNELS)
+    # Fisher-Yates shuffle of image rows as one gather, returns numpy array
+    # (mode='clip' lets numpy gather straight into 'out', the indices are always in range)
+    def __shuffleRow__(self, image, permutation, out=None):
+        return np.take(image, permutation, axis=0, out=out, mode="clip")
 
-        return _shuffled_pixels
+    # Fisher-Yates shuffle of image columns as one gather, returns numpy array
+    def __shuffleCol__(self, image, permutation, out=None):
+        return np.take(image, permutation, axis=1, out=out, mode="clip")
 
     # Fisher-Yates reverse shuffling of image rows, returns numpy array
-    def __unshuffleRow__(self, image, swap_indices):
-        for i in range(1, self.NUM_ROWS):
-            _u = swap_indices.pop(-1)
-
-            image[[i, _u]] = image[[_u, i]]
-
-        return image
+    def __unshuffleRow__(self, image, permutation, out=None):
+        return np.take(image, self.__invertPermutation__(permutation), axis=0, out=out, mode="clip")
 
     # Fisher-Yates reverse shuffling of image columns, returns numpy array
-    def __unshuffleCol__(self, image, swap_indices):
-        for i in range(1, self.NUM_COLS):
-            _u = swap_indices.pop(-1)
+    def __unshuffleCol__(self, image, permutation, out=None):
+        return np.take(image, self.__invertPermutation__(permutation), axis=1, out=out, mode="clip")
 
-            image[:, [i, _u]] = image[:, [_u, i]]
-
-        return image
-
-    # Generates swap indices for shuffle reversal, returns [int, int, int, ...., int]
-    def __generateSwapIndex__(self, size, x0, r):
-        _swap_index = []
+    # Generates the logistic map values one step at a time into 'out', returns numpy[float, float, float, ..., float]
+    def __generateSequentialKeystream__(self, length, x0, r, out):
         _x = x0
-
-        _x = r * _x * (1 - _x)
-        _swap_index.append(_x)
-        for i in range(size - 1, 0, -1):
-            j = ceil(i * _x)
+        # discard first 2000
+        for i in range(2000):
             _x = r * _x * (1 - _x)
-            _swap_index.append(j)
-
-        return _swap_index
 
-    # Generates keystream vector, returns numpy[int16, int16, int16, ..., int16]
-    def __generateKeystream__(self, res, x0, r):
-        _x = x0
-        _ks = [x0]
         # create keystream
-        for i in range(2000 + ((res * 3) - 1)):
+        _ks = [_x]
+        for i in range(length - 1):
             _x = r * _x * (1 - _x)
             _ks.append(_x)
 
-        # discard first 2000
-        del _ks[:2000]
+        out[:length] = _ks
 
-        # convert into numpy array
-        _ks_array = np.array(_ks)
+        return out[:length]
 
-        # produce keystream vector
-        _kv = np.floor(_ks_array * 10 ** 16) % 256
-        _kv = _kv.astype(dtype="int16")
+    # Generates the logistic map values on SEGMENT_LANES independent lanes advanced together into 'out',
+    # lane values are interleaved step by step, returns numpy[float, float, float, ..., float]
+    def __generateSegmentedKeystream__(self, length, x0, r, out):
+        _x = deriveLaneSeeds(struct.pack(">dd", x0, r), SEGMENT_LANES)
 
-        return _kv
+        # discard the transient of every lane
+        for i in range(SEGMENT_WARMUP):
+            _x = r * _x * (1 - _x)
 
-    # XOR wrapper function, returns numpy[int16, int16, int16, ..., int16]
-    def __xor__(self, a, b):
-        return np.bitwise_xor(a, b)
+        _ks = out.reshape(-1, SEGMENT_LANES)
+        for i in range(ceil(length / SEGMENT_LANES)):
+            _x = r * _x * (1 - _x)
+            _ks[i] = _x
 
-    # Encrypts the key file
-    def __encryptHashes__(self, hash_filepath, password):
-        tfe.encryptFile(hash_filepath, password)
+        return out[:length]
 
-    # Decrypts the key file, returns either [str, str, str, ..., str] or None
-    def __decryptHashes__(self, hash_filepath, password, mem_only):
-        decrypted = tfe.decryptFile(hash_filepath, password, mem_only=mem_only)
+    # Generates keystream vector into buffers.keystream in B/G/R order (one column for grayscale frames),
+    # returns numpy[[uint8, uint8, uint8], ...]
+    def __generateKeystream__(self, res, x0, r, buffers, mode=KeystreamMode.SEQUENTIAL):
+        _channels = buffers.keystream.shape[1]
 
-        if mem_only:
-            return decrypted.splitlines()  # transform the text into a list with newlines as separator
+        if mode == KeystreamMode.SEQUENTIAL:
+            _ks_array = self.__generateSequentialKeystream__(res * _channels, x0, r, buffers.keystream_values)
+        elif mode == KeystreamMode.SEGMENTED:
+            _ks_array = self.__generateSegmentedKeystream__(res * _channels, x0, r, buffers.keystream_values)
         else:
-            return None
+            raise ValueError(f"Unknown keystream mode: {mode}")
+
+        # produce keystream vector, floor(x * 10^16) % 256 computed in place
+        np.multiply(_ks_array, 10 ** 16, out=_ks_array)
+        np.floor(_ks_array, out=_ks_array)
+        np.mod(_ks_array, 256, out=_ks_array)
 
-    # Validates if the key is appropriate for the algorithm
-    def __validateKeyCompatibility__(self, key_sample):
-        validateKey(key_sample, mode=EncryptionMode.FISHER_YATES)
+        # the keystream is split into one part per channel (R, G, B) and interleaved as B, G, R to match
+        # the cv2 channel order
+        _kv = buffers.keystream
+        for c in range(_channels):
+            _kv[:, c] = _ks_array[(_channels - 1 - c) * res:(_channels - c) * res]
+
+        return _kv
 
-        return
+    # XOR wrapper function, returns numpy[uint8, uint8, uint8, ..., uint8]
+    def __xor__(self, a, b, out=None):
+        return np.bitwise_xor(a, b, out=out)
 
-    # Frame Encryption, returns numpy array of the frame
-    def encryptFrame(self, frame, verbose=False):
-        self.NUM_ROWS, self.NUM_COLS, self.NUM_CHANNELS = frame.shape
+    # Frame Encryption, returns numpy array of the frame (an output array of 'buffers' when passed)
+    # 'hashed' is the hash of a tile in the tiled mode, derived from the hash of the frame
+    def encryptFrame(self, frame, verbose=False, keystream=KeystreamMode.SEQUENTIAL, buffers=None, hashed=None):
+        _rows, _cols, _channels = frame.shape
+        if buffers is None:
+            buffers = FrameBuffers(frame.shape)
 
         if verbose: print("\tGenerating Logistic Map Seeds")
-        _hashed = self.__arrayToHash__(frame)
+        _hashed = self.__arrayToHash__(frame) if hashed is None else hashed
 
         _splits = self.__splitHash__(_hashed)
         _converted = self.__convertToDecimal__(_splits)
@@ -212,43 +301,34 @@ class Encrypt:
 
         # Permutate
         if verbose: print("\tRunning Fisher-Yates Permutation")
-        _row_permutated = self.__shuffleRow__(
-            frame, self.NUM_ROWS, _transform[1], _transform[0]
-        )
-        _col_permutated = self.__shuffleCol__(
-            _row_permutated, self.NUM_COLS, _transform[1], _transform[0]
-        )  # final permutation
+        _row_perm = self.__generatePermutation__(_rows, _transform[1], _transform[0])
+        _col_perm = self.__generatePermutation__(_cols, _transform[1], _transform[0])
+
+        self.__shuffleRow__(frame, _row_perm, out=buffers.scratch)
+        _col_permutated = self.__shuffleCol__(buffers.scratch, _col_perm, out=buffers.nextOutput())  # final permutation
         if verbose: print("\tPermutation Done")
 
-        _flatten = _col_permutated.reshape(-1, self.NUM_CHANNELS)
+        _flatten = _col_permutated.reshape(-1, _channels)
 
         # Create keystream vector
         if verbose: print("\tCreating Keystream Vector")
-        _kv = self.__generateKeystream__(
-            self.NUM_ROWS * self.NUM_COLS, _transform[3], _transform[2]
+        _uint8_ks = self.__generateKeystream__(
+            _rows * _cols, _transform[3], _transform[2], buffers, keystream
         )
-        _kr, _kg, _kb = np.array_split(_kv, 3)  # split keystream into three
-        _comb_ks = np.vstack((_kb, _kg, _kr)).T  # this is the 2d array of the keystream
-        _uint8_ks = _comb_ks.astype(
-            np.uint8
-        )  # change to uint8 datatype for correct cv2 data type
         if verbose: print("\tCreated Keystream Vector")
 
-        # _diffuse the pixels
+        # _diffuse the pixels in place
         if verbose: print("\tSplitted Frames and Running Diffusion (XOR)")
-        _diffuse = self.__xor__(_flatten, _uint8_ks)
+        self.__xor__(_flatten, _uint8_ks, out=_flatten)
         if verbose: print("\tDiffusion Done and Channels Merged")
 
-        # reshape the array into a required cv2 format
-        _diffuse_pixels = _diffuse.reshape(
-            self.NUM_ROWS, self.NUM_COLS, self.NUM_CHANNELS
-        )
-
-        return _diffuse_pixels, _hashed
+        return _col_permutated, _hashed
 
-    # Frame Decryption, returns numpy array of the frame
-    def decryptFrame(self, frame, hash, verbose=False):
-        self.NUM_ROWS, self.NUM_COLS, self.NUM_CHANNELS = frame.shape
+    # Frame Decryption, returns numpy array of the frame (an output array of 'buffers' when passed)
+    def decryptFrame(self, frame, hash, verbose=False, keystream=KeystreamMode.SEQUENTIAL, buffers=None):
+        _rows, _cols, _channels = frame.shape
+        if buffers is None:
+            buffers = FrameBuffers(frame.shape)
 
         if verbose: print("\tGenerating Logistic Map Seeds")
         _splits = self.__splitHash__(hash)
@@ -258,181 +338,371 @@ class Encrypt:
         )  # [Logmap1 r, Logmap1 x0, Logmap2 r, Logmap2 x0]
         if verbose: print(f"\tGenerated Logistic Map Seeds: {_transform}")
 
-        # flatten array
-        _flatten = frame.reshape(-1, self.NUM_CHANNELS)
-
         if verbose: print("\tGenerating Keystream Vector")
         # create keystream vector
-        _kv = self.__generateKeystream__(
-            self.NUM_ROWS * self.NUM_COLS, _transform[3], _transform[2]
+        _uint8_ks = self.__generateKeystream__(
+            _rows * _cols, _transform[3], _transform[2], buffers, keystream
         )
-        _kr, _kg, _kb = np.array_split(_kv, 3)  # split keystream into three
-        _comb_ks = np.vstack((_kb, _kg, _kr)).T  # this is the 2d array of the keystream
-        _uint8_ks = _comb_ks.astype(
-            np.uint8
-        )  # change to uint8 datatype for correct cv2 data type
         if verbose: print("\tGenerated Keystream Vector")
 
         # _undiffuse the pixels
         if verbose: print("\tSplitted Frames and Running Reverse Diffusion (XOR)")
-        _undiffuse = self.__xor__(_flatten, _uint8_ks)
-
-        # rejoin channels into one frame
-        _undiffused_frame = _undiffuse.reshape(
-            self.NUM_ROWS, self.NUM_COLS, self.NUM_CHANNELS
+        _undiffused_frame = buffers.nextOutput()
+        self.__xor__(
+            frame.reshape(-1, _channels), _uint8_ks, out=_undiffused_frame.reshape(-1, _channels)
         )
         if verbose: print("\tReverse Diffusion Done and Channels Merged")
 
-        # generate swap index array for row and column
-        if verbose: print("\tGenerate Swap Index Array for Row and Columns")
-        _row_swap_indices = self.__generateSwapIndex__(
-            self.NUM_ROWS, _transform[1], _transform[0]
-        )
-        _col_swap_indices = self.__generateSwapIndex__(
-            self.NUM_COLS, _transform[1], _transform[0]
-        )
-        if verbose: print("\tSwap Index Array Generated")
+        # generate permutation index array for row and column
+        if verbose: print("\tGenerate Permutation Index Array for Row and Columns")
+        _row_perm = self.__generatePermutation__(_rows, _transform[1], _transform[0])
+        _col_perm = self.__generatePermutation__(_cols, _transform[1], _transform[0])
+        if verbose: print("\tPermutation Index Array Generated")
 
         # unshuffle the undiffused frame, then the unshuffled column frame
         if verbose: print("\tRunning Reverse Fisher-Yates Permutation")
-        _col_unshuffled = self.__unshuffleCol__(_undiffused_frame, _col_swap_indices)
-        _row_unshuffled = self.__unshuffleRow__(_col_unshuffled, _row_swap_indices)
+        self.__unshuffleCol__(_undiffused_frame, _col_perm, out=buffers.scratch)
+        _row_unshuffled = self.__unshuffleRow__(buffers.scratch, _row_perm, out=_undiffused_frame)
         if verbose: print("\tReverse Fisher-Yates Permutation Done")
 
         return _row_unshuffled
 
-    # Encrypts the video, outputs a .avi file encoded in HuffmanYUV, returns [int, int, int, ..., int]
-    def encryptVideo(self, filepath, vid_destination, key_destination, password, verbose=False, frame_limit=-1):
-        _fpath = Path(filepath)
-        _vid_dest = Path(vid_destination)
-        _key_dest = Path(key_destination)
-
-        # Record per frame runtime here
-        _per_frame_runtime = []
-
-        _cap = cv2.VideoCapture(str(_fpath.resolve()), cv2.CAP_FFMPEG)
-
-        _frame_width = int(_cap.get(3))
-        _frame_height = int(_cap.get(4))
-
-        _result = cv2.VideoWriter(
-            str(_vid_dest.absolute()),
-            cv2.VideoWriter_fourcc(*"HFYU"),
-            _cap.get(cv2.CAP_PROP_FPS),
-            (_frame_width, _frame_height),
-        )
-
-        cv2.VideoWriter_fourcc("H", "F", "Y", "U")
-        # open the text file that will contain the list of hashes
-        _hash_file = open(_key_dest.absolute(), "w")
-
+    # Encrypts the rectangles (x, y, width, height) of the frame in order and passes the rest of the frame through,
+    # slots with a size of 0 are skipped, returns (numpy array of the frame, numpy array (slots, 64) of the digests)
+    def encryptRegions(self, frame, rects, verbose=False, keystream=KeystreamMode.SEQUENTIAL):
+        _encrypted = frame.copy()
+        _digests = np.zeros((len(rects), 64), dtype=np.uint8)
+
+        for i, (_x, _y, _w, _h) in enumerate(np.asarray(rects, dtype=np.int64).tolist()):
+            if _w == 0 or _h == 0:
+                continue
+
+            if verbose: print(f"\tEncrypting Region {i} ({_x}, {_y}, {_w}x{_h})")
+            _region, _hashed = self.encryptFrame(_encrypted[_y:_y + _h, _x:_x + _w], verbose, keystream)
+            _encrypted[_y:_y + _h, _x:_x + _w] = _region
+            _digests[i] = np.frombuffer(bytes.fromhex(_hashed), dtype=np.uint8)
+
+        return _encrypted, _digests
+
+    # Decrypts the rectangles of the frame in reverse order so overlapping rectangles are restored,
+    # returns numpy array of the frame
+    def decryptRegions(self, frame, rects, digests, verbose=False, keystream=KeystreamMode.SEQUENTIAL):
+        _decrypted = frame.copy()
+        _regions = list(enumerate(zip(np.asarray(rects, dtype=np.int64).tolist(), digests)))
+
+        for i, ((_x, _y, _w, _h), _digest) in reversed(_regions):
+            if _w == 0 or _h == 0:
+                continue
+
+            if verbose: print(f"\tDecrypting Region {i} ({_x}, {_y}, {_w}x{_h})")
+            _decrypted[_y:_y + _h, _x:_x + _w] = self.decryptFrame(
+                np.ascontiguousarray(_decrypted[_y:_y + _h, _x:_x + _w]), bytes(_digest).hex(), verbose, keystream
+            )
+
+        return _decrypted
+
+    # Derives the hash of every tile from the hash of the frame, returns [str, ..., str]
+    def __tileHashes__(self, hashed, count):
+        _digest = bytes.fromhex(hashed)
+
+        return [hashlib.sha512(_digest + i.to_bytes(4, "big")).hexdigest() for i in range(count)]
+
+    # Pairs the tiles of every frame with their hashes for mapTiles, 'frames' yields frames (encryption) or
+    # (frame, hash) (decryption), yields (frame, rects, tile hashes, hash of the frame)
+    def __tileItems__(self, frames, tile_size):
+        for _item in frames:
+            _frame, _hashed = _item if isinstance(_item, tuple) else (_item, self.__arrayToHash__(_item))
+            _rects = tileRects(_frame.shape[0], _frame.shape[1], tile_size)
+
+            yield _frame, _rects, self.__tileHashes__(_hashed, len(_rects)), _hashed
+
+    # Tiled Frame Encryption, every tile is encrypted with a hash derived from the hash of the frame,
+    # returns (numpy array of the frame, str)
+    def encryptTiles(self, frame, tile_size, verbose=False, keystream=KeystreamMode.SEQUENTIAL):
+        _job = partial(_encryptTileJob, keystream=keystream, verbose=verbose)
+
+        return next(mapTiles(FrameExecutor(1), _job, self.__tileItems__([frame], tile_size)))
+
+    # Tiled Frame Decryption, returns numpy array of the frame
+    def decryptTiles(self, frame, hash, tile_size, verbose=False, keystream=KeystreamMode.SEQUENTIAL):
+        _job = partial(_decryptTileJob, keystream=keystream, verbose=verbose)
+        _decrypted, _hashed = next(mapTiles(FrameExecutor(1), _job, self.__tileItems__([(frame, hash)], tile_size)))
+
+        return _decrypted
+
+    # Encrypts an iterator of frames, yields (encrypted frame, key record) in frame order, the key record is the
+    # 64 byte digest of the frame as written by KeyWriter.writeRecord
+    # At most 2 * workers frames are in flight, with 'reuse' the yielded frame is only valid until the next one
+    def encryptStream(self, frames, keystream=KeystreamMode.SEQUENTIAL, workers=1, reuse=False):
+        _executor = FrameExecutor(workers)
+        _job = partial(_encryptFrameJob, keystream=keystream, fresh=not reuse)
+
+        for _encrypted, _hashed in _executor.map(_job, frames):
+            yield _encrypted, bytes.fromhex(_hashed)
+
+    # Decrypts an iterator of frames with the key record of every frame (digest bytes, uint8 array or hex str),
+    # yields the decrypted frames in frame order
+    def decryptStream(self, frames, records, keystream=KeystreamMode.SEQUENTIAL, workers=1, reuse=False):
+        _executor = FrameExecutor(workers)
+        _job = partial(_decryptFrameJob, keystream=keystream, fresh=not reuse)
+        _items = ((_frame, _record if isinstance(_record, str) else bytes(_record).hex())
+                  for _frame, _record in zip(frames, records))
+
+        yield from _executor.map(_job, _items)
+
+    # Reads the frames of the video up to frame_limit (-1 for all), yields numpy arrays of the frames
+    # 'ring_size' > 0 decodes into that many reused arrays in rotation, only safe when no more than
+    # ring_size - 1 earlier frames are still in use when the next frame is read
+    def __readFrames__(self, cap, frame_limit, verbose=False, ring_size=0):
+        _ring = []
         _count = 0
 
         while frame_limit < 0 or _count < frame_limit:
-            _start = time.time()
-            _grabbed, _frame = _cap.read()
+            _buffer = _ring[_count % ring_size] if len(_ring) == ring_size > 0 else None
+            _grabbed, _frame = cap.read(_buffer)
 
             if not _grabbed:
                 break
 
-            if verbose: print(f"[Frame {_count}] Encrypting Frame")
-            diffuse_pixels, hashed = self.encryptFrame(_frame, verbose)
-            if verbose: print(f"[Frame {_count}]  Frame Encrypted")
-
-            if verbose: print(f"[Frame {_count}] Writing Hash to key text file")
-            _hash_file.write(
-                hashed + "\n"
-            )  # write with newline at the end so every writes will start on new line
-            if verbose: print(f"[Frame {_count}] Writing Done")
+            if len(_ring) < ring_size:
+                _ring.append(_frame)
 
-            if verbose: print(f"[Frame {_count}] Writing Encrypted Frame to video")
-            _result.write(diffuse_pixels)
-            if verbose: print(f"[Frame {_count}] Writing Done")
+            if verbose: print(f"[Frame {_count}] Processing Frame")
+            yield _frame
 
             _count += 1
 
-            _stop = time.time()
-            _duration = _stop - _start
-            _per_frame_runtime.append(_duration)
+    # Encrypts the video, outputs a .avi file encoded in HuffmanYUV (or any sink of utils/frame_io.py), returns [int, int, int, ..., int]
+    def encryptVideo(self, filepath, vid_destination, key_destination, password, verbose=False, frame_limit=-1,
+                     keystream=KeystreamMode.SEQUENTIAL, workers=1, channels=ChannelMode.COLOR, roi=None,
+                     tile_size=0):
+        _key_dest = Path(key_destination)
 
-        _cap.release()
-        if verbose: print(f"Video has been encrypted")
+        # Record per frame runtime here
+        _per_frame_runtime = []
+
+        # frames are read from and written to the backends of utils/frame_io.py, OpenCV unless told otherwise
+        _cap = openSource(filepath)
+        _result = None
+
+        # the source and the sink are released even when the encryption fails
+        try:
+            _frame_width = _cap.width
+            _frame_height = _cap.height
+
+            # decoding, encryption and encoding run as overlapping stages, frames are fanned out to the workers
+            # and come back in order, a single worker reuses a ring of read and output arrays
+            _executor = FrameExecutor(workers)
+            _inline = _executor.workers == 1
+            _frames = self.__readFrames__(_cap, frame_limit, verbose, ring_size=pipelineDepth() if _inline else 0)
+
+            # grayscale video is encrypted as a single plane, HuffmanYUV is not lossless for gray so FFV1 is used
+            _channels, _frames = selectChannels(_frames, channels)
+            if verbose: print(f"Encrypting {_channels} channel(s) per frame")
+
+            _result = openSink(vid_destination, fps=_cap.fps, fourcc="HFYU" if _channels == 3 else "FFV1",
+                               algorithm=EncryptionMode.FISHER_YATES)
+
+            # open the key file that will contain the hash of every frame, they are sealed in chunks as frames finish,
+            # the key file is sealed with the frame count once the frames are done, a failed run leaves it incomplete
+            with KeyWriter(_key_dest.absolute(), password, EncryptionMode.FISHER_YATES,
+                           _frame_width, _frame_height, keystream=keystream, channels=_channels,
+                           roi_slots=roi.slots if roi is not None else 0, tile_size=tile_size) as _hash_file:
+
+                # in region of interest mode only the rectangles of every frame are encrypted, a hash per rectangle
+                if roi is not None:
+                    _frames = ((_frame, roi.rects(_index, _frame_width, _frame_height)) for _index, _frame in enumerate(_frames))
+                    if verbose: print(f"Encrypting up to {roi.slots} region(s) of interest per frame")
+                _job = partial(_encryptFrameJob, keystream=keystream, verbose=verbose and _inline,
+                               depth=pipelineDepth() if _inline else 1)
+                if roi is not None:
+                    _job = partial(_encryptRegionsJob, keystream=keystream, verbose=verbose and _inline)
+                _compute = partial(_executor.map, _job)
+
+                # in tiled mode the tiles of the frames are fanned out to the workers instead of whole frames
+                if tile_size:
+                    _job = partial(_encryptTileJob, keystream=keystream, verbose=verbose and _inline)
+                    _compute = lambda _items: mapTiles(_executor, _job, self.__tileItems__(_items, tile_size))
+                    if verbose: print(f"Encrypting tiles of up to {tile_size}x{tile_size} pixels")
+                if verbose: print(f"Encrypting with {_executor.workers} worker(s)")
+
+                _last_time = time.time()
+
+                def _writeFrame(_count, _encrypted):
+                    nonlocal _last_time
+                    diffuse_pixels, hashed = _encrypted
+                    if verbose: print(f"[Frame {_count}]  Frame Encrypted")
+
+                    if verbose: print(f"[Frame {_count}] Writing Hash to key text file")
+                    _hash_file.writeRecord(bytes.fromhex(hashed) if roi is None else hashed)  # region keys: (rects, digests)
+                    if verbose: print(f"[Frame {_count}] Writing Done")
+
+                    if verbose: print(f"[Frame {_count}] Writing Encrypted Frame to video")
+                    _result.write(diffuse_pixels)
+                    if verbose: print(f"[Frame {_count}] Writing Done")
+
+                    # time between two finished frames, with several workers the runtimes still add up to the wall time
+                    _stop = time.time()
+                    _duration = _stop - _last_time
+                    _per_frame_runtime.append(_duration)
+                    _last_time = _stop
+
+                _pipeline = FramePipeline()
+                _pipeline.run(_frames, _compute, _writeFrame)
+                if verbose: print(_pipeline.summary())
+        finally:
+            _cap.release()
+            if _result is not None:
+                _result.release()
 
-        _hash_file.close()  # finally, close the file
-        self.__encryptHashes__(
-            _key_dest.resolve(), password
-        )  # and encrypt the hash file
+        if verbose: print(f"Video has been encrypted")
         if verbose: print(f"Key file has been encrypted")
 
         return _per_frame_runtime
 
-    # Encrypts the video, outputs a .mp4 file encoded in mp4v, returns [int, int, int, ..., int]
-    def decryptVideo(self, filepath, vid_destination, hash_filepath, password, verbose=False, mem_only=True):
-        _fpath = Path(filepath)
-        _vid_dest = Path(vid_destination)
+    # Decrypts the video, outputs a .mp4 file encoded in mp4v (or any sink of utils/frame_io.py), returns [int, int, int, ..., int]
+    def decryptVideo(self, filepath, vid_destination, hash_filepath, password, verbose=False, mem_only=True, workers=1,
+                     start=0, end=None):
         _key = Path(hash_filepath)
 
         # Record per frame runtime here
         _per_frame_runtime = []
 
-        _key_list = self.__decryptHashes__(_key.resolve(), password, mem_only=mem_only)
-        if verbose: print("Decrypted the Key Hash File")
+        # the key file is validated from its header, the hashes are decrypted a block at a time while the frames
+        # are decrypted
+        _key_file = KeyReader(_key.resolve(), password, EncryptionMode.FISHER_YATES)
+        _keystream = _key_file.keystream
+        _channels = _key_file.channels
+        if verbose: print(f"Key file has {_key_file.frame_count} frames and uses the {_keystream.value} keystream")
+
+        # only the frames 'start' to 'end' (exclusive) are decrypted, an empty clip is an error
+        _start, _end = _key_file.clip(start, end)
+
+        _cap = openSource(filepath)
+        _result = None
+
+        # the source and the sink are released even when the decryption fails
+        try:
+            _key_file.checkFrameSize(_cap.width, _cap.height)
+            _result = openSink(vid_destination, fps=_cap.fps, fourcc="mp4v")
+
+            # the video is seeked to the first frame of the clip
+            if _start > 0:
+                _cap.seek(_start)
+            if verbose: print(f"Decrypting frames {_start} to {_end} of {_key_file.frame_count}")
+
+            # pair every frame with its hash, record n of the key file belongs to frame n
+            _executor = FrameExecutor(workers)
+            _inline = _executor.workers == 1
+            _frames = self.__readFrames__(_cap, _end - _start, verbose, ring_size=pipelineDepth() if _inline else 0)
+            if _channels == 1:
+                _frames = map(singlePlane, _frames)
+            _items = ((_frame, _digest.tobytes().hex()) for _frame, _digest in zip(_frames, _key_file.iterRecords(_start)))
+            _job = partial(_decryptFrameJob, keystream=_keystream, verbose=verbose and _inline,
+                           depth=pipelineDepth() if _inline else 1)
+
+            # region of interest keys hold the rectangles and a hash for each of them
+            if _key_file.roi_slots:
+                _items = ((_frame, _record["rects"], _record["keys"])
+                          for _frame, _record in zip(_frames, _key_file.iterRecords(_start)))
+                _job = partial(_decryptRegionsJob, keystream=_keystream, verbose=verbose and _inline)
+                if verbose: print(f"Decrypting up to {_key_file.roi_slots} region(s) of interest per frame")
+            _compute = partial(_executor.map, _job)
+
+            # tiled keys decrypt the tiles of the frames with the hashes derived from the frame hashes
+            if _key_file.tile_size:
+                _job = partial(_decryptTileJob, keystream=_keystream, verbose=verbose and _inline)
+                _compute = lambda _items: (_decrypted for _decrypted, _hashed in
+                                           mapTiles(_executor, _job, self.__tileItems__(_items, _key_file.tile_size)))
+                if verbose: print(f"Decrypting tiles of up to {_key_file.tile_size}x{_key_file.tile_size} pixels")
+            if verbose: print(f"Decrypting with {_executor.workers} worker(s)")
+
+            _last_time = time.time()
+
+            def _writeFrame(_count, _row_unshuffled):
+                nonlocal _last_time
+                if verbose: print(f"[Frame {_count}] Frame Decrypted")
+
+                if verbose: print(f"[Frame {_count}] Writing Decrypted Frame to video")
+                _result.write(_row_unshuffled if _channels == 3 else restoreChannels(_row_unshuffled))
+                if verbose: print(f"[Frame {_count}] Writing Done")
+
+                # time between two finished frames, with several workers the runtimes still add up to the wall time
+                _stop = time.time()
+                _duration = _stop - _last_time
+                _per_frame_runtime.append(_duration)
+                _last_time = _stop
+
+            _pipeline = FramePipeline()
+            _pipeline.run(_items, _compute, _writeFrame)
+            if verbose: print(_pipeline.summary())
+        finally:
+            _cap.release()
+            if _result is not None:
+                _result.release()
 
-        if mem_only:
-            _lines = _key_list
-        else:
-            _hash_file = open(_key.resolve(), "r")
-            _lines = _hash_file.readlines()
+        if verbose: print(f"Video has been Decrypted")
 
-        self.__validateKeyCompatibility__(_lines[0])  # validate first if we are working with compatible key file
+        return _per_frame_runtime
 
-        _cap = cv2.VideoCapture(str(_fpath.resolve()), cv2.CAP_FFMPEG)
 
-        _frame_width = int(_cap.get(3))
-        _frame_height = int(_cap.get(4))
+# Per-thread buffers of the executor jobs, each worker process and each thread running jobs keeps its own pool,
+# so videos encrypted by several threads of one process never share arrays
+_JOB_BUFFERS = threading.local()
 
-        _result = cv2.VideoWriter(
-            str(_vid_dest.absolute()),
-            cv2.VideoWriter_fourcc(*"mp4v"),
-            _cap.get(cv2.CAP_PROP_FPS),
-            (_frame_width, _frame_height),
-        )
 
-        _hash_line = 0  # keep track of our line in the text file
+# Buffer pool of the calling thread, returns dict
+def __jobPool__():
+    if not hasattr(_JOB_BUFFERS, "pool"):
+        _JOB_BUFFERS.pool = {}
 
-        _count = 0
+    return _JOB_BUFFERS.pool
 
-        while True:
-            _start = time.time()
-            _grabbed, _frame = _cap.read()
 
-            if not _grabbed:
-                break
+# Frame-parallel executor job for encryption, returns (numpy array, str)
+# 'fresh' allocates new buffers so the result is never overwritten by a later frame
+def _encryptFrameJob(frame, keystream=KeystreamMode.SEQUENTIAL, verbose=False, depth=1, fresh=False):
+    _buffers = FrameBuffers(frame.shape) if fresh else FrameBuffers.fromPool(__jobPool__(), frame.shape, depth)
 
-            if verbose: print(f"[Frame {_count}] Grabbing the Hash for Frame {_count}")
-            _hashed = _lines[_hash_line].rstrip()
+    return Encrypt().encryptFrame(frame, verbose, keystream, _buffers)
 
-            # Decrypt
-            if verbose: print(f"[Frame {_count}] Decrypting Frame")
-            _row_unshuffled = self.decryptFrame(_frame, _hashed)
-            if verbose: print(f"[Frame {_count}] Frame Decrypted")
 
-            if verbose: print(f"[Frame {_count}] Writing Decrypted Frame to video")
-            _result.write(_row_unshuffled)
-            if verbose: print(f"[Frame {_count}] Writing Done")
+# Tile-parallel executor job for the tiled mode, item is (tile, hash), returns numpy array of the tile
+def _encryptTileJob(item, keystream=KeystreamMode.SEQUENTIAL, verbose=False):
+    _tile, _hashed = item
+    _buffers = FrameBuffers.fromPool(__jobPool__(), _tile.shape)
+    _encrypted, _hashed = Encrypt().encryptFrame(_tile, verbose, keystream, _buffers, hashed=_hashed)
 
-            _count += 1
-            _hash_line += 1
+    return _encrypted
 
-            _stop = time.time()
-            _duration = _stop - _start
-            _per_frame_runtime.append(_duration)
 
-        _cap.release()
-        if verbose: print(f"Video has been Decrypted")
+# Tile-parallel executor job for the tiled mode, item is (tile, hash), returns numpy array of the tile
+def _decryptTileJob(item, keystream=KeystreamMode.SEQUENTIAL, verbose=False):
+    _tile, _hashed = item
+    _buffers = FrameBuffers.fromPool(__jobPool__(), _tile.shape)
 
-        if not mem_only:
-            self.__encryptHashes__(_key.resolve(), password)     # re-encrypt file for safety
-            _hash_file.close()   # finally, close the file
+    return Encrypt().decryptFrame(_tile, _hashed, verbose, keystream, _buffers)
 
-        return _per_frame_runtime
+
+# Frame-parallel executor job for region of interest encryption, item is (frame, rects),
+# returns (numpy array, (rects, digests))
+def _encryptRegionsJob(item, keystream=KeystreamMode.SEQUENTIAL, verbose=False):
+    _frame, _rects = item
+    _encrypted, _digests = Encrypt().encryptRegions(_frame, _rects, verbose, keystream)
+
+    return _encrypted, (_rects, _digests)
+
+
+# Frame-parallel executor job for region of interest decryption, item is (frame, rects, digests), returns numpy array
+def _decryptRegionsJob(item, keystream=KeystreamMode.SEQUENTIAL, verbose=False):
+    _frame, _rects, _digests = item
+
+    return Encrypt().decryptRegions(_frame, _rects, _digests, verbose, keystream)
+
+
+# Frame-parallel executor job for decryption, item is (frame, hash), returns numpy array
+def _decryptFrameJob(item, keystream=KeystreamMode.SEQUENTIAL, verbose=False, depth=1, fresh=False):
+    _frame, _hashed = item
+    _buffers = FrameBuffers(_frame.shape) if fresh else FrameBuffers.fromPool(__jobPool__(), _frame.shape, depth)
+
+    return Encrypt().decryptFrame(_frame, _hashed, verbose, keystream, _buffers)
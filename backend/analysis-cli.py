@@ -11,10 +11,9 @@ Dependencies:
 -------------
 
 - Encryption algorithms: "3dcosine", "Fisher-Yates"
-- External modules: "backend.analysis"
+- External modules: "backend.analysis", "frame_io" (videos, raw containers (.mcv) and frame stacks as inputs)
 - Built-in modules: "csv", "argparse"
 - NumPy
-- OpenCV
 
 Code Author: Roel Castro
 Date Created: 9/30/2024
@@ -28,14 +27,33 @@ sys.path.append(str(Path(__file__).resolve().parent.parent))
 
 from backend.algorithms._3d_cosine import Encrypt_cosine
 from backend.analysis.correlation import Correlation
+from backend.analysis.correlation import SAMPLING_MODES
 from backend.analysis.differential import Differential
 from backend.algorithms.fisher_yates import Encrypt
 from backend.analysis.other import EncryptionQuality
+from backend.utils.frame_io import openSource
 import numpy as np
 import csv
-import cv2
 import argparse
 
+# Reads the frames to analyze, yields (frame, (index, encrypted frame, decrypted frame))
+def read_frames(frame_count, cap, cap_encrypted=None, cap_decrypted=None):
+    frame_e, frame_d = None, None
+
+    for i in range(frame_count):
+        ret, frame = cap.read()
+
+        if not ret:
+            print("[DONE] Analyzation Completed Successfully")
+            break
+
+        if cap_encrypted != None:
+            ret_e, frame_e = cap_encrypted.read()
+        if cap_decrypted != None:
+            ret_d, frame_d = cap_decrypted.read()
+
+        yield frame, (i, frame_e, frame_d)
+
 def main():
 
     parser = argparse.ArgumentParser(description='For analysis purposes')
@@ -51,7 +69,7 @@ def main():
                         help="specifies the path of the original video",
                         type=str,  required=True)
     parser.add_argument('-e', "--encrypted",
-                        help="specifies the path of the encrypted video",
+                        help="specifies the path of the encrypted video (a raw container (.mcv) is read without decoding)",
                         type=str)
     parser.add_argument('-d', "--decrypted",
                         help="specifies the path of the decrypted video",
@@ -68,6 +86,13 @@ def main():
     parser.add_argument('-s', "--samples",
                         help="specifies the number of pixel samples for correlational analysis. Default is 1000",
                         type=int, default=1000)
+    parser.add_argument("--sampling", choices=SAMPLING_MODES, default='first',
+                        help="specifies how the pixel pairs of the correlational analysis are sampled, first takes the first pairs "
+                             "of the frame, uniform and stratified draw them at random across the frame, exhaustive uses every pair. "
+                             "Default is first")
+    parser.add_argument("--seed",
+                        help="specifies the seed of the uniform and stratified sampling",
+                        type=int)
     parser.add_argument('-f', "--frames",
                         help="specifies the number of frames. Default is 50",
                         type=int, default=50)
@@ -77,6 +102,9 @@ def main():
     parser.add_argument("--dtime",
                         help="specifies the decrypt time file to be stored on the csv file",
                         type=str)
+    parser.add_argument("--workers",
+                        help="specifies the number of processes encrypting the frames of the differential analysis, 0 uses all cores. Default is 1",
+                        type=int, default=1)
     parser.add_argument("-v", "--verbose", action="store_true",
                         help="Enables verbose during analysis")
 
@@ -87,7 +115,7 @@ def main():
     entropy_field  = ["Entropy(R)", "Entropy(G)", "Entropy(B)", "Entropy(Combined)"]
     entropy_field_e  = ["Entropy(R)_e", "Entropy(G)_e", "Entropy(B)_e", "Entropy(Combined)_e"]
     differential_field = ["NPCR", "UACI"]
-    psnr_field = ["MSE", "PSNR"]
+    psnr_field = ["MSE", "PSNR", "SSIM"]
 
     fields = ["Frame"]
 
@@ -135,7 +163,7 @@ def main():
         #modules initialization
         fish_enc = Encrypt()
         cos_enc = Encrypt_cosine()
-        corr = Correlation()
+        corr = Correlation(args.sampling, args.seed)
         diff = Differential()
         enc_quality = EncryptionQuality()
         requires_encrypted_list = ['differential', 'all']
@@ -146,13 +174,13 @@ def main():
         ret, frame = None, None
         ret_e, frame_e = None, None
         ret_d, frame_d = None, None
-        #Video Capture initialization
-        cap = cv2.VideoCapture(args.video, cv2.CAP_FFMPEG)
+        #Video Capture initialization, the backend is chosen from the path (OpenCV for videos)
+        cap = openSource(args.video)
         if args.encrypted != None:
-            cap_encrypted = cv2.VideoCapture(args.encrypted, cv2.CAP_FFMPEG)
+            cap_encrypted = openSource(args.encrypted)
         
         if args.decrypted != None:
-            cap_decrypted = cv2.VideoCapture(args.decrypted, cv2.CAP_FFMPEG)
+            cap_decrypted = openSource(args.decrypted)
 
 
         mean_field = {"Frame": "Mean"}
@@ -164,27 +192,22 @@ def main():
             mean_field[i] = []
             total_field[i] = 0                                      
         
-        for i in range(args.frames):
-            
-            row_field = {"Frame": i}
-            ret, frame = cap.read()
-            
-            if not ret:
-                print("[DONE] Analyzation Completed Successfully")
-                break
+        frames = read_frames(args.frames, cap, cap_encrypted, cap_decrypted)
 
-            if args.encrypted != None:
-                ret_e, frame_e = cap_encrypted.read()
-            if args.decrypted != None:
-                ret_d, frame_d = cap_decrypted.read()
+        # the differential analysis encrypts the frames ahead of the rows on the worker processes
+        if args.mode  == 'differential'  or args.mode  == 'all' or args.mode == 'encryption':
+            frames = diff.get_differential_frames(frames, args.type, args.workers)
+        else:
+            frames = ((frame, record, None, None) for frame, record in frames)
 
+        for frame, (i, frame_e, frame_d), npcr_list, uaci_list in frames:
             
+            row_field = {"Frame": i}
 
             if args.mode == 'correlational' or args.mode  == 'all' or args.mode == 'encryption':
                 if args.verbose : print(f"[Frame {i}] Analyzing Correlation")
-                cc_d = np.array(corr.get_corr_diag(frame, args.samples))
-                cc_h = np.array(corr.get_corr_horizontal(frame, args.samples))
-                cc_v = np.array(corr.get_corr_vertical(frame, args.samples))
+                cc = corr.get_corr_frame(frame, args.samples)
+                cc_d, cc_h, cc_v = np.array(cc['diagonal']), np.array(cc['horizontal']), np.array(cc['vertical'])
                 row_field["CC_d"] = np.mean(cc_d)
                 row_field["CC_h"] = np.mean(cc_h)
                 row_field["CC_v"] = np.mean(cc_v)
@@ -199,9 +222,8 @@ def main():
                 
 
                 if  args.encrypted != None:
-                    cc_d_e = np.array(corr.get_corr_diag(frame_e, args.samples))
-                    cc_h_e = np.array(corr.get_corr_horizontal(frame_e, args.samples))
-                    cc_v_e = np.array(corr.get_corr_vertical(frame_e, args.samples))
+                    cc_e = corr.get_corr_frame(frame_e, args.samples)
+                    cc_d_e, cc_h_e, cc_v_e = np.array(cc_e['diagonal']), np.array(cc_e['horizontal']), np.array(cc_e['vertical'])
                     row_field["CC_d_e"] = np.mean(cc_d_e)
                     row_field["CC_h_e"] = np.mean(cc_h_e)
                     row_field["CC_v_e"] = np.mean(cc_v_e)
@@ -216,11 +238,9 @@ def main():
                     
             if args.mode  == 'differential'  or args.mode  == 'all' or args.mode == 'encryption':
                 if args.verbose : print(f"[Frame {i}] Differential Analysis")
-                attacked_frame = diff.attack_pixel(frame.copy(), args.type)
-                frame_width_e = len(frame_e[0])
-                frame_height_e = len(frame_e)
-                npcr = np.mean(diff.get_npcr(frame_e, attacked_frame, frame_width_e, frame_height_e))
-                uaci = np.mean(diff.get_uaci(frame_e, attacked_frame, frame_width_e, frame_height_e))
+                # the frame and its attacked copy were encrypted under the same key, so only the pixel differs
+                npcr = np.mean(npcr_list)
+                uaci = np.mean(uaci_list)
                 row_field['NPCR'] = npcr
                 row_field['UACI'] = uaci
                 
@@ -231,49 +251,53 @@ def main():
                 mean_field['UACI'] += [uaci]
             if args.mode == 'entropy' or args.mode  == 'all' or args.mode == 'encryption':
                 if args.verbose : print(f"[Frame {i}] Analyzing Entropy")
-                B_o, G_o, R_o = cv2.split(frame.copy())
+                # the histograms of a frame are computed once, every entropy value is derived from them
+                entropy_b, entropy_g, entropy_r, entropy_combined = enc_quality.get_histogram(frame).get_entropies()
                 row_field['Entropy(B)'],  row_field['Entropy(G)'], row_field['Entropy(R)'], row_field['Entropy(Combined)'] = \
-                      enc_quality.get_entropy(B_o), enc_quality.get_entropy(G_o), enc_quality.get_entropy(R_o), enc_quality.get_entropy(frame)
+                      entropy_b, entropy_g, entropy_r, entropy_combined
 
-                total_field['Entropy(B)'] += enc_quality.get_entropy(B_o)
-                total_field['Entropy(G)'] += enc_quality.get_entropy(G_o)
-                total_field['Entropy(R)'] += enc_quality.get_entropy(R_o)
-                total_field['Entropy(Combined)'] += enc_quality.get_entropy(frame)
+                total_field['Entropy(B)'] += entropy_b
+                total_field['Entropy(G)'] += entropy_g
+                total_field['Entropy(R)'] += entropy_r
+                total_field['Entropy(Combined)'] += entropy_combined
 
-                mean_field['Entropy(B)'] += [enc_quality.get_entropy(B_o)]
-                mean_field['Entropy(G)'] += [enc_quality.get_entropy(G_o)]
-                mean_field['Entropy(R)'] += [enc_quality.get_entropy(R_o)]
-                mean_field['Entropy(Combined)'] += [enc_quality.get_entropy(frame)] 
+                mean_field['Entropy(B)'] += [entropy_b]
+                mean_field['Entropy(G)'] += [entropy_g]
+                mean_field['Entropy(R)'] += [entropy_r]
+                mean_field['Entropy(Combined)'] += [entropy_combined]
                 
                 if args.encrypted != None:
-                    B_e, G_e, R_e = cv2.split(frame_e.copy())
+                    entropy_b_e, entropy_g_e, entropy_r_e, entropy_combined_e = enc_quality.get_histogram(frame_e).get_entropies()
                     row_field['Entropy(B)_e'],  row_field['Entropy(G)_e'], row_field['Entropy(R)_e'], row_field["Entropy(Combined)_e"] = \
-                        enc_quality.get_entropy(B_e), enc_quality.get_entropy(G_e), enc_quality.get_entropy(R_e), enc_quality.get_entropy(frame_e)
+                        entropy_b_e, entropy_g_e, entropy_r_e, entropy_combined_e
 
-                    total_field['Entropy(B)_e'] += enc_quality.get_entropy(B_e)
-                    total_field['Entropy(G)_e'] += enc_quality.get_entropy(G_e)
-                    total_field['Entropy(R)_e'] += enc_quality.get_entropy(R_e)
-                    total_field['Entropy(Combined)_e'] += enc_quality.get_entropy(frame_e)
+                    total_field['Entropy(B)_e'] += entropy_b_e
+                    total_field['Entropy(G)_e'] += entropy_g_e
+                    total_field['Entropy(R)_e'] += entropy_r_e
+                    total_field['Entropy(Combined)_e'] += entropy_combined_e
 
-                    mean_field['Entropy(B)_e'] += [enc_quality.get_entropy(B_e)]
-                    mean_field['Entropy(G)_e'] += [enc_quality.get_entropy(G_e)]
-                    mean_field['Entropy(R)_e'] += [enc_quality.get_entropy(R_e)]
-                    mean_field['Entropy(Combined)_e'] += [enc_quality.get_entropy(frame_e)]
+                    mean_field['Entropy(B)_e'] += [entropy_b_e]
+                    mean_field['Entropy(G)_e'] += [entropy_g_e]
+                    mean_field['Entropy(R)_e'] += [entropy_r_e]
+                    mean_field['Entropy(Combined)_e'] += [entropy_combined_e]
 
             if args.mode == 'psnr' or args.mode  == 'all' :
                 if args.verbose : print(f"[Frame {i}] Analyzing PSNR")
 
-                mse = enc_quality.get_mse(frame, frame_d)
-                psnr = enc_quality.get_psnr(frame, frame_d)
+                # MSE and PSNR come from one difference of the frames, the buffers are reused across frames
+                mse, psnr, ssim = enc_quality.get_quality(frame, frame_d)
 
                 row_field['MSE'] = mse
                 row_field['PSNR'] = psnr
+                row_field['SSIM'] = ssim
 
                 total_field['MSE'] +=  mse
                 total_field['PSNR'] += psnr
+                total_field['SSIM'] += ssim
 
                 mean_field['MSE'] += [mse]
                 mean_field['PSNR'] += [psnr]
+                mean_field['SSIM'] += [ssim]
 
             if args.etime != None:
                 with open(args.etime, 'r') as t:
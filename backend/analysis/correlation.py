@@ -6,42 +6,58 @@ Functions:
 
 Public Functions:
 
-1. get_corellation_vid (self, sample : int, frame_count) 
+1. get_corellation_vid (self, sample : int, frame_count)
     - Analyzes the correlation of each frame per pixel. Returns a list containing the correlation of pixel values per frame
 
-2. get_corr_diag(self, frame, sample: int):
+2. get_corr_diag(self, frame, sample: int, sampling=None):
     - Calculates the correlation of each pixel with its diagonal neighbor inside the frame. Returns the correlation (R) value
+    of every channel
 
-3. get_corr_horizontal(self, frame, sample : int):
+3. get_corr_horizontal(self, frame, sample : int, sampling=None):
     - Calculates the correlation of each pixel with its horizontal neighbor inside the frame. Returns the correlation (R) value
+    of every channel
 
-4. get_corr_vertical(self, frame, sample : int):
+4. get_corr_vertical(self, frame, sample : int, sampling=None):
     - Calculates the correlation of each pixel with its vertical neighbor inside the frame. Returns the correlation (R) value
+    of every channel
+
+5. get_corr_frame(self, frame, sample : int, sampling=None):
+    - Calculates the three correlations of the frame in one call. Returns {"diagonal": [...], "horizontal": [...], "vertical": [...]}
+    with the correlation (R) value of every channel
+
+Sampling:
+    - The neighbour pairs are slices of the frame, 'sample' pairs are taken per channel with one of SAMPLING_MODES:
+    'first' the first pairs in the order of the original pixel loops (column by column for horizontal, row by row for
+    vertical, along the anti-diagonals for diagonal), 'uniform' pairs drawn at random, 'stratified' one random pair
+    from each of 'sample' equal parts of the frame and 'exhaustive' every pair of the frame.
+    - The sampling mode and the seed of the random modes are set on the Correlation object, 'sampling' overrides the mode.
+    - Frames without any variation in a channel give a NaN coefficient for that channel.
 
 Private Functions:
 
-1. _E(self, x: list):
+1. _E(self, x):
     - Used in calculating the R value
 
-2. _D(self, x: list):
+2. _D(self, x):
     - Used in calculating the R value
 
-3. _covariance(self, x: list, y: list):
+3. _covariance(self, x, y):
     - Used in calculating the R value
 
-4. _R(self, x: list, y: list):
-    - returns the R or the correlation coefficient value.
+4. _R(self, x, y):
+    - returns the R or the correlation coefficient value of every channel.
 
 Variables:
 ----------
 
-No global variables are used for this script
+SAMPLING_MODES: the sampling modes of the pixel pairs
+CORRELATION_DIRECTIONS: the neighbour directions of get_corr_frame
 
 Dependencies:
 -------------
 
 - OpenCV
-- Built-in modules: "math"
+- NumPy
 
 Code Author: Roel Castro
 Date Created: 09/15/2022
@@ -50,106 +66,115 @@ Date Modified: 09/15/2022
 """
 
 import cv2
-import math
+import numpy as np
+
+SAMPLING_MODES = ('first', 'uniform', 'stratified', 'exhaustive')
+CORRELATION_DIRECTIONS = ('diagonal', 'horizontal', 'vertical')
 
 class Correlation:
 
-    def _E(self, x: list):
-        temp = 1 / len(x)
-        temp2 = 0
+    def __init__(self, sampling='first', seed=None):
+        if sampling not in SAMPLING_MODES:
+            raise ValueError(f"Unknown sampling mode: {sampling}")
 
-        for val in x:
-            temp2 += val
+        self.sampling = sampling
+        self.rng = np.random.default_rng(seed)
 
-        return temp * temp2
+    # x and y are (pairs, channels) arrays, every function works on all channels at once
 
-    def _D(self, x: list):
-        e = self._E(x)
-        temp = 1 / len(x)
-        temp2 = 0
+    def _E(self, x):
+        return np.mean(x, axis=0)
 
-        for val in x:
-            temp2 += (val - e) ** 2
+    def _D(self, x):
+        return np.mean((x - self._E(x)) ** 2, axis=0)
 
-        return temp * temp2
+    def _covariance(self, x, y):
+        return np.mean((x - self._E(x)) * (y - self._E(y)), axis=0)
 
-    def _covariance(self, x: list, y: list):
-        temp = 1 / len(x)
-        e_x = self._E(x)
-        e_y = self._E(y)
+    def _R(self, x, y):
+        x = x.astype(np.float64)
+        y = y.astype(np.float64)
 
-        temp2 = 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (self._covariance(x, y) / np.sqrt(self._D(x) * self._D(y))).tolist()
 
-        for i in range(len(x)):
-            val_x = x[i] - e_x
-            val_y = y[i] - e_y
-            temp2 += val_x * val_y
+    # neighbour pairs of every pixel as two views of the same shape
+    def _pair_views(self, frame, direction):
+        if direction == 'diagonal':
+            return frame[:-1, :-1], frame[1:, 1:]
+        if direction == 'horizontal':
+            return frame[:, :-1], frame[:, 1:]
+        if direction == 'vertical':
+            return frame[:-1], frame[1:]
 
-        return temp * temp2
+        raise ValueError(f"Unknown correlation direction: {direction}")
 
-    def _R(self, x: list, y: list):
-        temp1 = self._covariance(x, y)
-        temp2 = math.sqrt(self._D(x) * self._D(y))
-        return  temp1 / temp2
-    
+    # coordinates (y1, x1, y2, x2) of the first n pairs in the order of the original pixel loops
+    def _first_coordinates(self, frame_height, frame_width, direction, n):
+        if direction == 'horizontal':
+            k = np.arange(min(n, max(frame_width - 2, 0) * max(frame_height - 1, 0)))
+            j, i = k % max(frame_height - 1, 1), k // max(frame_height - 1, 1)
+            return j, i, j, i + 1
 
-    def get_corr_diag(self, frame, sample: int):
-        n = sample
+        if direction == 'vertical':
+            k = np.arange(min(n, max(frame_height - 2, 0) * max(frame_width - 1, 0)))
+            j, i = k // max(frame_width - 1, 1), k % max(frame_width - 1, 1)
+            return j, i, j + 1, i
 
-        frame_width = len(frame[0])
-        frame_height = len(frame)
+        # anti-diagonals starting on the top row, then the ones starting on the second to last column
+        y1, x1 = [], []
+        count = 0
+        for i in range(frame_width - 2):
+            if count >= n:
+                break
+            k = np.arange(min(i, frame_height - 3) + 1)
+            y1.append(k)
+            x1.append(i - k)
+            count += len(k)
 
-        pixel_x = []
-        pixel_y = []
-        corr = []
+        for j in range(1, frame_height - 2):
+            if count >= n:
+                break
+            # the walks stop at the left edge instead of wrapping around to the right side of the frame
+            k = np.arange(max(min(frame_height - 1 - j, frame_width - 1), 0))
+            y1.append(j + k)
+            x1.append(frame_width - 2 - k)
+            count += len(k)
 
-        for c in range(3):
+        y1 = np.concatenate(y1 or [np.empty(0, dtype=int)])[:n]
+        x1 = np.concatenate(x1 or [np.empty(0, dtype=int)])[:n]
+        return y1, x1, y1 + 1, x1 + 1
 
-            for i in range(0, frame_width-2):
-                if n <= 0:
-                    break
-                x1 = i
-                y1 = 0
-                x2 = i + 1
-                y2 = 1                
-                while x1 >= 0 and y2 < frame_height - 1:
-                    if n <= 0:
-                        break
+    # sampled pairs of a direction, returns two (pairs, channels) arrays
+    def _sample_pairs(self, frame, sample, direction, sampling):
+        if frame.ndim == 2:
+            frame = frame[:, :, np.newaxis]
 
-                    pixel_x.append(frame[y1][x1][c].item() + 0.1)
-                    pixel_y.append(frame[y2][x2][c].item() + 0.1)
+        channels = frame.shape[2]
 
-                    x1 -= 1
-                    x2 -= 1
-                    y1 += 1
-                    y2 += 1
-                    n -= 1
+        if sampling == 'first':
+            y1, x1, y2, x2 = self._first_coordinates(frame.shape[0], frame.shape[1], direction, sample)
+            return frame[y1, x1], frame[y2, x2]
 
-            
-            for j in range (1, frame_height-2):
-                
-                if n <= 0:
-                    break
+        view_x, view_y = self._pair_views(frame, direction)
+        if sampling == 'exhaustive':
+            return view_x.reshape(-1, channels), view_y.reshape(-1, channels)
 
-                x1 = frame_width-2
-                y1 = j
-                x2 = frame_width-1
-                y2 = j + 1
+        rows, cols = view_x.shape[:2]
+        total = rows * cols
+        n = min(sample, total)
 
-                while y2 < frame_height:
-                    if n <= 0:
-                        break
-                    pixel_x.append(frame[y1][x1][c].item() + 0.1)
-                    pixel_y.append(frame[y2][x2][c].item() + 0.1)
+        if sampling == 'uniform':
+            index = self.rng.choice(total, size=n, replace=False)
+        elif sampling == 'stratified':
+            index = ((np.arange(n) + self.rng.random(n)) * (total / n)).astype(np.int64) if n else np.arange(0)
+        else:
+            raise ValueError(f"Unknown sampling mode: {sampling}")
 
-                    x1 -= 1
-                    x2 -= 1
-                    y1 += 1
-                    y2 += 1
-                    n -= 1
+        return view_x[index // cols, index % cols], view_y[index // cols, index % cols]
 
-            corr.append(self._R(pixel_x, pixel_y))
-        return corr
+    def get_corr_diag(self, frame, sample: int, sampling=None):
+        return self._R(*self._sample_pairs(frame, sample, 'diagonal', sampling or self.sampling))
 
 
 
@@ -174,78 +199,30 @@ class Correlation:
             cc_h.append(self.get_corr_horizontal(frame, sample))
             cc_v.append(self.get_corr_vertical(frame, sample))
             n -= 1
-        
+
         return {"cc_d": cc_d, "cc_v": cc_v, "cc_h": cc_h}
-        
-    
-    def get_corr_horizontal(self, frame, sample : int):
-
-        corr = []
-        frame_width = len(frame[0])
-        frame_height = len(frame)
-
-        for c in range(3):
-
-            n = sample
-            pixel_x = []
-            pixel_y = []
-
-            for i in range(frame_width - 2):
-                if n <= 0:
-                    break
-                for j in range (frame_height - 1):
-                    if n <= 0:
-                        break
-                    pixel_x.append(frame[j][i][c].item() + 0.1)
-                    pixel_y.append(frame[j][i+1][c].item() + 0.1)
-                    n -= 1
-            
-            corr.append(self._R(pixel_x, pixel_y))
-
-        return corr
-    
-    def get_corr_vertical(self, frame, sample : int):
-
-        corr = []
-
-        frame_width = len(frame[0])
-        frame_height = len(frame)
-        
-        for c in range(3):
-            
-            n = sample
-            pixel_x = []
-            pixel_y = []
-
-            for j in range(frame_height - 2):
-                if n <= 0:
-                    break
-                for i in range (frame_width - 1):
-                    if n <= 0:
-                        break
-                    pixel_x.append(frame[j][i][c].item() + 0.1)
-                    pixel_y.append(frame[j+1][i][c].item() + 0.1)
-                    n -= 1
-            
-            corr.append(self._R(pixel_x, pixel_y))
-
-        return corr
+
+
+    def get_corr_horizontal(self, frame, sample : int, sampling=None):
+        return self._R(*self._sample_pairs(frame, sample, 'horizontal', sampling or self.sampling))
+
+    def get_corr_vertical(self, frame, sample : int, sampling=None):
+        return self._R(*self._sample_pairs(frame, sample, 'vertical', sampling or self.sampling))
+
+    def get_corr_frame(self, frame, sample : int, sampling=None):
+        return {direction: self._R(*self._sample_pairs(frame, sample, direction, sampling or self.sampling))
+                for direction in CORRELATION_DIRECTIONS}
 
 if  __name__ == "__main__":
     corr = Correlation()
 
     filepath = "/home/roel/Documents/code_projects/Medicrypt-App/backend/test_encrypt.avi"
-    
+
     cap = cv2.VideoCapture(filepath, cv2.CAP_FFMPEG)
 
     ret, frame = cap.read()
 
     if not ret:
         print("Error opening video stream or file")
-    
-    print(corr.get_corr_diag(frame, 1000))
-    
-
-
-
 
+    print(corr.get_corr_diag(frame, 1000))
@@ -6,26 +6,53 @@ Functions:
 
 Public Functions:
 
-1. get_npcr(self, frame_1, frame_2, width, height):
-    - returns the number of pixel change rate (NPCR) between two frames.
+1. get_npcr(self, frame_1, frame_2, width=None, height=None, per_channel=True):
+    - returns the number of pixel change rate (NPCR) between two frames, a list with the NPCR of every channel or
+    the NPCR of the whole frame if 'per_channel' is False.
 
-2. get_uaci(self, frame1, frame2, width, height):
-    - returns the unified average changing intensity (UACI) between two frames.
+2. get_uaci(self, frame1, frame2, width=None, height=None, per_channel=True):
+    - returns the unified average changing intensity (UACI) between two frames, a list with the UACI of every channel or
+    the UACI of the whole frame if 'per_channel' is False.
+    - both are computed from one int16 difference of the frames, 'width' and 'height' limit the analysis to the
+    top left width x height pixels and default to the whole frame.
 
-3. attack_pixel(self, frame, type : str):
+3. attack_pixel(self, frame, type : str, key=None):
     - modifies a single pixel in the frame and encrypts it given the encryption type. returns the attacked frame
+    - 'key' is the CosinePlan of a 3d-cosine encryption, the attacked frame is then encrypted with the same seeds.
+    fisher-yates derives its key from the frame itself, so it takes no key.
 
+4. encrypt_pair(self, frame, type : str):
+    - encrypts the frame and its attacked copy under the same key, 3d-cosine generates its chaotic sequences
+    only once for both. returns (encrypted frame, encrypted attacked frame)
+
+5. get_differential_frames(self, frames, type : str, workers=1):
+    - runs the differential analysis of every frame, 'frames' yields (frame, record). The pairs of the frames are
+    encrypted on 'workers' processes (0 uses every core) and yielded in frame order as (frame, record, npcr, uaci)
+    with the NPCR and UACI of every channel
+    - the encryption engines are created once per process and reused for every frame
+
+Private Functions:
+
+1. _difference(self, frame_1, frame_2, width=None, height=None):
+    - returns the absolute difference of the frames as an int16 (channels, pixels) array
+
+2. _engine(self, type : str):
+    - returns the reused encryption engine of the type
+
+3. _differential_job(frame, type):
+    - job of the worker processes, returns the NPCR and UACI of every channel of the frame
 
 Variables:
 ----------
 
-No global variables are used for this script
+ENCRYPTION_TYPES: the encryption types of the differential analysis
 
 Dependencies:
 -------------
 
 - OpenCV
-- Built-in modules: "math"
+- frame_executor.py for the worker processes
+- Built-in modules: "math", "collections", "functools"
 
 Code Author: Roel Castro
 Date Created: 9/21/2024
@@ -39,37 +66,52 @@ sys.path.append(str(Path(__file__).resolve().parent.parent))
 
 from backend.algorithms.fisher_yates import Encrypt
 from backend.algorithms._3d_cosine import Encrypt_cosine
+from backend.utils.frame_executor import FrameExecutor
+from collections import deque
+from functools import partial
 
 import cv2
 import numpy as np
 
+ENCRYPTION_TYPES = ('fisher-yates', '3d-cosine')
+
 class Differential:
 
-    def get_npcr(self, frame_1, frame_2, width, height):
+    def __init__(self):
+        self._engines = {}
 
-        npcr_list = []
-        for c in range(3):
-            diff = np.sum(frame_1 != frame_2)
-            total_pixels = frame_1.size
-            npcr_list.append((diff/ total_pixels) * 100)
-            
-        return npcr_list
+    # absolute difference of the frames as an int16 (channels, pixels) array, the channels are planes so every
+    # channel is reduced over contiguous memory. 'width' and 'height' limit it to the top left of the frames
+    def _difference(self, frame_1, frame_2, width=None, height=None):
+        frame_1 = np.asarray(frame_1)[:height, :width]
+        frame_2 = np.asarray(frame_2)[:height, :width]
 
+        if frame_1.ndim == 2:
+            frame_1, frame_2 = frame_1[:, :, np.newaxis], frame_2[:, :, np.newaxis]
 
-    def get_uaci(self, frame1, frame2, width, height):
-        temp1 = 1 / (width * height)
-        
-        uaci_list = []
-        for c in range(3):
-            temp2 = 0
-            for i in range(width - 1):
-                for j in range(height - 1):
-                    temp2 += (abs(frame1[j][i][c].item() - frame2[j][i][c].item()) / 255) * 100
-            uaci_list.append(temp1 * temp2)
+        diff = np.empty((frame_1.shape[2], frame_1.shape[0], frame_1.shape[1]), dtype=np.int16)
+        np.subtract(frame_1.transpose(2, 0, 1), frame_2.transpose(2, 0, 1), out=diff, dtype=np.int16)
+        np.abs(diff, out=diff)
+
+        return diff.reshape(len(diff), -1)
+
+    def get_npcr(self, frame_1, frame_2, width=None, height=None, per_channel=True):
+        diff = self._difference(frame_1, frame_2, width, height)
+
+        if not per_channel:
+            return np.count_nonzero(diff) / diff.size * 100
+
+        return (np.count_nonzero(diff, axis=1) / diff.shape[1] * 100).tolist()
+
+    def get_uaci(self, frame1, frame2, width=None, height=None, per_channel=True):
+        diff = self._difference(frame1, frame2, width, height)
+
+        if not per_channel:
+            return np.sum(diff, dtype=np.int64) / (diff.size * 255) * 100
 
-        return uaci_list
-    
-    def attack_pixel(self, frame, type : str):
+        return (np.sum(diff, axis=1, dtype=np.int64) / (diff.shape[1] * 255) * 100).tolist()
+
+    def attack_pixel(self, frame, type : str, key=None):
 
         frame_width = len(frame[0])
         frame_height = len(frame)
@@ -77,16 +119,64 @@ class Differential:
         for c in range(3):
             i, j = frame_width // 3, frame_height // 3
             frame[j][i][c] = frame[j][i][c].astype(float) + 1
-            e_frame, enc_node = None, None
+            e_frame = None
             
             if type == "fisher-yates": 
-                enc_node = Encrypt()
-                e_frame, hash = enc_node.encryptFrame(frame)
+                e_frame, hash = self._engine(type).encryptFrame(frame)
                 
             elif type == "3d-cosine":
-                enc_node = Encrypt_cosine()
-                e_frame, perm_seed, diff_seed = enc_node.encryptFrame(frame)
+                e_frame, perm_seed, diff_seed = self._engine(type).encryptFrame(frame, plan=key)
             else:
                 raise ValueError("Invalid encryption type")
             return e_frame
-        
+
+    def encrypt_pair(self, frame, type : str):
+
+        if type == "fisher-yates":
+            e_frame, hash = self._engine(type).encryptFrame(frame)
+            return e_frame, self.attack_pixel(frame.copy(), type)
+
+        elif type == "3d-cosine":
+            enc_node = self._engine(type)
+            plan = enc_node.createPlan(len(frame), len(frame[0]))
+            e_frame, perm_seed, diff_seed = enc_node.encryptFrame(frame, plan=plan)
+            return e_frame, self.attack_pixel(frame.copy(), type, key=plan)
+
+        raise ValueError("Invalid encryption type")
+
+    def get_differential_frames(self, frames, type : str, workers=1):
+        if type not in ENCRYPTION_TYPES:
+            raise ValueError("Invalid encryption type")
+
+        pending = deque()
+
+        def _frames():
+            for frame, record in frames:
+                pending.append((frame, record))
+                yield frame
+
+        # the frames of the window are encrypted concurrently, the results come back in frame order
+        for npcr, uaci in FrameExecutor(workers).map(partial(_differential_job, type=type), _frames()):
+            frame, record = pending.popleft()
+            yield frame, record, npcr, uaci
+
+    # the engines are thread-safe, one instance of each is reused for every frame
+    def _engine(self, type : str):
+        if type not in self._engines:
+            self._engines[type] = Encrypt() if type == "fisher-yates" else Encrypt_cosine()
+
+        return self._engines[type]
+
+
+# Differential of the worker process, created by its first job so the engines are reused across frames
+_WORKER_DIFFERENTIAL = None
+
+# Encrypts the frame and its attacked copy, returns the NPCR and UACI of every channel
+def _differential_job(frame, type):
+    global _WORKER_DIFFERENTIAL
+    if _WORKER_DIFFERENTIAL is None:
+        _WORKER_DIFFERENTIAL = Differential()
+
+    encrypted_frame, attacked_frame = _WORKER_DIFFERENTIAL.encrypt_pair(frame, type)
+    return _WORKER_DIFFERENTIAL.get_npcr(encrypted_frame, attacked_frame), \
+        _WORKER_DIFFERENTIAL.get_uaci(encrypted_frame, attacked_frame)
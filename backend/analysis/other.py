@@ -6,25 +6,54 @@ Functions:
 
 Public Functions:
 
-1. get_psnr(self, o_frame, e_frame):
-    - Returns the PSNR between the original and decrypted frame.
+1. get_psnr(self, o_frame, e_frame, per_channel=False):
+    - Returns the PSNR between the original and decrypted frame, a list with the PSNR of every channel if 'per_channel' is True.
 
-2. get_mse(self, frame1, frame2):
-    - returns the Mean squared error (MSE) between the original and decrypted frame.
+2. get_mse(self, frame1, frame2, per_channel=False):
+    - returns the Mean squared error (MSE) between the original and decrypted frame, with the pixel values scaled
+    to [0, 1]. a list with the MSE of every channel if 'per_channel' is True.
 
 3. get_entropy(self, frame):
     - returns the entropy value of a frame
 
+4. get_histogram(self, frame):
+    - returns the FrameHistogram of a frame, the histograms are computed once and every histogram-based metric of the
+    frame is derived from it
+
+5. get_ssim(self, o_frame, d_frame, per_channel=False):
+    - returns the mean structural similarity (SSIM) between the original and decrypted frame, the local means,
+    variances and covariance are box filters over SSIM_WINDOW x SSIM_WINDOW pixels.
+
+6. get_quality(self, o_frame, d_frame, per_channel=False, ssim=True):
+    - returns (MSE, PSNR, SSIM) of the frames in one call, the MSE and PSNR of every channel come from one int16
+    difference of the frames. The SSIM is None if 'ssim' is False
+    - the kernels reuse their buffers across frames of the same size, an EncryptionQuality is for one thread
+
+Private Functions:
+
+1. _planes(self, o_frame, d_frame): returns the frames as (height, width, channels) arrays
+2. _buffer(self, name, shape, dtype): returns the reused buffer of a kernel
+3. _squared_errors(self, o_frame, d_frame): returns the sum of the squared differences of every channel
+4. _ssim(self, o_frame, d_frame): returns the mean SSIM of every channel
+
+FrameHistogram(frame):
+    - 256-bin histograms of every channel of a frame, one bincount per channel plane so every pixel is read once,
+    the combined histogram is the sum of the channel histograms
+    - get_entropy(self, channel=None): returns the entropy of a channel (0 is B for OpenCV frames), or of the whole
+    frame when 'channel' is None
+    - get_entropies(self): returns [entropy of every channel, ..., combined entropy]
+
 
 Variables:
 ----------
 
-No global variables are used for this script
+HISTOGRAM_BINS: the number of bins of the histograms
+SSIM_WINDOW: the side of the box filter window of the SSIM
+SSIM_C1, SSIM_C2: the stabilizing constants of the SSIM
 
 Dependencies:
 -------------
 
-- Scipy
 - Numpy
 - OpenCV
 - Built-in modules: "sys"
@@ -39,26 +68,151 @@ import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
-from scipy.stats import entropy
 import numpy as np
 import cv2
 
+HISTOGRAM_BINS = 256
+
+# Window of the box filters and stabilizing constants (0.01 * 255)^2 and (0.03 * 255)^2 of the SSIM
+SSIM_WINDOW = 7
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+class FrameHistogram:
+
+    def __init__(self, frame):
+        frame = np.asarray(frame)
+        planes = frame[:, :, np.newaxis] if frame.ndim == 2 else frame
+
+        self.channels = np.stack([np.bincount(planes[:, :, c].ravel(), minlength=HISTOGRAM_BINS)
+                                  for c in range(planes.shape[2])])
+        self.combined = self.channels.sum(axis=0)
+
+    # Shannon entropy in bits of a histogram
+    def _entropy(self, hist):
+        prob_dist = hist[hist > 0] / hist.sum()
+        return float(-np.sum(prob_dist * np.log2(prob_dist)))
+
+    def get_entropy(self, channel=None):
+        return self._entropy(self.combined if channel is None else self.channels[channel])
+
+    def get_entropies(self):
+        return [self._entropy(hist) for hist in self.channels] + [self._entropy(self.combined)]
+
 class EncryptionQuality:
 
-    def get_psnr(self, o_frame, e_frame):
-        return cv2.PSNR(o_frame, e_frame, 255)
+    # the buffers of the quality kernels are reused across frames of the same size, use one instance per thread
+    def __init__(self):
+        self._buffers = {}
+
+    def get_psnr(self, o_frame, e_frame, per_channel=False):
+        return self.get_quality(o_frame, e_frame, per_channel, ssim=False)[1]
     
-    def get_mse(self, frame1, frame2):
-        return np.mean((frame1.astype(np.float64) / 255 - frame2.astype(np.float64) / 255) ** 2)
+    def get_mse(self, frame1, frame2, per_channel=False):
+        return self.get_quality(frame1, frame2, per_channel, ssim=False)[0]
+
+    def get_ssim(self, o_frame, d_frame, per_channel=False):
+        ssim = self._ssim(*self._planes(o_frame, d_frame))
+        return ssim if per_channel else float(np.mean(ssim))
+
+    def get_quality(self, o_frame, d_frame, per_channel=False, ssim=True):
+        o_frame, d_frame = self._planes(o_frame, d_frame)
+        squared_errors = self._squared_errors(o_frame, d_frame)
+        pixels = o_frame.shape[0] * o_frame.shape[1]
+
+        if not per_channel:
+            squared_errors, pixels = np.array([squared_errors.sum()]), pixels * len(squared_errors)
+
+        # MSE of the pixel values scaled to [0, 1], PSNR on the 0-255 scale like cv2.PSNR
+        mse = squared_errors / (pixels * 255 ** 2)
+        psnr = 20 * np.log10(255 / (np.sqrt(squared_errors / pixels) + np.finfo(np.float64).eps))
+        ssim_values = self._ssim(o_frame, d_frame) if ssim else None
+
+        if per_channel:
+            return mse.tolist(), psnr.tolist(), ssim_values
+
+        return float(mse[0]), float(psnr[0]), float(np.mean(ssim_values)) if ssim else None
+
+    # Frames as (height, width, channels) arrays
+    def _planes(self, o_frame, d_frame):
+        o_frame, d_frame = np.asarray(o_frame), np.asarray(d_frame)
+
+        if o_frame.shape != d_frame.shape:
+            raise ValueError(f"The frames must have the same shape, got {o_frame.shape} and {d_frame.shape}")
+
+        if o_frame.ndim == 2:
+            return o_frame[:, :, np.newaxis], d_frame[:, :, np.newaxis]
+
+        return o_frame, d_frame
+
+    # Buffer of the kernels, reallocated only when the frame size changes
+    def _buffer(self, name, shape, dtype):
+        buffer = self._buffers.get(name)
+
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = self._buffers[name] = np.empty(shape, dtype=dtype)
+
+        return buffer
+
+    # Sum of the squared differences of every channel from one int16 difference of the frames
+    def _squared_errors(self, o_frame, d_frame):
+        channels = o_frame.shape[2]
+
+        diff = self._buffer("diff", (channels, o_frame.shape[0], o_frame.shape[1]), np.int16)
+        np.subtract(o_frame.transpose(2, 0, 1), d_frame.transpose(2, 0, 1), out=diff, dtype=np.int16)
+        diff = diff.reshape(channels, -1)
+
+        return np.einsum('ij,ij->i', diff, diff, dtype=np.int64)
+
+    # Mean SSIM of every channel, the local statistics are box filter means over SSIM_WINDOW x SSIM_WINDOW pixels
+    def _ssim(self, o_frame, d_frame):
+        shape = o_frame.shape
+        x, y = self._buffer("x", shape, np.float32), self._buffer("y", shape, np.float32)
+        mu_x, mu_y = self._buffer("mu_x", shape, np.float32), self._buffer("mu_y", shape, np.float32)
+        sigma_x, sigma_y = self._buffer("sigma_x", shape, np.float32), self._buffer("sigma_y", shape, np.float32)
+        sigma_xy, temp = self._buffer("sigma_xy", shape, np.float32), self._buffer("temp", shape, np.float32)
+        window = (SSIM_WINDOW, SSIM_WINDOW)
+
+        x[...], y[...] = o_frame, d_frame
+        cv2.blur(x, window, dst=mu_x)
+        cv2.blur(y, window, dst=mu_y)
+
+        np.multiply(x, x, out=temp)
+        cv2.blur(temp, window, dst=sigma_x)
+        np.multiply(y, y, out=temp)
+        cv2.blur(temp, window, dst=sigma_y)
+        np.multiply(x, y, out=temp)
+        cv2.blur(temp, window, dst=sigma_xy)
+
+        # variances and covariance from the local means, x and y are free again and hold the products of the means
+        np.multiply(mu_x, mu_y, out=temp)
+        np.subtract(sigma_xy, temp, out=sigma_xy)
+        np.multiply(mu_x, mu_x, out=x)
+        np.multiply(mu_y, mu_y, out=y)
+        np.subtract(sigma_x, x, out=sigma_x)
+        np.subtract(sigma_y, y, out=sigma_y)
+
+        # numerator (2 mu_x mu_y + C1)(2 sigma_xy + C2) in temp, denominator (mu_x^2 + mu_y^2 + C1)(sigma_x + sigma_y + C2) in x
+        np.multiply(temp, 2, out=temp)
+        np.add(temp, SSIM_C1, out=temp)
+        np.multiply(sigma_xy, 2, out=sigma_xy)
+        np.add(sigma_xy, SSIM_C2, out=sigma_xy)
+        np.multiply(temp, sigma_xy, out=temp)
+
+        np.add(x, y, out=x)
+        np.add(x, SSIM_C1, out=x)
+        np.add(sigma_x, sigma_y, out=sigma_x)
+        np.add(sigma_x, SSIM_C2, out=sigma_x)
+        np.multiply(x, sigma_x, out=x)
+
+        np.divide(temp, x, out=temp)
+        if shape[2] <= 4:
+            return list(cv2.mean(temp)[:shape[2]])
+
+        return np.mean(temp.reshape(-1, shape[2]), axis=0, dtype=np.float64).tolist()
     
     def get_entropy(self, frame):
-        frame_read = frame
-
-        _bins = 256
-
-        hist, _ = np.histogram(frame_read.ravel(), bins=_bins, range=(0, _bins))
-
-        prob_dist = hist / hist.sum()
-        frame_entropy = entropy(prob_dist, base=2)
+        return self.get_histogram(frame).get_entropy()
 
-        return frame_entropy
+    def get_histogram(self, frame):
+        return FrameHistogram(frame)
@@ -6,7 +6,8 @@ for handling cryptographic operations.
 Functions:
 ----------
 1. init_cryptographic_handler (POST /init_cryptographic_handler):
-   - Initializes the `EncryptionProcessHandler` with parameters such as algorithm, file paths, password, output directory, and hash path.
+   - Initializes the `EncryptionProcessHandler` with parameters such as algorithm, file paths, password, output directory, hash path,
+   the optional number of parallel workers and the optional clip (startTime, endTime in seconds) to decrypt.
    
 2. init_analysis_handler (POST /init_analysis_handler):
    - Initializes the `AnalysisProcessHandler` with parameters like the algorithm, original and processed file paths, time file paths, and output directory.
@@ -74,6 +75,9 @@ async def init_cryptographic_handler(request: Request):
     _password = _body.get("password")
     _output_dirpath = _body.get("outputDirpath")
     _hash_path = _body.get("hashPath")
+    _workers = int(_body.get("workers", 1))
+    _start_time = _body.get("startTime")
+    _end_time = _body.get("endTime")
     
     # Initialize the EncryptionProcessHandler
     current_handler = EncryptionProcessHandler(
@@ -81,7 +85,10 @@ async def init_cryptographic_handler(request: Request):
         input_filepaths=_input_filepaths,
         password=_password,
         output_dirpath=_output_dirpath,
-        hash_path=_hash_path
+        hash_path=_hash_path,
+        workers=_workers,
+        start_time=_start_time,
+        end_time=_end_time
     )
     
     return {"message": "Handler initialized successfully"}
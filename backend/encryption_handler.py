@@ -15,6 +15,9 @@ Class:
    - password (str): The password used for encryption/decryption.
    - output_dirpath (str): The directory path where output files will be saved.
    - hash_path (str): Path for storing or retrieving hash keys used in encryption.
+   - workers (int): Number of processes encrypting/decrypting frames in parallel, 0 uses all cores.
+   - start_time (float): Start of the clip to decrypt in seconds, None decrypts from the beginning.
+   - end_time (float): End of the clip to decrypt in seconds, None decrypts until the end.
    - input_files (list): Stores the names of input files.
    - output_filepaths (list): Stores the file paths of processed output files.
    - time_filepaths (list): Stores the file paths for time analysis results.
@@ -80,7 +83,10 @@ class EncryptionProcessHandler:
             input_filepaths: dict[str], 
             password: str, 
             output_dirpath: str, 
-            hash_path: str
+            hash_path: str,
+            workers: int = 1,
+            start_time: float = None,
+            end_time: float = None
         ):
 
         # User Inputs
@@ -89,6 +95,9 @@ class EncryptionProcessHandler:
         self.password = password
         self.output_dirpath = output_dirpath
         self.hash_path = hash_path
+        self.workers = workers
+        self.start_time = start_time
+        self.end_time = end_time
 
         # Lists of values needed to be passed to the next page
         self.input_files = []
@@ -178,7 +187,7 @@ class EncryptionProcessHandler:
                             )
             _time_filepath = _get_unique_filepath(_time_filepath)
 
-            _command = f"python -u medicrypt-cli.py encrypt -i \"{filepath}\" -o \"{_output_filepath}\" -t {self.algorithm} -k \"{_hash_filepath}\" -p \"{self.password}\" --verbose --storetime \"{_time_filepath}\""
+            _command = f"python -u medicrypt-cli.py encrypt -i \"{filepath}\" -o \"{_output_filepath}\" -t {self.algorithm} -k \"{_hash_filepath}\" -p \"{self.password}\" --verbose --storetime \"{_time_filepath}\" --workers {self.workers}"
 
         else:  # Decrypt
             # Determine output path for decrypted file
@@ -206,7 +215,13 @@ class EncryptionProcessHandler:
             _time_filepath = _get_unique_filepath(_time_filepath)
 
             # Generate the command itself
-            _command = f"python -u medicrypt-cli.py decrypt -i \"{filepath}\" -o \"{_output_filepath}\" -t {self.algorithm} -k \"{_hash_filepath}\" -p \"{self.password}\" --verbose --storetime \"{_time_filepath}\""
+            _command = f"python -u medicrypt-cli.py decrypt -i \"{filepath}\" -o \"{_output_filepath}\" -t {self.algorithm} -k \"{_hash_filepath}\" -p \"{self.password}\" --verbose --storetime \"{_time_filepath}\" --workers {self.workers}"
+
+            # Decrypt only a clip of the video
+            if self.start_time is not None:
+                _command += f" --start-time {float(self.start_time)}"
+            if self.end_time is not None:
+                _command += f" --end-time {float(self.end_time)}"
         
         _data = { 
                     "input_file": _input_file, 
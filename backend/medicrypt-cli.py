@@ -12,7 +12,7 @@ Dependencies:
 -------------
 - Encryption algorithms: "3dcosine", "Fisher-Yates"
 - Built-in modules: "argparse", "sys"
-- External modules: "logfilewriter"
+- External modules: "logfilewriter", "frame_io" (frame sources and sinks of the input and output)
 
 Code Author: Roel Castro
 Date Created: 9/11/2024
@@ -25,11 +25,99 @@ sys.path.append(str(Path(__file__).resolve().parent.parent))
 
 from backend.algorithms.fisher_yates import Encrypt
 from backend.algorithms._3d_cosine import Encrypt_cosine
+from backend.utils.key_validator import EncryptionMode
+from backend.utils.key_validator import KeystreamMode
+from backend.utils.key_validator import ChannelMode
+from backend.utils.key_format import KeyReader
+from backend.utils.roi import RoiSchedule
+from backend.utils.roi import parseRect
+from backend.utils.roi import loadRoiFile
+from backend.utils.frame_io import SOURCE_BACKENDS
+from backend.utils.frame_io import SINK_BACKENDS
+from backend.utils.frame_io import openSource
+from backend.utils.frame_io import openSink
 from pathlib import Path
+from contextlib import redirect_stdout
 
 import backend.utils.logfilewriter as logfilewriter
 import argparse
 
+# Converts the clip arguments into a frame range (start, end), timestamps use the frame rate of the input video
+def clipRange(args, fps):
+    start = args.start if args.start is not None else 0
+    end = args.end
+
+    if args.start_time is not None or args.end_time is not None:
+        if args.start_time is not None:
+            start = int(round(args.start_time * fps))
+        if args.end_time is not None:
+            end = int(round(args.end_time * fps))
+
+    # -f limits the number of decrypted frames for testing
+    if args.frames > -1 and end is None:
+        end = start + args.frames
+
+    if end is not None and end <= start:
+        raise ValueError(f"The clip from frame {start} to {end} holds no frames")
+
+    return start, end
+
+# Size of the raw input frames (width, height), a raw pipe of encrypted frames takes the size recorded by the
+# key file when --frame-size is not given, (None, None) leaves it to the frame source
+def frameSize(args):
+    if args.frame_size:
+        return tuple(int(size) for size in args.frame_size.lower().split('x'))
+
+    is_pipe = args.input_format == "pipe" or (args.input_format == "auto" and args.input == '-')
+    if args.mode == 'decrypt' and is_pipe:
+        mode = EncryptionMode.FISHER_YATES if args.type == "fisher-yates" else EncryptionMode.COSINE_3D
+        size = KeyReader(args.key, args.password, mode).frameSize()
+        if size is not None:
+            return size
+
+    return None, None
+
+# Region of interest schedule of the encryption, returns RoiSchedule or None to encrypt whole frames
+def roiSchedule(args):
+    if args.roi_file is not None:
+        return loadRoiFile(args.roi_file)
+    if args.roi:
+        return RoiSchedule(static=args.roi)
+
+    return None
+
+# Runs the encryption or decryption of the chosen algorithm, returns the per frame runtime
+def runAlgorithm(args, source, sink, keystream, start, end):
+    video = None
+
+    if args.type == "fisher-yates":
+        encrypt_mod = Encrypt()
+        if args.mode == 'encrypt':
+            video = encrypt_mod.encryptVideo(source, sink, args.key, args.password, args.verbose, args.frames,
+                                             keystream=keystream, workers=args.workers,
+                                             channels=ChannelMode(args.channels), roi=roiSchedule(args),
+                                             tile_size=args.tile_size)
+            pass
+        elif args.mode == 'decrypt':
+            video = encrypt_mod.decryptVideo(source, sink, args.key, args.password, args.verbose,
+                                             workers=args.workers, start=start, end=end)
+            pass
+        
+    elif args.type == "3d-cosine":
+        encrypt_mod = Encrypt_cosine()
+        if args.mode == 'encrypt':
+            video = encrypt_mod.encryptVideo(source, sink, args.key, args.password, args.verbose, args.frames,
+                                             keystream=keystream, workers=args.workers,
+                                             channels=ChannelMode(args.channels), roi=roiSchedule(args),
+                                             tile_size=args.tile_size)
+            pass
+        elif args.mode == 'decrypt':
+            video = encrypt_mod.decryptVideo(source, sink, args.key, args.password, args.verbose,
+                                             workers=args.workers, start=start, end=end)
+            pass
+
+    return video
+
 def main():
 
     parser = argparse.ArgumentParser(description='For encrypting videos')
@@ -44,6 +132,34 @@ def main():
     parser.add_argument('-v', '--verbose', action='store_true', help="displays the encryption process")
     parser.add_argument('-f', '--frames', type=int, help="specifies the number of frames (for testing purposes only)", default=-1)
     parser.add_argument('--storetime', type=str)
+    parser.add_argument('--keystream', default="sequential", choices=['sequential', 'segmented'],
+                        help="specifies the chaotic map keystream generator (encryption only, decryption reads it from the key file)")
+    parser.add_argument('--channels', default="color", choices=['color', 'grayscale', 'auto'],
+                        help="(encryption only) grayscale encrypts one plane per frame, auto does so when the video is grayscale, "
+                             "decryption reads it from the key file")
+    parser.add_argument('--roi', action='append', type=parseRect, metavar="X,Y,W,H",
+                        help="(encryption only) encrypts only this rectangle of every frame, can be repeated")
+    parser.add_argument('--roi-file', type=str,
+                        help="(encryption only) JSON file with the rectangles to encrypt, static {\"rois\": [[x, y, w, h], ...]} "
+                             "or per frame {\"frames\": [[[x, y, w, h], ...], ...]}")
+    parser.add_argument('--tile-size', type=int, default=0,
+                        help="(encryption only) encrypts every frame in tiles of at most this many pixels per side with bounded memory, "
+                             "0 encrypts whole frames, decryption reads it from the key file")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="specifies the number of processes encrypting/decrypting frames in parallel, 0 uses all cores")
+    parser.add_argument('--start', type=int, help="(decryption only) specifies the first frame of the clip to decrypt")
+    parser.add_argument('--end', type=int, help="(decryption only) specifies the frame after the last frame of the clip to decrypt")
+    parser.add_argument('--start-time', type=float, help="(decryption only) specifies the start of the clip to decrypt in seconds")
+    parser.add_argument('--end-time', type=float, help="(decryption only) specifies the end of the clip to decrypt in seconds")
+    parser.add_argument('--input-format', default="auto", choices=SOURCE_BACKENDS,
+                        help="specifies how the input frames are read, auto uses a raw BGR24 pipe for '-', a frame stack for .npy, a raw container for .mcv, "
+                             "images for a directory and OpenCV otherwise")
+    parser.add_argument('--output-format', default="auto", choices=SINK_BACKENDS,
+                        help="specifies how the output frames are written, auto uses a raw BGR24 pipe for '-', a frame stack for .npy, a raw container for .mcv, "
+                             "images for a path without extension and OpenCV otherwise")
+    parser.add_argument('--frame-size', type=str, help="specifies the WIDTHxHEIGHT of raw BGR24 input frames, "
+                                                         "decryption reads it from the key file when omitted")
+    parser.add_argument('--fps', type=float, help="specifies the frame rate of inputs without one (raw pipes, frame stacks, images)")
 
     args = parser.parse_args()
 
@@ -55,29 +171,23 @@ def main():
         return
     
     video = None
-    
-    if args.type == "fisher-yates":
-        encrypt_mod = Encrypt()
-        if args.mode == 'encrypt':
-            video = encrypt_mod.encryptVideo(args.input, args.output, args.key, args.password, args.verbose, args.frames)
-            pass
-        elif args.mode == 'decrypt':
-            video = encrypt_mod.decryptVideo(args.input, args.output, args.key, args.password, args.verbose, args.frames)
-            pass
-        
-    elif args.type == "3d-cosine":
-        encrypt_mod = Encrypt_cosine()
-        if args.mode == 'encrypt':
-            video = encrypt_mod.encryptVideo(args.input, args.output, args.key, args.password, args.verbose, args.frames)
-            pass
-        elif args.mode == 'decrypt':
-            video = encrypt_mod.decryptVideo(args.input, args.output, args.key, args.password, args.verbose, args.frames)
-            pass
+    keystream = KeystreamMode.SEGMENTED if args.keystream == 'segmented' else KeystreamMode.SEQUENTIAL
+
+    # frames written to stdout must not be mixed with the log messages, they go to stderr instead
+    with redirect_stdout(sys.stderr if args.output == '-' else sys.stdout):
+        width, height = frameSize(args)
+
+        source = openSource(args.input, args.input_format, width, height, args.fps)
+        sink = openSink(args.output, args.output_format, fps=args.fps)
+        start, end = clipRange(args, source.fps)
+
+        video = runAlgorithm(args, source, sink, keystream, start, end)
     
     if (args.storetime != None):
         
         logfilewriter.logwrite(video, args.storetime)
 
+
 if __name__ == "__main__":
     main()
 
@@ -0,0 +1,74 @@
+"""
+The frame_executor.py contains the script for running the per-frame work of the encryption algorithms on
+several processes. Every frame of a video only depends on its own pixels and its own seed(s), so frames can be
+encrypted/decrypted independently and reassembled in their original order afterwards.
+
+Functionality:
+--------------
+1. Engine agnostic:
+    - The executor only receives a picklable job function (a module level function, or a functools.partial of one)
+    and an iterable of items, one item per frame. It does not know which algorithm is being run.
+
+2. Ordered results:
+    - Results are yielded in the same order as the items, so the video writer and the key file receive frames
+    in sequence regardless of which worker finished first.
+
+3. Bounded memory:
+    - At most 'window' frames are in flight at any time, reading of the next frames waits for the oldest result.
+
+4. Sequential fallback:
+    - With a single worker, jobs run inline in the calling process without a pool, the items are consumed lazily
+    so a reused read buffer is safe to pass as the item. The initializer only runs in pool worker processes.
+
+Functions:
+1. resolveWorkers(workers):
+    - Converts the user worker count into the actual number of processes, 0 or less uses every core.
+
+Dependencies:
+-------------
+- concurrent.futures for the process pool
+"""
+
+
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import os
+
+
+def resolveWorkers(workers) -> int:
+    if workers is None:
+        return 1
+
+    if workers <= 0:
+        return os.cpu_count() or 1
+
+    return int(workers)
+
+
+class FrameExecutor:
+    def __init__(self, workers=1, initializer=None, initargs=(), window=None):
+        self.workers = resolveWorkers(workers)
+        self.initializer = initializer
+        self.initargs = initargs
+        self.window = window if window is not None else 2 * self.workers
+
+    # Runs job(item) for every item, yields the results in item order
+    def map(self, job, items):
+        if self.workers == 1:
+            for _item in items:
+                yield job(_item)
+
+            return
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=self.initializer,
+                                 initargs=self.initargs) as _pool:
+            _pending = deque()
+
+            for _item in items:
+                _pending.append(_pool.submit(job, _item))
+
+                if len(_pending) >= self.window:
+                    yield _pending.popleft().result()
+
+            while _pending:
+                yield _pending.popleft().result()
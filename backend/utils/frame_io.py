@@ -0,0 +1,728 @@
+"""
+The frame_io.py contains the script for reading the frames of a video from and writing them to different backends,
+so the encryption algorithms are not tied to cv2.VideoCapture and cv2.VideoWriter.
+Every source yields H x W x 3 uint8 frames in BGR order and every sink receives them, whatever the backend.
+
+Functionality:
+--------------
+1. Sources (FrameSource):
+    - OpenCVSource: any video OpenCV can decode through FFMPEG, the default backend.
+    - RawPipeSource: raw BGR24 frames from a binary stream such as stdin, the frame size must be given.
+    - FFmpegSource: raw BGR24 frames piped from a local ffmpeg subprocess decoding the video.
+    - NumpySource: a .npy frame stack of shape (frames, height, width, 3), memory mapped so frames are paged
+    in on demand.
+    - ImageSequenceSource: a directory of images read in file name order.
+    - RawContainerSource: a raw container (.mcv) memory mapped, frames are returned as views without a copy.
+    - All sources offer 'read(buffer)' like cv2.VideoCapture, 'seek(index)', 'release()' and the
+    'width', 'height', 'fps' and 'frame_count' of the video (frame_count is -1 when it is not known).
+
+2. Sinks (FrameSink):
+    - OpenCVSink: cv2.VideoWriter with the fourcc of the algorithm (HFYU for encryption, mp4v for decryption).
+    - RawPipeSink: raw BGR24 frames to a binary stream such as stdout.
+    - FFmpegSink: raw BGR24 frames piped into a local ffmpeg subprocess, encoded losslessly by default.
+    - NumpySink: a .npy frame stack, the frame count in the header is written when the sink is released.
+    - ImageSequenceSink: one lossless PNG per frame in a directory.
+    - RawContainerSink: a raw container (.mcv), frames are written as they are without a codec.
+    - Sinks are opened with the size of the first frame written, so the algorithms do not need to know the size
+    of their output (e.g. the 90 degree rotation of 3D-Cosine).
+
+3. Raw container (.mcv):
+    - A fixed header (magic, version, header size, algorithm, channels, width, height, fps, frame count)
+    followed by the contiguous uint8 frames, frame n starts at 'header size + n * frame size'.
+    - Encrypted frames are uniformly random, so a video codec spends CPU without making them smaller,
+    the container skips the codec on encryption and gives any frame to decryption and analysis through
+    a memory map without decoding or copying.
+    - The frame count is written when the sink is released, the algorithm is the one of the engine writing it
+    (none for decrypted videos).
+
+4. Channels:
+    - Sinks write frames with 1 or 3 channels, a single plane video is written as gray by the backend.
+    - Grayscale video (ultrasound, fluoroscopy) decoded as BGR carries the same plane three times,
+    selectChannels reduces it to one plane so the engines encrypt a third of the data.
+    - The AUTO mode decides from the first AUTO_PROBE_FRAMES frames with content, uniform (black or blank)
+    frames are skipped, and falls back to color when any of them is not grayscale.
+
+5. Lossless decryption:
+    - Decrypting into a raw pipe, a .npy stack, an image directory or ffmpeg with a lossless codec skips
+    the lossy mp4v re-encode of the default OpenCV sink.
+
+Functions:
+1. openSource(target, backend, width, height, fps):
+    - Returns the FrameSource of a path ("-" for stdin), sources are returned unchanged.
+
+2. openSink(target, backend, fps, fourcc, algorithm):
+    - Returns the FrameSink of a path ("-" for stdout), sinks are returned unchanged with their missing
+    fps, fourcc and algorithm filled in by the algorithm.
+
+3. isRawContainer(path):
+    - Checks the magic of a file for a raw container.
+
+4. selectChannels(frames, mode) / restoreChannels(frame):
+    - Converts the frames of a grayscale video to one plane for encryption, and a decrypted plane back to BGR.
+
+Dependencies:
+-------------
+- Numpy for the frame arrays and memory maps
+- cv2 for decoding and encoding videos and images
+- subprocess and shutil from the standard library for the ffmpeg backend
+"""
+
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from backend.utils.key_validator import EncryptionMode
+from backend.utils.key_validator import ChannelMode
+import numpy as np
+import itertools
+import subprocess
+import shutil
+import struct
+import cv2
+
+SOURCE_BACKENDS = ("auto", "opencv", "pipe", "ffmpeg", "npy", "images", "raw")
+SINK_BACKENDS = ("auto", "opencv", "pipe", "ffmpeg", "npy", "images", "raw")
+
+DEFAULT_FPS = 30.0
+IMAGE_EXTENSIONS = (".png", ".bmp", ".tif", ".tiff", ".ppm", ".jpg", ".jpeg")
+
+# Frames with content (not uniform) the AUTO channel mode checks before encrypting a video as grayscale
+AUTO_PROBE_FRAMES = 8
+
+# Lossless codec of the ffmpeg sink when none is given
+FFMPEG_LOSSLESS_CODEC = ("-c:v", "ffv1")
+
+# The .npy header is written with a fixed length, so the frame count can be written again when the sink is released
+_NPY_MAGIC = b"\x93NUMPY\x01\x00"
+_NPY_HEADER_LENGTH = 128
+
+RAW_CONTAINER_SUFFIX = ".mcv"
+RAW_CONTAINER_MAGIC = b"MCVF"
+RAW_CONTAINER_VERSION = 1
+
+# magic, version, header size, algorithm, channels, width, height, fps, frame count
+# the header is padded to _RAW_HEADER_SIZE bytes so the frames start aligned
+_RAW_HEADER = struct.Struct(">4sBHBBIIdQ")
+_RAW_HEADER_SIZE = 64
+_RAW_FRAME_COUNT_OFFSET = _RAW_HEADER.size - 8
+
+# Codes are written to the container, so they must never change
+_RAW_ALGORITHM_CODES = {None: 0, EncryptionMode.FISHER_YATES: 1, EncryptionMode.COSINE_3D: 2}
+
+
+# Reads exactly len(view) bytes of the stream into view, returns the number of bytes read (less only at the end)
+def __readExactly__(stream, view):
+    _read = 0
+    while _read < len(view):
+        _count = stream.readinto(view[_read:])
+        if not _count:
+            break
+        _read += _count
+
+    return _read
+
+
+# Returns the memory mapped frame as a read-only view, copies it only into a writable buffer of the caller
+# (read-only buffers are earlier views the caller passed back, cv2.VideoCapture style)
+def __mappedFrame__(frame, buffer):
+    if buffer is not None and buffer.flags.writeable:
+        np.copyto(buffer, frame)
+        return buffer
+
+    return frame
+
+
+# Path of the ffmpeg executable, raises an error when it is not installed
+def __ffmpegPath__():
+    _ffmpeg = shutil.which("ffmpeg")
+    if _ffmpeg is None:
+        raise FileNotFoundError("The ffmpeg backend needs the ffmpeg executable on the PATH")
+
+    return _ffmpeg
+
+
+class FrameSource:
+    def __init__(self, width, height, fps, frame_count=-1, directory=None):
+        self.width = int(width)
+        self.height = int(height)
+        self.fps = float(fps) if fps else DEFAULT_FPS
+        self.frame_count = int(frame_count)
+
+        # folder of the input, scratch files of the algorithms are created there (None for the temp folder)
+        self.directory = directory
+        self.position = 0
+
+        # algorithm recorded by the container, None when the backend does not record one
+        self.algorithm = None
+        self.channels = 3
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    # Reads the next frame into 'buffer' when given, returns (bool, numpy array) like cv2.VideoCapture.read
+    def read(self, buffer=None):
+        raise NotImplementedError
+
+    # Moves to the frame 'index', the next read returns that frame
+    def seek(self, index):
+        raise NotImplementedError
+
+    def release(self):
+        pass
+
+
+class OpenCVSource(FrameSource):
+    def __init__(self, path):
+        self._cap = cv2.VideoCapture(str(Path(path).resolve()), cv2.CAP_FFMPEG)
+
+        super().__init__(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH), self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT),
+                         self._cap.get(cv2.CAP_PROP_FPS), self._cap.get(cv2.CAP_PROP_FRAME_COUNT) or -1,
+                         Path(path).resolve().parent)
+
+    def read(self, buffer=None):
+        _grabbed, _frame = self._cap.read(buffer)
+        if _grabbed:
+            self.position += 1
+
+        return _grabbed, _frame
+
+    def seek(self, index):
+        self._cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+        self.position = index
+
+    def release(self):
+        self._cap.release()
+
+
+class RawPipeSource(FrameSource):
+    def __init__(self, stream, width, height, fps=None, directory=None, close_stream=False):
+        if not width or not height:
+            raise ValueError("A raw frame stream needs the width and height of the frames")
+
+        super().__init__(width, height, fps, directory=directory)
+        self._stream = stream
+        self._close_stream = close_stream
+
+    def read(self, buffer=None):
+        _frame = buffer if buffer is not None else np.empty((self.height, self.width, 3), dtype=np.uint8)
+        _view = memoryview(_frame).cast("B")
+
+        _read = __readExactly__(self._stream, _view)
+        if _read == 0:
+            return False, None
+        if _read < len(_view):
+            raise ValueError(f"The raw frame stream ended in the middle of frame {self.position}")
+
+        self.position += 1
+        return True, _frame
+
+    # Pipes can only move forward, the frames in between are read and dropped
+    def seek(self, index):
+        if index < self.position:
+            raise ValueError(f"A raw frame stream can not seek back from frame {self.position} to frame {index}")
+
+        _skipped = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        while self.position < index and self.read(_skipped)[0]:
+            pass
+
+    def release(self):
+        if self._close_stream:
+            self._stream.close()
+
+
+class FFmpegSource(RawPipeSource):
+    def __init__(self, path, width=None, height=None, fps=None):
+        _path = Path(path).resolve()
+
+        # the size and frame rate are taken from the container when they are not given
+        if not width or not height or not fps:
+            _probe = cv2.VideoCapture(str(_path), cv2.CAP_FFMPEG)
+            width = width or _probe.get(cv2.CAP_PROP_FRAME_WIDTH)
+            height = height or _probe.get(cv2.CAP_PROP_FRAME_HEIGHT)
+            fps = fps or _probe.get(cv2.CAP_PROP_FPS)
+            _probe.release()
+
+        self._process = subprocess.Popen(
+            [__ffmpegPath__(), "-v", "error", "-i", str(_path), "-f", "rawvideo", "-pix_fmt", "bgr24", "-"],
+            stdout=subprocess.PIPE,
+        )
+        super().__init__(self._process.stdout, width, height, fps, _path.parent)
+
+    def release(self):
+        self._process.stdout.close()
+        self._process.kill()
+        self._process.wait()
+
+
+class NumpySource(FrameSource):
+    def __init__(self, path, fps=None):
+        self._frames = np.load(str(Path(path).resolve()), mmap_mode="r")
+        if self._frames.ndim != 4 or self._frames.shape[3] not in (1, 3) or self._frames.dtype != np.uint8:
+            raise ValueError(f"A frame stack must be uint8 of shape (frames, height, width, 1 or 3), "
+                             f"got {self._frames.dtype} {self._frames.shape}")
+
+        _count, _height, _width, _channels = self._frames.shape
+        super().__init__(_width, _height, fps, _count, Path(path).resolve().parent)
+        self.channels = _channels
+
+    def read(self, buffer=None):
+        if self.position >= self.frame_count:
+            return False, None
+
+        _frame = __mappedFrame__(self._frames[self.position], buffer)
+
+        self.position += 1
+        return True, _frame
+
+    def seek(self, index):
+        self.position = index
+
+    def release(self):
+        self._frames = None
+
+
+class ImageSequenceSource(FrameSource):
+    def __init__(self, directory, fps=None):
+        _directory = Path(directory).resolve()
+        self._files = sorted(_file for _file in _directory.iterdir() if _file.suffix.lower() in IMAGE_EXTENSIONS)
+        if not self._files:
+            raise ValueError(f"No images found in {_directory}")
+
+        _height, _width = self.__load__(0).shape[:2]
+        super().__init__(_width, _height, fps, len(self._files), _directory.parent)
+
+    def __load__(self, index):
+        _frame = cv2.imread(str(self._files[index]), cv2.IMREAD_COLOR)
+        if _frame is None:
+            raise ValueError(f"Could not read the image {self._files[index]}")
+
+        return _frame
+
+    def read(self, buffer=None):
+        if self.position >= self.frame_count:
+            return False, None
+
+        _frame = self.__load__(self.position)
+        if buffer is not None:
+            np.copyto(buffer, _frame)
+            _frame = buffer
+
+        self.position += 1
+        return True, _frame
+
+    def seek(self, index):
+        self.position = index
+
+
+class RawContainerSource(FrameSource):
+    def __init__(self, path):
+        _path = Path(path).resolve()
+        with open(_path, "rb") as _file:
+            _header = _file.read(_RAW_HEADER.size)
+
+        if len(_header) < _RAW_HEADER.size or not _header.startswith(RAW_CONTAINER_MAGIC):
+            raise ValueError(f"{_path} is not a raw container")
+
+        (_magic, _version, _header_size, _algorithm, _channels,
+         _width, _height, _fps, _count) = _RAW_HEADER.unpack(_header)
+        if _version != RAW_CONTAINER_VERSION:
+            raise ValueError(f"Unsupported raw container version: {_version}")
+
+        super().__init__(_width, _height, _fps, _count, _path.parent)
+        self.channels = _channels
+        self.algorithm = next((_mode for _mode, _code in _RAW_ALGORITHM_CODES.items() if _code == _algorithm), None)
+
+        self._frames = np.memmap(_path, dtype=np.uint8, mode="r", offset=_header_size,
+                                 shape=(_count, _height, _width, _channels)) if _count else \
+            np.empty((0, _height, _width, _channels), dtype=np.uint8)
+
+    # Frame 'index' as a read-only view of the memory map, returns numpy array
+    def frame(self, index):
+        return self._frames[index]
+
+    def read(self, buffer=None):
+        if self.position >= self.frame_count:
+            return False, None
+
+        _frame = __mappedFrame__(self._frames[self.position], buffer)
+
+        self.position += 1
+        return True, _frame
+
+    def seek(self, index):
+        self.position = index
+
+    def release(self):
+        self._frames = None
+
+
+class FrameSink:
+    def __init__(self, fps=None, fourcc=None):
+        self.fps = fps
+        self.fourcc = fourcc
+        self.frame_count = 0
+
+        self.width = None
+        self.height = None
+        self.channels = None
+
+        # algorithm recorded by containers that store one, set by openSink
+        self.algorithm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    # Opens the backend for frames of the given size, called with the first frame
+    def __open__(self, width, height):
+        pass
+
+    def __write__(self, frame):
+        raise NotImplementedError
+
+    # Writes the next frame, all frames must have the size and channels (1 or 3) of the first one
+    def write(self, frame):
+        _height, _width = frame.shape[:2]
+        _channels = frame.shape[2] if frame.ndim == 3 else 1
+
+        if self.width is None:
+            self.width, self.height, self.channels = _width, _height, _channels
+            self.__open__(_width, _height)
+        elif (_width, _height, _channels) != (self.width, self.height, self.channels):
+            raise ValueError(f"Frame {self.frame_count} is {_width}x{_height}x{_channels}, "
+                             f"expected {self.width}x{self.height}x{self.channels}")
+
+        self.__write__(np.ascontiguousarray(frame))
+        self.frame_count += 1
+
+    def release(self):
+        pass
+
+
+class OpenCVSink(FrameSink):
+    def __init__(self, path, fps=None, fourcc=None):
+        super().__init__(fps, fourcc)
+        self.path = Path(path)
+        self._writer = None
+
+    def __open__(self, width, height):
+        self._writer = cv2.VideoWriter(
+            str(self.path.absolute()),
+            cv2.VideoWriter_fourcc(*(self.fourcc or "mp4v")),
+            self.fps or DEFAULT_FPS,
+            (width, height),
+            isColor=self.channels == 3,
+        )
+
+    def __write__(self, frame):
+        self._writer.write(frame)
+
+    def release(self):
+        if self._writer is not None:
+            self._writer.release()
+
+
+class RawPipeSink(FrameSink):
+    def __init__(self, stream, fps=None, fourcc=None, close_stream=False):
+        super().__init__(fps, fourcc)
+        self._stream = stream
+        self._close_stream = close_stream
+
+    def __write__(self, frame):
+        self._stream.write(memoryview(frame).cast("B"))
+
+    def release(self):
+        self._stream.flush()
+        if self._close_stream:
+            self._stream.close()
+
+
+class FFmpegSink(RawPipeSink):
+    def __init__(self, path, fps=None, codec=FFMPEG_LOSSLESS_CODEC):
+        super().__init__(None, fps)
+        self.path = Path(path)
+        self.codec = tuple(codec)
+        self._process = None
+
+    def __open__(self, width, height):
+        self._process = subprocess.Popen(
+            [__ffmpegPath__(), "-v", "error", "-y", "-f", "rawvideo", "-pix_fmt",
+             "bgr24" if self.channels == 3 else "gray",
+             "-s", f"{width}x{height}", "-r", str(self.fps or DEFAULT_FPS), "-i", "-",
+             *self.codec, str(self.path.absolute())],
+            stdin=subprocess.PIPE,
+        )
+        self._stream = self._process.stdin
+
+    def release(self):
+        if self._process is None:
+            return
+
+        self._process.stdin.close()
+        if self._process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to write {self.path} (exit code {self._process.returncode})")
+
+
+class NumpySink(FrameSink):
+    def __init__(self, path, fps=None, fourcc=None):
+        super().__init__(fps, fourcc)
+        self.path = Path(path)
+        self._file = None
+
+    # .npy version 1.0 header of a uint8 frame stack padded to _NPY_HEADER_LENGTH bytes, returns bytes
+    def __header__(self):
+        _header = f"{{'descr': '|u1', 'fortran_order': False, " \
+                  f"'shape': ({self.frame_count}, {self.height}, {self.width}, {self.channels}), }}"
+        _padding = _NPY_HEADER_LENGTH - len(_NPY_MAGIC) - 2 - len(_header) - 1
+
+        return _NPY_MAGIC + struct.pack("<H", _NPY_HEADER_LENGTH - len(_NPY_MAGIC) - 2) + \
+            (_header + " " * _padding + "\n").encode("latin1")
+
+    def __open__(self, width, height):
+        self._file = open(self.path, "wb")
+        self._file.write(self.__header__())
+
+    def __write__(self, frame):
+        self._file.write(memoryview(frame).cast("B"))
+
+    # Writes the final frame count into the header
+    def release(self):
+        if self._file is None:
+            return
+
+        self._file.seek(0)
+        self._file.write(self.__header__())
+        self._file.close()
+
+
+class ImageSequenceSink(FrameSink):
+    def __init__(self, directory, fps=None, fourcc=None, extension=".png"):
+        super().__init__(fps, fourcc)
+        self.directory = Path(directory)
+        self.extension = extension
+
+    def __open__(self, width, height):
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def __write__(self, frame):
+        _path = self.directory / f"{self.frame_count:06d}{self.extension}"
+        if not cv2.imwrite(str(_path), frame):
+            raise ValueError(f"Could not write the image {_path}")
+
+
+class RawContainerSink(FrameSink):
+    def __init__(self, path, fps=None, fourcc=None):
+        super().__init__(fps, fourcc)
+        self.path = Path(path)
+        self._file = None
+
+    # Header of the container padded to _RAW_HEADER_SIZE bytes, returns bytes
+    def __header__(self):
+        _header = _RAW_HEADER.pack(RAW_CONTAINER_MAGIC, RAW_CONTAINER_VERSION, _RAW_HEADER_SIZE,
+                                   _RAW_ALGORITHM_CODES[self.algorithm], self.channels or 3,
+                                   self.width or 0, self.height or 0, float(self.fps or DEFAULT_FPS), self.frame_count)
+
+        return _header.ljust(_RAW_HEADER_SIZE, b"\0")
+
+    def __open__(self, width, height):
+        self._file = open(self.path, "wb")
+        self._file.write(self.__header__())
+
+    def __write__(self, frame):
+        self._file.write(memoryview(frame).cast("B"))
+
+    # Writes the final frame count into the header
+    def release(self):
+        if self._file is None:
+            return
+
+        self._file.seek(_RAW_FRAME_COUNT_OFFSET)
+        self._file.write(struct.pack(">Q", self.frame_count))
+        self._file.close()
+
+
+# Converts the frames to the channel layout of the ChannelMode, returns (channels, iterator of frames)
+# GRAYSCALE converts every frame to one luminance plane (H x W x 1), COLOR keeps the frames, AUTO keeps one plane when
+# the first AUTO_PROBE_FRAMES frames that are not uniform are grayscale stored as BGR (B = G = R) and falls back to
+# color when one of them is not. Uniform frames (black or blank lead-ins) say nothing about the video and are skipped,
+# a frame after the probe that is not grayscale raises an error
+def selectChannels(frames, mode=ChannelMode.COLOR):
+    _frames = iter(frames)
+    if mode == ChannelMode.COLOR:
+        return 3, _frames
+
+    _gray, _probed = __probeGrayscale__(_frames, AUTO_PROBE_FRAMES if mode == ChannelMode.AUTO else 1)
+    if not _probed:
+        return 3, iter(())
+
+    _frames = itertools.chain(__replayFrames__(_probed), _frames)
+    if mode == ChannelMode.AUTO and not _gray:
+        return 3, _frames
+
+    def _planes():
+        for _index, _frame in enumerate(_frames):
+            if _frame.ndim == 2 or _frame.shape[2] == 1:
+                yield _frame.reshape(_frame.shape[0], _frame.shape[1], 1)
+            elif mode == ChannelMode.GRAYSCALE:
+                yield cv2.cvtColor(_frame, cv2.COLOR_BGR2GRAY)[:, :, np.newaxis]
+            elif isGrayscale(_frame):
+                yield np.ascontiguousarray(_frame[:, :, :1])
+            else:
+                raise ValueError(f"Frame {_index} is not grayscale, the video was detected as grayscale from its first "
+                                 f"{AUTO_PROBE_FRAMES} frames with content, encrypt it in color mode instead")
+
+    return 1, _planes()
+
+
+# Reads frames until 'count' frames that are not uniform were seen or one of them is not grayscale, returns
+# (bool, [frame, ..., frame]) with whether they are all grayscale and the frames read. Sources may reuse their read
+# buffers so the frames are copied, uniform frames are kept as (shape, pixel) so a long blank lead-in stays small
+def __probeGrayscale__(frames, count):
+    _probed = []
+    _content = 0
+
+    for _frame in frames:
+        if _frame.ndim == 2 or _frame.shape[2] == 1:
+            _probed.append(_frame.copy())
+            return True, _probed
+
+        _pixel = _frame[0, 0].copy()
+        if (_frame == _pixel).all():
+            _probed.append((_frame.shape, _pixel))
+            if _pixel.min() != _pixel.max():
+                return False, _probed
+            continue
+
+        _probed.append(_frame.copy())
+        if not isGrayscale(_frame):
+            return False, _probed
+
+        _content += 1
+        if _content >= count:
+            break
+
+    return True, _probed
+
+
+# Yields the frames of __probeGrayscale__ again, uniform frames are rebuilt one at a time
+def __replayFrames__(probed):
+    for _frame in probed:
+        if isinstance(_frame, tuple):
+            _shape, _pixel = _frame
+            _frame = np.empty(_shape, dtype=_pixel.dtype)
+            _frame[...] = _pixel
+
+        yield _frame
+
+
+# Checks whether a BGR frame is grayscale (all channels equal), returns bool
+def isGrayscale(frame):
+    return bool(np.array_equal(frame[:, :, 0], frame[:, :, 1]) and np.array_equal(frame[:, :, 1], frame[:, :, 2]))
+
+
+# Takes the single plane of a frame encrypted in grayscale mode, decoders may return it as three equal channels,
+# returns numpy array (H x W x 1)
+def singlePlane(frame):
+    if frame.ndim == 2:
+        return frame[:, :, np.newaxis]
+
+    return frame[:, :, :1]
+
+
+# Expands a decrypted single plane frame back to the BGR layout of the original video, returns numpy array
+def restoreChannels(frame):
+    return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+
+
+# Checks the magic of the file for a raw container, returns bool
+def isRawContainer(path):
+    try:
+        with open(path, "rb") as _file:
+            return _file.read(len(RAW_CONTAINER_MAGIC)) == RAW_CONTAINER_MAGIC
+    except OSError:
+        return False
+
+
+# Resolves the 'auto' backend of a path, "-" is a pipe, .npy a frame stack and a directory an image sequence
+def __resolveBackend__(target, backend, is_sink):
+    if backend != "auto":
+        return backend
+
+    _path = Path(target)
+    if str(target) == "-":
+        return "pipe"
+    if _path.suffix.lower() == ".npy":
+        return "npy"
+    if _path.suffix.lower() == RAW_CONTAINER_SUFFIX or (not is_sink and _path.is_file() and isRawContainer(_path)):
+        return "raw"
+    if _path.is_dir() or (is_sink and _path.suffix == ""):
+        return "images"
+
+    return "opencv"
+
+
+def openSource(target, backend="auto", width=None, height=None, fps=None) -> FrameSource:
+    if isinstance(target, FrameSource):
+        return target
+
+    _backend = __resolveBackend__(target, backend, is_sink=False)
+
+    if _backend == "opencv":
+        return OpenCVSource(target)
+    if _backend == "pipe":
+        # stdin gets its own file object, forked worker processes close sys.stdin which would wait for
+        # the lock of a read in progress
+        if str(target) == "-":
+            return RawPipeSource(open(sys.stdin.fileno(), "rb", closefd=False), width, height, fps,
+                                 close_stream=True)
+        return RawPipeSource(open(target, "rb"), width, height, fps, Path(target).resolve().parent, True)
+    if _backend == "ffmpeg":
+        return FFmpegSource(target, width, height, fps)
+    if _backend == "npy":
+        return NumpySource(target, fps)
+    if _backend == "images":
+        return ImageSequenceSource(target, fps)
+    if _backend == "raw":
+        return RawContainerSource(target)
+
+    raise ValueError(f"Unknown frame source backend: {backend}")
+
+
+# Creates the sink of the resolved backend
+def __createSink__(target, backend, fps, fourcc):
+    if backend == "opencv":
+        return OpenCVSink(target, fps, fourcc)
+    if backend == "pipe":
+        # the original stdout, so log messages redirected elsewhere do not mix with the frames
+        if str(target) == "-":
+            return RawPipeSink(open(sys.__stdout__.fileno(), "wb", closefd=False), fps, fourcc, close_stream=True)
+        return RawPipeSink(open(target, "wb"), fps, fourcc, close_stream=True)
+    if backend == "ffmpeg":
+        return FFmpegSink(target, fps)
+    if backend == "npy":
+        return NumpySink(target, fps, fourcc)
+    if backend == "images":
+        return ImageSequenceSink(target, fps, fourcc)
+    if backend == "raw":
+        return RawContainerSink(target, fps, fourcc)
+
+    raise ValueError(f"Unknown frame sink backend: {backend}")
+
+
+def openSink(target, backend="auto", fps=None, fourcc=None, algorithm=None) -> FrameSink:
+    if isinstance(target, FrameSink):
+        target.fps = target.fps or fps
+        target.fourcc = target.fourcc or fourcc
+        target.algorithm = target.algorithm or algorithm
+        return target
+
+    _sink = __createSink__(target, __resolveBackend__(target, backend, is_sink=True), fps, fourcc)
+    _sink.algorithm = algorithm
+
+    return _sink
@@ -0,0 +1,212 @@
+"""
+The frame_pipeline.py contains the script for running the video processing of the encryption algorithms as
+three overlapping stages: decoding frames, encrypting/decrypting them and encoding/writing the results.
+OpenCV releases the GIL while decoding and encoding, so the reader and writer threads run alongside the NumPy
+work of the compute stage instead of one after the other.
+
+Functionality:
+--------------
+1. Stages:
+    - Reader thread: iterates the frame source (e.g. cv2.VideoCapture.read) and fills the input queue.
+    - Compute stage: runs on the calling thread, takes an iterator of frames and yields results in order,
+    usually FrameExecutor.map so that the compute stage itself can use several processes.
+    - Writer thread: receives (index, result) from the output queue and writes them (video writer, key file).
+
+2. Backpressure:
+    - Both queues are bounded by 'queue_size', a fast stage blocks until the slower stage catches up,
+    so the memory of a run does not grow with the video length.
+
+3. Buffer reuse:
+    - At most pipelineDepth(queue_size) frames are alive per stage boundary, a ring of that many reused arrays
+    can be handed between two stages without a frame being overwritten while it is still queued.
+
+4. Reporting:
+    - Busy and waiting time of every stage and the sampled depth of both queues are recorded,
+    'summary()' describes the occupancy of each stage to find the bottleneck on the current host.
+
+5. Exception handling:
+    - An exception in any stage stops the other stages and is raised again on the calling thread.
+
+Dependencies:
+-------------
+- threading and queue from the standard library
+"""
+
+
+import threading
+import queue
+import time
+
+PIPELINE_QUEUE_SIZE = 8
+
+_DONE = object()
+_POLL_SECONDS = 0.1
+
+
+# Number of reused arrays needed between two stages so none is overwritten while queued, returns int
+def pipelineDepth(queue_size=PIPELINE_QUEUE_SIZE):
+    return queue_size + 2
+
+
+class _StageStats:
+    def __init__(self):
+        self.busy = 0.0
+        self.wait = 0.0
+        self.frames = 0
+
+
+class _QueueStats:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.samples = 0
+        self.total = 0
+        self.max = 0
+
+    def sample(self, depth):
+        self.samples += 1
+        self.total += depth
+        self.max = max(self.max, depth)
+
+    def mean(self):
+        return self.total / self.samples if self.samples else 0.0
+
+
+class FramePipeline:
+    def __init__(self, queue_size=PIPELINE_QUEUE_SIZE):
+        self.queue_size = queue_size
+
+        self.stages = {"read": _StageStats(), "compute": _StageStats(), "write": _StageStats()}
+        self.queues = {"input": _QueueStats(queue_size), "output": _QueueStats(queue_size)}
+        self.wall_time = 0.0
+
+        self._stop = threading.Event()
+        self._errors = []
+
+    # Puts the item into the queue, gives up when another stage failed, returns bool
+    def __put__(self, target, item, stage):
+        _start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=_POLL_SECONDS)
+                self.stages[stage].wait += time.perf_counter() - _start
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+    # Takes the next item of the queue, returns _DONE when another stage failed
+    def __get__(self, source, stage, stats):
+        _start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                stats.sample(source.qsize())
+                _item = source.get(timeout=_POLL_SECONDS)
+                self.stages[stage].wait += time.perf_counter() - _start
+                return _item
+            except queue.Empty:
+                continue
+
+        return _DONE
+
+    def __fail__(self, error):
+        self._errors.append(error)
+        self._stop.set()
+
+    def __read__(self, frames, input_queue):
+        try:
+            _stats = self.stages["read"]
+            _iterator = iter(frames)
+            while not self._stop.is_set():
+                _start = time.perf_counter()
+                _frame = next(_iterator, _DONE)
+                _stats.busy += time.perf_counter() - _start
+
+                if not self.__put__(input_queue, _frame, "read") or _frame is _DONE:
+                    break
+
+                _stats.frames += 1
+        except BaseException as e:
+            self.__fail__(e)
+
+    def __write__(self, write, output_queue):
+        try:
+            _stats = self.stages["write"]
+            _index = 0
+            while True:
+                _result = self.__get__(output_queue, "write", self.queues["output"])
+                if _result is _DONE:
+                    break
+
+                _start = time.perf_counter()
+                write(_index, _result)
+                _stats.busy += time.perf_counter() - _start
+
+                _stats.frames += 1
+                _index += 1
+        except BaseException as e:
+            self.__fail__(e)
+
+    # Yields the frames of the input queue for the compute stage
+    def __frames__(self, input_queue):
+        while True:
+            _frame = self.__get__(input_queue, "compute", self.queues["input"])
+            if _frame is _DONE:
+                return
+
+            yield _frame
+
+    # Runs the three stages until the frame source is exhausted, 'compute' maps an iterator of frames to an
+    # iterator of results in the same order and 'write' receives (index, result) on the writer thread
+    def run(self, frames, compute, write):
+        _input_queue = queue.Queue(self.queue_size)
+        _output_queue = queue.Queue(self.queue_size)
+
+        _reader = threading.Thread(target=self.__read__, args=(frames, _input_queue), daemon=True)
+        _writer = threading.Thread(target=self.__write__, args=(write, _output_queue), daemon=True)
+
+        _run_start = time.perf_counter()
+        _reader.start()
+        _writer.start()
+
+        _stats = self.stages["compute"]
+        try:
+            _results = iter(compute(self.__frames__(_input_queue)))
+            while not self._stop.is_set():
+                # time spent waiting for frames inside the iterator is counted by __get__, not as busy time
+                _start = time.perf_counter()
+                _wait_before = _stats.wait
+                _result = next(_results, _DONE)
+                _stats.busy += time.perf_counter() - _start - (_stats.wait - _wait_before)
+
+                if not self.__put__(_output_queue, _result, "compute") or _result is _DONE:
+                    break
+
+                _stats.frames += 1
+        except BaseException as e:
+            self.__fail__(e)
+        finally:
+            _writer.join()
+            self._stop.set()
+            _reader.join()
+            self.wall_time = time.perf_counter() - _run_start
+
+        if self._errors:
+            raise self._errors[0]
+
+    # Describes the occupancy of every stage and the queue depths, returns str
+    def summary(self):
+        _wall = self.wall_time or 1e-9
+        _stages = " | ".join(
+            f"{_name} {100 * _stage.busy / _wall:.0f}% busy, {_stage.wait:.2f}s waiting"
+            for _name, _stage in self.stages.items()
+        )
+        _queues = " | ".join(
+            f"{_name} queue avg {_queue.mean():.1f}/{_queue.capacity}, max {_queue.max}"
+            for _name, _queue in self.queues.items()
+        )
+        _bottleneck = max(self.stages, key=lambda name: self.stages[name].busy)
+
+        return f"Pipeline ({self.wall_time:.2f}s): {_stages}\n" \
+               f"Pipeline queues: {_queues}\n" \
+               f"Pipeline bottleneck: {_bottleneck} stage"
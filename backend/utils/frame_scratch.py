@@ -0,0 +1,89 @@
+"""
+The frame_scratch.py contains the script for keeping the frames of a video in a single scratch file while an
+algorithm needs them out of their original order (e.g. the frame selection shuffle of the 3D-cosine algorithm).
+Frames are stored as raw arrays at fixed offsets and read back through a memory map, so no per-frame image files
+are encoded, decoded, listed or moved.
+
+Functionality:
+--------------
+1. Indexed storage:
+    - Every frame has the same shape and data type, frame 'index' lives at 'index * frame size' of the file,
+    frames can be appended in order or put directly at their index in any order.
+
+2. Memory mapped reading:
+    - Frames are returned as views of a read-only memory map, the operating system pages them in on demand
+    and only the frames currently used are held in memory.
+
+3. Cleanup:
+    - The scratch file is an anonymous temporary file, it is removed when closed and by the operating system
+    if the script is interrupted mid-execution.
+
+Dependencies:
+-------------
+- Numpy for the memory map
+- tempfile from the standard library
+"""
+
+
+import numpy as np
+import tempfile
+
+
+class FrameScratch:
+    def __init__(self, directory=None):
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._view = None
+
+        self.shape = None
+        self.dtype = None
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return np.asarray(self.view()[index])
+
+    # Stores the frame at the given index, all frames must share the shape and data type of the first one
+    def put(self, index, frame):
+        _frame = np.ascontiguousarray(frame)
+
+        if self.shape is None:
+            self.shape, self.dtype = _frame.shape, _frame.dtype
+        elif _frame.shape != self.shape or _frame.dtype != self.dtype:
+            raise ValueError(f"Frame {index} has shape {_frame.shape} and type {_frame.dtype}, "
+                             f"expected {self.shape} and {self.dtype}")
+
+        self._file.seek(index * _frame.nbytes)
+        self._file.write(_frame.data)
+
+        self.count = max(self.count, index + 1)
+        self._view = None
+
+    # Stores the frame after the last stored one, returns its index
+    def append(self, frame):
+        _index = self.count
+        self.put(_index, frame)
+
+        return _index
+
+    # Maps the stored frames as a read-only array of shape (count, *frame shape), returns numpy array
+    def view(self):
+        if self._view is None:
+            if self.count == 0:
+                return np.empty((0,))
+
+            self._file.flush()
+            self._view = np.memmap(self._file, dtype=self.dtype, mode="r", shape=(self.count,) + self.shape)
+
+        return self._view
+
+    def close(self):
+        self._view = None
+        self._file.close()
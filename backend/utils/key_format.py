@@ -0,0 +1,332 @@
+"""
+The key_format.py contains the script for writing and reading the binary key files of the encryption algorithms.
+The key material is stored inside the streaming key container of text_file_encryption.py as a fixed header,
+fixed-width per-frame records and, for 3D-Cosine, the packed frame selection sequence at the end.
+
+Functionality:
+--------------
+1. Header:
+    - Magic, version, algorithm, keystream mode, diffusion mode, resolution and frame count of the encrypted video.
+    - The frame count is written when the key file is closed, the header is in the first chunk of the container
+    so validating a key file only decrypts that chunk.
+    - 'header_size' is stored as well, fields added by later versions are appended and skipped by older readers.
+    - Appended fields: the number of encrypted channels (1 for grayscale video), headers without it have 3,
+    and the number of region of interest slots per frame, 0 (the whole frame is encrypted) when missing,
+    and the tile size of the tiled mode (utils/tiling.py), 0 (frames are encrypted whole) when missing.
+    Tiled keys store the same records as whole-frame keys, the seeds of the tiles are derived from them.
+
+2. Records:
+    - FY-Logistic: the 64 byte SHA-512 digest of every frame.
+    - 3D-Cosine: the permutation and diffusion seed of every frame as two big-endian float64,
+    followed by the frame selection sequence as big-endian uint32.
+    - Region of interest keys store 'roi_slots' rectangles (x, y, width, height as big-endian uint32) and
+    'roi_slots' records of the algorithm per frame, unused slots have a size of 0.
+    - Records have a fixed width, so the records of any frame range are read with a single 'frombuffer'
+    and only the container chunks holding them are decrypted.
+
+3. Compatibility:
+    - Text key files of older versions (whole-file encrypted or text in a streaming container) are parsed into
+    the same arrays, so the algorithms only work with KeyReader.
+
+Classes:
+1. KeyWriter(fpath, password, algorithm, width, height, keystream, diffusion, channels, roi_slots, tile_size):
+    - Writes the header and appends one record per frame while the video is encrypted.
+
+2. KeyReader(fpath, password, mode):
+    - Validates the key file against the EncryptionMode and returns the records of the frames.
+    - The size of the key file is checked against the frame count of its header when it is opened, so a truncated
+    or incomplete key file is rejected before any frame is decrypted.
+    - 'clip' limits a frame range to the frames of the key file and rejects an empty one.
+    - 'checkFrameSize' rejects a video whose frames do not have the size recorded by the key file.
+
+Dependencies:
+-------------
+- Numpy for reading the records
+- text_file_encryption.py for the key container
+- key_validator.py for the modes and the validation of the key file
+"""
+
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from backend.utils.key_validator import EncryptionMode
+from backend.utils.key_validator import KeystreamMode
+from backend.utils.key_validator import DiffusionMode
+from backend.utils.key_validator import validateKey
+from backend.utils.key_validator import validateKeyMode
+import backend.utils.text_file_encryption as tfe
+import numpy as np
+import struct
+import ast
+
+KEY_MAGIC = b"MDKY"
+KEY_VERSION = 1
+
+# magic, version, header size, algorithm, keystream, diffusion, reserved, width, height, frame count
+_KEY_HEADER = struct.Struct(">4sBHBBBBIIQ")
+_FRAME_COUNT_OFFSET = _KEY_HEADER.size - 8
+
+# fields appended to the header after the first release in order as (name, struct, default when missing)
+_KEY_HEADER_EXTENSION = [
+    ("channels", struct.Struct(">B"), 3),
+    ("roi_slots", struct.Struct(">H"), 0),
+    ("tile_size", struct.Struct(">H"), 0),
+]
+
+# Codes are written to the key file, so they must never change
+_ALGORITHM_CODES = {EncryptionMode.FISHER_YATES: 1, EncryptionMode.COSINE_3D: 2}
+_KEYSTREAM_CODES = {KeystreamMode.SEQUENTIAL: 0, KeystreamMode.SEGMENTED: 1}
+_DIFFUSION_CODES = {DiffusionMode.LEGACY: 0, DiffusionMode.MODULAR: 1}
+
+# Per-frame record of every algorithm as a numpy dtype
+_RECORD_DTYPES = {
+    EncryptionMode.FISHER_YATES: np.dtype((np.uint8, 64)),
+    EncryptionMode.COSINE_3D: np.dtype((">f8", 2)),
+}
+_SEQUENCE_DTYPE = np.dtype(">u4")
+_RECT_DTYPE = np.dtype((">u4", 4))
+
+
+# Per-frame record dtype, region of interest keys hold the rectangles and one record for every slot
+def __recordDtype__(algorithm, roi_slots):
+    if roi_slots == 0:
+        return _RECORD_DTYPES[algorithm]
+
+    return np.dtype([("rects", _RECT_DTYPE, (roi_slots,)), ("keys", _RECORD_DTYPES[algorithm], (roi_slots,))])
+
+
+# Looks up the enum of a code read from a key file, raises an error for unknown codes
+def __decodeField__(codes, code, name):
+    for _member, _code in codes.items():
+        if _code == code:
+            return _member
+
+    print("INVALID KEY")
+    raise ValueError(f"INVALID KEY: Unsupported {name} in the key file: {code}")
+
+
+class KeyWriter:
+    def __init__(self, fpath, password, algorithm, width, height, keystream=KeystreamMode.SEQUENTIAL,
+                 diffusion=DiffusionMode.LEGACY, channels=3, roi_slots=0, tile_size=0):
+        self.algorithm = algorithm
+        self.frame_count = 0
+        self.roi_slots = roi_slots
+        self.tile_size = tile_size
+        self._record_dtype = __recordDtype__(algorithm, roi_slots)
+
+        if roi_slots and tile_size:
+            raise ValueError("The region of interest and the tiled mode can not be combined")
+
+        _fields = {"channels": channels, "roi_slots": roi_slots, "tile_size": tile_size}
+        _extension = b"".join(_format.pack(_fields[_name]) for _name, _format, _default in _KEY_HEADER_EXTENSION)
+
+        self._container = tfe.KeyStreamWriter(fpath, password)
+        self._container.write(_KEY_HEADER.pack(KEY_MAGIC, KEY_VERSION, _KEY_HEADER.size + len(_extension),
+                                               _ALGORITHM_CODES[algorithm], _KEYSTREAM_CODES[keystream],
+                                               _DIFFUSION_CODES[diffusion], 0, width, height, 0))
+        self._container.write(_extension)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._container.__exit__(exc_type, exc_value, traceback)
+
+    # Appends the record of the next frame (digest bytes for FY-Logistic, (perm_seed, diff_seed) for 3D-Cosine),
+    # region of interest keys take (rects, records) with a rectangle and a record for every slot
+    def writeRecord(self, record):
+        if self.roi_slots:
+            _record = np.zeros(1, dtype=self._record_dtype)
+            _record["rects"][0] = record[0]
+            _record["keys"][0] = record[1]
+            record = _record
+
+        if isinstance(record, (bytes, bytearray)):
+            record = np.frombuffer(record, dtype=np.uint8)
+
+        _data = record.tobytes() if self.roi_slots else np.asarray(record).astype(self._record_dtype.base).tobytes()
+        if len(_data) != self._record_dtype.itemsize:
+            raise ValueError(f"Key record of frame {self.frame_count} has {len(_data)} bytes, "
+                             f"expected {self._record_dtype.itemsize}")
+
+        self._container.write(_data)
+        self.frame_count += 1
+
+    # Appends the frame selection sequence, written once after all the records
+    def writeFrameSequence(self, frame_sequence):
+        self._container.write(np.asarray(frame_sequence).astype(_SEQUENCE_DTYPE).tobytes())
+
+    # Writes the frame count into the header and seals the key file
+    def close(self):
+        self._container.patch(_FRAME_COUNT_OFFSET, struct.pack(">Q", self.frame_count))
+        self._container.close()
+
+
+class KeyReader:
+    def __init__(self, fpath, password, mode):
+        self._container = None
+        self._records = None
+        self._frame_sequence = None
+
+        if tfe.isKeyStream(fpath):
+            self._container = tfe.KeyStreamReader(fpath, password)
+            _first_chunk = self._container.readChunk(0)
+
+            if _first_chunk.startswith(KEY_MAGIC):
+                self.__readHeader__(_first_chunk, mode)
+                return
+
+            _text = self._container.read()
+            self._container = None
+        else:
+            _text = tfe.decryptFile(fpath, password, mem_only=True)
+
+        self.__parseText__(_text, mode)
+
+    def __readHeader__(self, data, mode):
+        if len(data) < _KEY_HEADER.size:
+            print("INVALID KEY")
+            raise ValueError("INVALID KEY: The key file is incomplete")
+
+        (_magic, self.version, self._header_size, _algorithm, _keystream, _diffusion, _reserved,
+         self.width, self.height, self.frame_count) = _KEY_HEADER.unpack_from(data)
+
+        if len(data) < self._header_size:
+            print("INVALID KEY")
+            raise ValueError("INVALID KEY: The key file is incomplete")
+
+        if self.version != KEY_VERSION:
+            print("INVALID KEY")
+            raise ValueError(f"INVALID KEY: Unsupported key file version: {self.version}")
+
+        self.algorithm = __decodeField__(_ALGORITHM_CODES, _algorithm, "algorithm")
+        validateKeyMode(self.algorithm, mode)
+
+        self.keystream = __decodeField__(_KEYSTREAM_CODES, _keystream, "keystream mode")
+        self.diffusion = __decodeField__(_DIFFUSION_CODES, _diffusion, "diffusion mode")
+
+        # appended fields, key files written before they existed use the defaults
+        _offset = _KEY_HEADER.size
+        for _name, _format, _default in _KEY_HEADER_EXTENSION:
+            _present = _offset + _format.size <= self._header_size
+            setattr(self, _name, _format.unpack_from(data, _offset)[0] if _present else _default)
+            _offset += _format.size
+
+        self._record_dtype = __recordDtype__(self.algorithm, self.roi_slots)
+
+        if self.channels not in (1, 3):
+            print("INVALID KEY")
+            raise ValueError(f"INVALID KEY: Unsupported number of channels in the key file: {self.channels}")
+
+        # the records, and the frame selection sequence of 3D-Cosine, fill the rest of the key file
+        _size = self._header_size + self.frame_count * self._record_dtype.itemsize
+        if self.algorithm == EncryptionMode.COSINE_3D:
+            _size += self.frame_count * _SEQUENCE_DTYPE.itemsize
+
+        if self._container.plaintextSize() != _size:
+            print("INVALID KEY")
+            raise ValueError(f"INVALID KEY: The key file does not hold the {self.frame_count} frames of its header")
+
+    # Parses a text key file of older versions, the records are kept in memory
+    def __parseText__(self, text, mode):
+        _lines = [_line for _line in text.splitlines() if _line.strip()]
+        validateKey(_lines[0], mode)
+
+        # text key files use the original sequential keystream and float diffusion
+        self.version = 0
+        self.algorithm = mode
+        self.keystream = KeystreamMode.SEQUENTIAL
+        self.diffusion = DiffusionMode.LEGACY
+        self.width = self.height = 0  # not recorded by text key files
+        self.channels = 3
+        self.roi_slots = 0
+        self.tile_size = 0
+        self._record_dtype = _RECORD_DTYPES[mode]
+
+        if mode == EncryptionMode.FISHER_YATES:
+            _digests = bytes.fromhex("".join(_line.strip() for _line in _lines))
+            self._records = np.frombuffer(_digests, dtype=np.uint8).reshape(-1, 64)
+        else:
+            self._frame_sequence = np.array(ast.literal_eval(_lines[-1]), dtype=np.int64)
+            self._records = np.array([float(_line) for _line in _lines[:-1]], dtype=np.float64).reshape(-1, 2)
+
+        self.frame_count = len(self._records)
+
+    # Size of the frames of the encrypted video, returns (width, height) or None when the key file does not record it,
+    # whole 3D-Cosine frames are stored rotated by 90 degrees while regions of interest and tiles keep their size
+    def frameSize(self):
+        if not self.width or not self.height:
+            return None
+        if self.algorithm == EncryptionMode.COSINE_3D and not self.roi_slots and not self.tile_size:
+            return self.height, self.width
+        return self.width, self.height
+
+    # Checks the size of the frames of the encrypted video against the key file, raises an error when they differ
+    def checkFrameSize(self, width, height):
+        _size = self.frameSize()
+        if _size is not None and (width, height) != _size:
+            print("INVALID KEY")
+            raise ValueError(f"INVALID KEY: The key file is made for {_size[0]}x{_size[1]} frames, "
+                             f"the video has {width}x{height} frames")
+
+    # Frames 'start' to 'end' (exclusive) of a clip limited to the frames of the key file, returns (int, int),
+    # raises an error when the clip holds no frame, so a decryption never finishes without writing a video
+    def clip(self, start=0, end=None):
+        _end = self.frame_count if end is None else min(end, self.frame_count)
+        _start = max(start or 0, 0)
+
+        if _start >= _end:
+            raise ValueError(f"The clip from frame {start} to {end} holds no frames, "
+                             f"the key file has {self.frame_count} frames")
+
+        return _start, _end
+
+    # Records of the frames 'start' to 'stop' (exclusive), FY-Logistic returns numpy array (n, 64) of uint8
+    # and 3D-Cosine numpy array (n, 2) of float64, region of interest keys return a structured array (n,)
+    # with the fields 'rects' (n, slots, 4) and 'keys' (n, slots, ...)
+    def records(self, start=0, stop=None):
+        _stop = self.frame_count if stop is None else min(stop, self.frame_count)
+        _start = min(max(start, 0), _stop)
+
+        if self._records is not None:
+            return self._records[_start:_stop]
+
+        _size = self._record_dtype.itemsize
+        _data = self._container.readRange(self._header_size + _start * _size, (_stop - _start) * _size)
+        if len(_data) != (_stop - _start) * _size:
+            print("INVALID KEY")
+            raise ValueError("INVALID KEY: The key file is incomplete")
+
+        if self.roi_slots:
+            _records = np.frombuffer(_data, dtype=self._record_dtype)
+            return _records.astype([(_name, self._record_dtype[_name].base.newbyteorder("="),
+                                     self._record_dtype[_name].shape) for _name in self._record_dtype.names])
+
+        return np.frombuffer(_data, dtype=self._record_dtype.base).reshape((-1,) + self._record_dtype.shape) \
+            .astype(self._record_dtype.base.newbyteorder("="))
+
+    # Yields the record of every frame from 'start' on, the key file is decrypted a block of records at a time
+    def iterRecords(self, start=0):
+        _block = max(1, tfe.STREAM_CHUNK_SIZE // self._record_dtype.itemsize)
+
+        for _start in range(start, self.frame_count, _block):
+            yield from self.records(_start, _start + _block)
+
+    # Frame selection sequence of 3D-Cosine, position n of the encrypted video holds frame sequence[n],
+    # returns numpy array of int
+    def frameSequence(self):
+        if self._frame_sequence is not None:
+            return self._frame_sequence
+
+        _offset = self._header_size + self.frame_count * self._record_dtype.itemsize
+        _data = self._container.readRange(_offset, self.frame_count * _SEQUENCE_DTYPE.itemsize)
+        if len(_data) != self.frame_count * _SEQUENCE_DTYPE.itemsize:
+            print("INVALID KEY")
+            raise ValueError("INVALID KEY: The key file has no frame sequence")
+
+        return np.frombuffer(_data, dtype=_SEQUENCE_DTYPE).astype(np.int64)
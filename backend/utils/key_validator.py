@@ -21,6 +21,10 @@ Functions:
     - Tests whether the key is approriate for the selected EncryptionMode
     - Raises an error if incompatible
 
+3. validateKeyMode(key_mode: EncryptionMode, mode: EncryptionMode):
+    - Tests whether the algorithm recorded in a binary key file is the selected EncryptionMode
+    - Raises an error if incompatible
+
 Code Author: John Paul M. Beltran
 Date Created: 10/12/2024
 Last Modified: 11/12/2024
@@ -35,6 +39,25 @@ class EncryptionMode(Enum):
     COSINE_3D = auto()
 
 
+# Values are written to the key file header, so they are versioned and must never change
+class KeystreamMode(Enum):
+    SEQUENTIAL = "sequential"
+    SEGMENTED = "segmented-v1"
+
+
+# Values are written to the key file header, so they are versioned and must never change
+class DiffusionMode(Enum):
+    LEGACY = "legacy"
+    MODULAR = "modular-v1"
+
+
+# Channel layout requested for encryption, the key file records the resulting channel count (1 or 3)
+class ChannelMode(Enum):
+    COLOR = "color"
+    GRAYSCALE = "grayscale"
+    AUTO = "auto"
+
+
 def __checkNumLiteral__(sample: str) -> bool:
     try:
         float(sample)
@@ -55,3 +78,16 @@ def validateKey(sample: str, mode: EncryptionMode) -> None:
     else:
         print("INVALID KEY")
         raise ValueError(f"Unknown key file for mode: {mode}")
+
+
+def validateKeyMode(key_mode: EncryptionMode, mode: EncryptionMode) -> None:
+    if key_mode == mode:
+        return
+
+    print("INVALID KEY")
+    if mode == EncryptionMode.FISHER_YATES:
+        raise ValueError("INVALID KEY: The key file doesn't work with FY-Logistic decryption")
+    elif mode == EncryptionMode.COSINE_3D:
+        raise ValueError("INVALID KEY: The key file doesn't work with 3D-Cosine decryption")
+    else:
+        raise ValueError(f"Unknown key file for mode: {mode}")
@@ -0,0 +1,34 @@
+"""
+The lane_seeds.py contains the script for expanding a single chaotic map seed into many independent sub-seeds.
+This is used by the segmented keystream modes, where every lane iterates its own copy of the chaotic map
+and all lanes are advanced at the same time as NumPy vectors.
+
+Functions:
+1. deriveLaneSeeds(material: bytes, lanes: int):
+    - Expands the seed material into 'lanes' floats in the open interval (0, 1) using SHA-512 in counter mode.
+    - The same material always produces the same sub-seeds, so only the original seed needs to be kept in the key.
+
+Dependencies:
+-------------
+- Numpy for faster vector calculations
+- hashlib for SHA-512
+"""
+
+
+import numpy as np
+import hashlib
+
+_DIGEST_WORDS = hashlib.sha512().digest_size // 8
+
+
+def deriveLaneSeeds(material: bytes, lanes: int) -> np.ndarray:
+    _blocks = -(-lanes // _DIGEST_WORDS)
+    _digest = b"".join(
+        hashlib.sha512(material + _counter.to_bytes(4, "big")).digest() for _counter in range(_blocks)
+    )
+
+    # keep the top 53 bits of every word and center them so the seeds never land on 0 or 1
+    _words = np.frombuffer(_digest, dtype=">u8")[:lanes]
+    _seeds = ((_words >> np.uint64(11)).astype(np.float64) + 0.5) * 2.0 ** -53
+
+    return _seeds
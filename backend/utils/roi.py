@@ -0,0 +1,111 @@
+"""
+The roi.py contains the script for the regions of interest (ROI) of the selective encryption mode, where only
+some rectangles of every frame (e.g. a burned-in patient identification band) are encrypted and the rest of
+the frame is passed through.
+
+Functionality:
+--------------
+1. Rectangles:
+    - A rectangle is (x, y, width, height) in pixels, rectangles are clipped to the frame and rectangles
+    that are empty after clipping are dropped.
+
+2. Schedules:
+    - Static: the same rectangles for every frame, e.g. from '--roi x,y,w,h' on the CLI.
+    - Per-frame: a JSON sidecar file, either {"rois": [[x, y, w, h], ...]} for static rectangles
+    or {"frames": [[[x, y, w, h], ...], ...]} with the rectangles of every frame in order.
+    A video longer than the per-frame list raises an error instead of leaving frames unprotected.
+
+3. Key file slots:
+    - Every frame stores the same number of rectangle slots ('slots', the most rectangles of any frame)
+    in the key file, so the records of the key file keep a fixed width. Unused slots have a size of 0.
+
+Classes:
+1. RoiSchedule(frames):
+    - Gives the clipped rectangle slots of every frame.
+
+Functions:
+1. parseRect(text) -> (int, int, int, int):
+    - Parses 'x,y,w,h'.
+
+2. loadRoiFile(fpath) -> RoiSchedule:
+    - Reads a JSON sidecar file.
+
+3. clipRects(rects, width, height) -> numpy array:
+    - Clips the rectangles to the frame.
+
+Dependencies:
+-------------
+- Numpy for the rectangle arrays
+- json from the standard library for the sidecar files
+"""
+
+
+from pathlib import Path
+import numpy as np
+import json
+
+
+def parseRect(text):
+    _values = [int(_value) for _value in text.replace(" ", "").split(",")]
+    if len(_values) != 4:
+        raise ValueError(f"A region of interest is x,y,width,height, got '{text}'")
+
+    return tuple(_values)
+
+
+# Clips the rectangles to a frame of width x height, returns numpy array (n, 4) of the non-empty rectangles
+def clipRects(rects, width, height):
+    _rects = np.asarray(rects, dtype=np.int64).reshape(-1, 4)
+
+    _x0 = np.clip(_rects[:, 0], 0, width)
+    _y0 = np.clip(_rects[:, 1], 0, height)
+    _x1 = np.clip(_rects[:, 0] + _rects[:, 2], 0, width)
+    _y1 = np.clip(_rects[:, 1] + _rects[:, 3], 0, height)
+
+    _clipped = np.stack([_x0, _y0, _x1 - _x0, _y1 - _y0], axis=1)
+
+    return _clipped[(_clipped[:, 2] > 0) & (_clipped[:, 3] > 0)]
+
+
+class RoiSchedule:
+    # 'frames' is a list with the rectangles of every frame, or 'static' the rectangles of all frames
+    def __init__(self, frames=None, static=None):
+        if (frames is None) == (static is None):
+            raise ValueError("A region of interest schedule needs either per-frame or static rectangles")
+
+        self._frames = [np.asarray(_rects, dtype=np.int64).reshape(-1, 4) for _rects in frames] \
+            if frames is not None else None
+        self._static = np.asarray(static, dtype=np.int64).reshape(-1, 4) if static is not None else None
+
+        _counts = [len(_rects) for _rects in self._frames] if self._frames is not None else [len(self._static)]
+        self.slots = max(_counts, default=0)
+
+        if self.slots == 0:
+            raise ValueError("The region of interest schedule has no rectangles")
+
+    # Rectangle slots of frame 'index' clipped to the frame, returns numpy array (slots, 4)
+    def rects(self, index, width, height):
+        if self._static is not None:
+            _rects = self._static
+        elif index < len(self._frames):
+            _rects = self._frames[index]
+        else:
+            raise ValueError(f"The region of interest file has no rectangles for frame {index}")
+
+        _slots = np.zeros((self.slots, 4), dtype=np.int64)
+        _clipped = clipRects(_rects, width, height)
+        _slots[:len(_clipped)] = _clipped
+
+        return _slots
+
+
+def loadRoiFile(fpath) -> RoiSchedule:
+    with open(Path(fpath), "r") as _file:
+        _data = json.load(_file)
+
+    if "rois" in _data:
+        return RoiSchedule(static=_data["rois"])
+    if "frames" in _data:
+        return RoiSchedule(frames=_data["frames"])
+
+    raise ValueError(f"The region of interest file {fpath} needs a 'rois' or 'frames' list")
@@ -22,6 +22,24 @@ Functions:
     - Decrypts the passed on ciphertext with the key, returns the plaintext.
     - Raises an error if the key provided derived from the user password is wrong.
 
+5. def isKeyStream(fpath):
+    - Checks whether the file is a streaming key container instead of a whole-file encrypted text file.
+
+Classes:
+1. KeyStreamWriter(fpath, password):
+    - Streaming key container, key material is appended with 'write' while the frames are produced and sealed
+    into AES-GCM chunks of STREAM_CHUNK_SIZE bytes, plaintext is never written to the disk.
+    - Every chunk is authenticated together with the container header, its index and whether it is the last one,
+    so reordered, modified or truncated containers are detected. 'close' seals the last chunk.
+    - The first chunk is sealed last, 'patch' can still change its data until the container is closed
+    (e.g. a frame count in a header).
+
+2. KeyStreamReader(fpath, password):
+    - Reads a streaming key container chunk by chunk, 'chunks' yields the plaintext as soon as each chunk is
+    decrypted and 'read' returns the whole text.
+    - Every chunk but the last one has the same size, 'readRange' decrypts any part of the plaintext by reading
+    only the chunks that hold it and 'plaintextSize' only decrypts the last chunk.
+
 Variables:
 ----------
 ALGORITHM_NONCE_SIZE:
@@ -42,6 +60,12 @@ PBKDF2_ITERATIONS
 PBKDF2_LAMBDA
     - Global variable specifying what kind of pseudorandom function to be done
 
+STREAM_MAGIC
+    - Global variable specifying the first bytes of a streaming key container, never valid base64 text
+
+STREAM_CHUNK_SIZE
+    - Global variable specifying the plaintext byte length of every chunk but the last one
+
 Dependencies:
 -------------
 - PyCryptodome
@@ -61,6 +85,7 @@ from Crypto.Protocol.KDF import PBKDF2
 from Crypto.Hash import SHA256, HMAC
 from Crypto.Cipher import AES
 import base64
+import struct
 
 ALGORITHM_NONCE_SIZE = 12
 ALGORITHM_TAG_SIZE = 16
@@ -69,6 +94,14 @@ PBKDF2_SALT_SIZE = 16
 PBKDF2_ITERATIONS = 100
 PBKDF2_LAMBDA = lambda x, y: HMAC.new(x, y, SHA256).digest()
 
+STREAM_MAGIC = b"\x89MCK\r\n\x1a\n"
+STREAM_VERSION = 1
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_NONCE_PREFIX_SIZE = ALGORITHM_NONCE_SIZE - 4
+_STREAM_HEADER = struct.Struct(f">{len(STREAM_MAGIC)}sBI{PBKDF2_SALT_SIZE}s{STREAM_NONCE_PREFIX_SIZE}s")
+_STREAM_CHUNK_HEADER = struct.Struct(">IB")
+_STREAM_PLACEHOLDER = 0xFF  # flag of the reserved first chunk until the container is closed
+
 
 def encryptFile(fpath, password):
     # Generate a 128-bit salt using a CSPRNG.
@@ -92,6 +125,10 @@ def encryptFile(fpath, password):
 
 
 def decryptFile(fpath, password, mem_only=True):
+    # streaming containers are never rewritten as plaintext, 'mem_only' does not apply to them
+    if isKeyStream(fpath):
+        return KeyStreamReader(fpath, password).read()
+
     with open(fpath, "rb") as enc_file:
         _base64ciphertext_nonce_salt = enc_file.read()
 
@@ -152,3 +189,208 @@ def decrypt(ciphertextAndNonce, key):
     except ValueError:
         print('WRONG PASSWORD')
         raise
+
+
+def isKeyStream(fpath):
+    with open(fpath, "rb") as file:
+        return file.read(len(STREAM_MAGIC)) == STREAM_MAGIC
+
+
+# Nonce and associated data of a chunk, the nonce is unique per chunk as the prefix is random per container
+def __chunkParameters__(header, nonce_prefix, index, final):
+    _chunk = struct.pack(">IB", index, final)
+
+    return nonce_prefix + _chunk[:4], header + _chunk
+
+
+class KeyStreamWriter:
+    def __init__(self, fpath, password, chunk_size=STREAM_CHUNK_SIZE):
+        _salt = get_random_bytes(PBKDF2_SALT_SIZE)
+        self._key = PBKDF2(password, _salt, ALGORITHM_KEY_SIZE, PBKDF2_ITERATIONS, PBKDF2_LAMBDA)
+        self._nonce_prefix = get_random_bytes(STREAM_NONCE_PREFIX_SIZE)
+
+        self.chunk_size = chunk_size
+        self._header = _STREAM_HEADER.pack(STREAM_MAGIC, STREAM_VERSION, chunk_size, _salt, self._nonce_prefix)
+        self._first = None  # plaintext of the first chunk, sealed by close so 'patch' can still change it
+        self._pending = bytearray()
+        self._index = 0
+
+        self._file = open(fpath, "wb")
+        self._file.write(self._header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # a failed run leaves the container without its first and last chunk, readers report it as incomplete
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+
+    def __seal__(self, plaintext, index, final):
+        _nonce, _aad = __chunkParameters__(self._header, self._nonce_prefix, index, final)
+
+        _cipher = AES.new(self._key, AES.MODE_GCM, _nonce)
+        _cipher.update(_aad)
+        _ciphertext, _tag = _cipher.encrypt_and_digest(bytes(plaintext))
+
+        self._file.write(_STREAM_CHUNK_HEADER.pack(len(plaintext), final) + _ciphertext + _tag)
+
+    # Appends text or bytes, full chunks are sealed and written immediately
+    def write(self, data):
+        self._pending += data.encode("utf-8") if isinstance(data, str) else data
+
+        # the last chunk is only sealed by close, so a full chunk is kept pending until more data arrives
+        while len(self._pending) > self.chunk_size:
+            if self._index == 0:
+                # reserve the place of the first chunk, every chunk but the last one has the same size
+                self._first = bytearray(self._pending[:self.chunk_size])
+                self._file.write(_STREAM_CHUNK_HEADER.pack(self.chunk_size, _STREAM_PLACEHOLDER) +
+                                 bytes(self.chunk_size + ALGORITHM_TAG_SIZE))
+            else:
+                self.__seal__(self._pending[:self.chunk_size], self._index, False)
+
+            del self._pending[:self.chunk_size]
+            self._index += 1
+
+    # Overwrites already written bytes at the given offset, only possible within the first chunk
+    def patch(self, offset, data):
+        _target = self._first if self._first is not None else self._pending
+        if offset + len(data) > min(len(_target), self.chunk_size):
+            raise ValueError("Only data of the first chunk of the key file can be patched")
+
+        _target[offset:offset + len(data)] = data
+
+    # Seals the remaining data as the last chunk, then the first chunk, and closes the file
+    def close(self):
+        if self._file.closed:
+            return
+
+        self.__seal__(self._pending, self._index, True)
+        self._pending.clear()
+
+        if self._first is not None:
+            self._file.seek(_STREAM_HEADER.size)
+            self.__seal__(self._first, 0, False)
+            self._first = None
+
+        self._file.close()
+
+
+class KeyStreamReader:
+    def __init__(self, fpath, password):
+        self.fpath = fpath
+
+        with open(fpath, "rb") as file:
+            self._header = file.read(_STREAM_HEADER.size)
+            _size = file.seek(0, 2)
+
+        if len(self._header) != _STREAM_HEADER.size:
+            print("INVALID KEY")
+            raise ValueError("INVALID KEY: The key file is incomplete")
+
+        _magic, _version, self.chunk_size, _salt, self._nonce_prefix = _STREAM_HEADER.unpack(self._header)
+        if _magic != STREAM_MAGIC or _version != STREAM_VERSION:
+            print("INVALID KEY")
+            raise ValueError(f"INVALID KEY: Unsupported key container version: {_version}")
+
+        # every chunk but the last one is full, so the place of every chunk follows from its index
+        self._record_size = _STREAM_CHUNK_HEADER.size + self.chunk_size + ALGORITHM_TAG_SIZE
+        self.num_chunks = -(-(_size - _STREAM_HEADER.size) // self._record_size)
+
+        self._key = PBKDF2(password, _salt, ALGORITHM_KEY_SIZE, PBKDF2_ITERATIONS, PBKDF2_LAMBDA)
+
+        # chunk 0 is decrypted again for every range that starts in it, the password is reported once per reader
+        self._password_checked = False
+
+    def __open__(self, index, final, ciphertext, tag):
+        _nonce, _aad = __chunkParameters__(self._header, self._nonce_prefix, index, final)
+
+        _cipher = AES.new(self._key, AES.MODE_GCM, _nonce)
+        _cipher.update(_aad)
+
+        try:
+            _plaintext = _cipher.decrypt_and_verify(ciphertext, tag)
+        except ValueError:
+            # the first chunk can only fail with a wrong password, later ones were modified
+            if index == 0:
+                print("WRONG PASSWORD")
+                raise
+
+            print("INVALID KEY")
+            raise ValueError(f"INVALID KEY: Chunk {index} of the key file has been modified")
+
+        if index == 0 and not self._password_checked:
+            print("PASSWORD CORRECT")
+            self._password_checked = True
+
+        return _plaintext
+
+    # Reads and decrypts the chunk at the current position of the file, returns (bytes, bool)
+    def __readChunk__(self, file, index):
+        _chunk_header = file.read(_STREAM_CHUNK_HEADER.size)
+        if len(_chunk_header) != _STREAM_CHUNK_HEADER.size:
+            print("INVALID KEY")
+            raise ValueError("INVALID KEY: The key file is incomplete")
+
+        _length, _final = _STREAM_CHUNK_HEADER.unpack(_chunk_header)
+        _ciphertext = file.read(_length)
+        _tag = file.read(ALGORITHM_TAG_SIZE)
+        if _final == _STREAM_PLACEHOLDER or len(_ciphertext) != _length or len(_tag) != ALGORITHM_TAG_SIZE:
+            print("INVALID KEY")
+            raise ValueError("INVALID KEY: The key file is incomplete")
+
+        return self.__open__(index, _final, _ciphertext, _tag), bool(_final)
+
+    # Decrypts a single chunk without reading the ones before it, returns bytes
+    def readChunk(self, index):
+        with open(self.fpath, "rb") as file:
+            file.seek(_STREAM_HEADER.size + index * self._record_size)
+            _plaintext, _final = self.__readChunk__(file, index)
+
+        if _final != (index == self.num_chunks - 1):
+            print("INVALID KEY")
+            raise ValueError("INVALID KEY: The key file is incomplete")
+
+        return _plaintext
+
+    # Decrypts 'size' bytes of the plaintext starting at 'offset', only the chunks holding them are read
+    def readRange(self, offset, size):
+        if size <= 0:
+            return b""
+
+        _first, _last = offset // self.chunk_size, (offset + size - 1) // self.chunk_size
+        _data = b"".join(self.readChunk(_index) for _index in range(_first, _last + 1))
+        _start = offset - _first * self.chunk_size
+
+        return _data[_start:_start + size]
+
+    # Length of the whole plaintext, only the last chunk is decrypted, returns int
+    def plaintextSize(self):
+        if self.num_chunks == 0:
+            return 0
+
+        return (self.num_chunks - 1) * self.chunk_size + len(self.readChunk(self.num_chunks - 1))
+
+    # Yields the decrypted chunks in order, raises an error if the container was truncated
+    def chunks(self):
+        with open(self.fpath, "rb") as file:
+            file.seek(_STREAM_HEADER.size)
+
+            _index = 0
+            while True:
+                _plaintext, _final = self.__readChunk__(file, _index)
+                yield _plaintext
+
+                if _final:
+                    break
+                _index += 1
+
+            if file.read(1):
+                print("INVALID KEY")
+                raise ValueError("INVALID KEY: The key file has data after its last chunk")
+
+    # Returns the whole decrypted text
+    def read(self):
+        return b"".join(self.chunks()).decode("utf-8")
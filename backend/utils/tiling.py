@@ -0,0 +1,93 @@
+"""
+The tiling.py contains the script for the tiled mode of the encryption algorithms, where every frame is split into
+tiles of at most 'tile_size' x 'tile_size' pixels and each tile is encrypted on its own with seeds derived from the
+seed of the frame. The arrays of the algorithms are sized by the tile instead of the frame, so the memory of a
+frame stays bounded for 4K/8K video and the tiles of a frame can run on different workers.
+
+Functionality:
+--------------
+1. Tile grid:
+    - Each side is split into the fewest near-equal parts of at most 'tile_size' pixels, the grid only depends on
+    the frame size and the tile size, so decryption rebuilds it from the tile size in the key file.
+    - 'square_free' grids (3D-Cosine) add parts until no side of a tile is a perfect square, which the block
+    matrix of the 3D-Cosine permutation does not allow.
+
+2. Tile execution:
+    - 'mapTiles' fans the tiles of every frame out to a FrameExecutor and puts the results back into a frame,
+    frames are yielded in order with the record they were sent with. Only the tiles in the window of the executor
+    are in flight.
+
+Functions:
+1. splitAxis(length, tile_size, square_free) -> [int, ..., int]:
+    - Sizes of the parts of one side.
+
+2. tileRects(height, width, tile_size, square_free) -> numpy array:
+    - Rectangles (x, y, width, height) of the tiles in row-major order.
+
+3. mapTiles(executor, job, items):
+    - Runs job((tile, key)) for every tile of the frames, yields (frame, record).
+
+Dependencies:
+-------------
+- Numpy for the rectangle and frame arrays
+- frame_executor.py for the workers
+"""
+
+
+from collections import deque
+import numpy as np
+import math
+
+# Smallest tile side, smaller tiles would leave 3D-Cosine without a block matrix
+MIN_TILE_SIZE = 16
+
+
+def splitAxis(length, tile_size, square_free=False):
+    if tile_size < MIN_TILE_SIZE:
+        raise ValueError(f"The tile size must be at least {MIN_TILE_SIZE} pixels, got {tile_size}")
+
+    _parts = max(1, math.ceil(length / tile_size))
+    while True:
+        _base, _extra = divmod(length, _parts)
+        _sizes = [_base + 1] * _extra + [_base] * (_parts - _extra)
+
+        if not square_free or _base < 2 or not any(math.isqrt(_size) ** 2 == _size for _size in _sizes):
+            return _sizes
+
+        _parts += 1
+
+
+# Tiles of a frame of height x width, returns numpy array (tiles, 4) of (x, y, width, height)
+def tileRects(height, width, tile_size, square_free=False):
+    _rows = splitAxis(height, tile_size, square_free)
+    _cols = splitAxis(width, tile_size, square_free)
+
+    _ys = np.cumsum([0] + _rows[:-1])
+    _xs = np.cumsum([0] + _cols[:-1])
+
+    return np.array([(_x, _y, _w, _h) for _y, _h in zip(_ys, _rows) for _x, _w in zip(_xs, _cols)], dtype=np.int64)
+
+
+# Runs job((tile, key)) for every tile of the frames with the executor, 'items' yields (frame, rects, keys, record)
+# with a key per rectangle, the job returns the processed tile in the shape of its rectangle,
+# yields (numpy array of the frame, record) in frame order
+def mapTiles(executor, job, items):
+    _pending = deque()
+
+    def _tiles():
+        for _frame, _rects, _keys, _record in items:
+            _pending.append((np.empty_like(_frame), _rects, _record))
+
+            for (_x, _y, _w, _h), _key in zip(_rects.tolist(), _keys):
+                yield _frame[_y:_y + _h, _x:_x + _w], _key
+
+    _results = executor.map(job, _tiles())
+
+    # the tiles of a frame are requested before their results come back, so the frame is always pending
+    for _tile in _results:
+        _output, _rects, _record = _pending.popleft()
+
+        for _index, (_x, _y, _w, _h) in enumerate(_rects.tolist()):
+            _output[_y:_y + _h, _x:_x + _w] = _tile if _index == 0 else next(_results)
+
+        yield _output, _record